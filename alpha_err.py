@@ -11,6 +11,12 @@ TARGET_PARENT_DIR = r"C:\Users\YourName\Documents\Research\Data"
 # 計算に使用する信頼区間 (%)
 # 例: 95 -> 95%信頼区間 (両側), 90 -> 90%信頼区間
 CONFIDENCE_PERCENT = 95.0
+
+# ブートストラップ区間（パーセンタイル・BCa）の再標本数。0 なら t 分布による区間のみ
+BOOTSTRAP_SAMPLES = 0
+
+# ブートストラップをケースごとに並列計算するプロセス数
+WORKERS = 1
 # ============================================================
 
 def create_thermal_diffusivity_summary():
@@ -19,6 +25,8 @@ def create_thermal_diffusivity_summary():
             target_dir=TARGET_PARENT_DIR,
             summary_type="confidence",
             confidence_percent=CONFIDENCE_PERCENT,
+            bootstrap_samples=BOOTSTRAP_SAMPLES,
+            workers=WORKERS,
         )
     )
     if response.row_count == 0:
@@ -8,6 +8,10 @@ class PathConfig:
     OUTPUT_DIR: str = os.path.join(os.getcwd(), "data", "output")
     TARGET_EXT: str = ".txt"
 
+    # 生データのパース結果キャッシュ（thermal_analysis/parse_cache.py）
+    CACHE_DIR: str = os.path.join(os.getcwd(), "data", "cache")
+    CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+
 @dataclass(frozen=True)
 class ColumnConfig:
     """
@@ -54,6 +58,23 @@ class AnalysisConfig:
     # フィッティングに使用するデータの範囲（例: 0なら全データ、正の値ならその秒数以降など）
     IGNORE_INITIAL_SECONDS: float = 0.0
 
+    # サンプル選別（thermal_analysis/sample_gating.py）で、周波数ステップ（位置または周波数の切り替え）ごとに
+    # 先頭から除外する整定時間 [s]
+    SETTLING_SECONDS: float = 0.0
+
+    # 解析範囲の自動選択（thermal_analysis/auto_range.py）で窓に含める最小点数
+    AUTO_RANGE_MIN_POINTS: int = 5
+
+    # 位相・log 振幅の回帰方法（thermal_analysis/analyzer.py）
+    # "ols": 通常の最小二乗, "wls": theta_sigma・amp_sigma を重みとする重み付き最小二乗
+    FIT_METHOD: str = "ols"
+
+    # 外れ値の自動除外に使うロバスト回帰（"none" / "huber" / "theilsen" / "ransac"）と、
+    # 外れ値判定のしきい値（正規分布の σ 換算。正常な点を外す確率が片方の目的変数あたり
+    # 約 2(1-Φ(threshold)) になるよう、少数点では t 分布の臨界値に換算して判定）
+    ROBUST_METHOD: str = "none"
+    ROBUST_THRESHOLD: float = 3.0
+
 @dataclass(frozen=True)
 class PlotConfig:
     """グラフ描画に関する設定"""
@@ -66,6 +87,9 @@ class PlotConfig:
     COLOR_PHASE: str = "orange"
     COLOR_FIT: str = "red"
 
+    # インタラクティブ画面（thermal_analysis/blit_renderer.py）で連続イベントをまとめる時間 [ms]
+    INTERACTIVE_DEBOUNCE_MS: int = 30
+
 # 設定インスタンスの生成
 paths = PathConfig()
 columns = ColumnConfig()
@@ -82,6 +106,13 @@ class AppConfigClass:
     COL_FREQ_SQRT: str = columns.SQRT_FREQUENCY
     COL_AMP: str = columns.AMPLITUDE
     COL_PHASE: str = columns.PHASE
+    COL_AMP_SIGMA: str = columns.AMPLITUDE_SIGMA
+    COL_PHASE_SIGMA: str = columns.PHASE_SIGMA
+
+    # Fitting
+    FIT_METHOD: str = analysis.FIT_METHOD
+    ROBUST_METHOD: str = analysis.ROBUST_METHOD
+    ROBUST_THRESHOLD: float = analysis.ROBUST_THRESHOLD
     
     # --- Metadata Keys ---
     KEY_X_POS: str = columns.X_POS
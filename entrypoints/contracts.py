@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 
 @dataclass
@@ -7,6 +7,22 @@ class TwaAnalyzerRequest:
     input_path: str
     output_dir: str
     recursive: bool = True
+    # input_data の保存形式: "npz"（既定）または従来の "json"
+    input_data_format: str = "npz"
+    # False の場合はウィンドウを開かずにバッチ処理する（fit_range 指定 or 自動選択）
+    interactive: bool = True
+    # 解析範囲 (sqrt_TW_freq の下限, 上限)。None なら自動選択
+    # （バッチ処理ではこの範囲で解析、インタラクティブ画面では初期の選択範囲）
+    fit_range: Optional[Tuple[float, float]] = None
+    # バッチ処理時のプロセス数（1 以下なら逐次処理）
+    workers: int = 1
+    # インタラクティブ画面に 1 フレームの描画時間を表示する
+    show_frame_time: bool = False
+    # 回帰方法 "ols" / "wls"（theta_sigma・amp_sigma による重み付き）。None なら config の FIT_METHOD
+    fit_method: Optional[str] = None
+    # 外れ値の自動除外 "none" / "huber" / "theilsen" / "ransac"。None なら config の ROBUST_METHOD
+    # （バッチ処理では除外して解析、インタラクティブ画面では除外済みの状態で表示）
+    robust_method: Optional[str] = None
 
 
 @dataclass
@@ -22,6 +38,24 @@ class DiffusivitySummaryRequest:
     target_dir: str
     summary_type: str
     confidence_percent: float = 95.0
+    # summary_type="confidence" で alpha_phase・alpha_amp のブートストラップ区間（パーセンタイル・BCa）を
+    # 併せて出力する場合の再標本数（0 なら t 分布による区間のみ）、乱数シード、ケースを分配するプロセス数
+    bootstrap_samples: int = 0
+    bootstrap_seed: Optional[int] = None
+    workers: int = 1
+    # summary_type="joint" は全ケースの振幅・位相を共通の傾きで一括同時回帰する（追加の設定なし）
+    # summary_type="spatial" の検索条件: 検索点 (x, y) / (x, y, z)、半径 [um]、矩形 ((下限...), (上限...))、最近傍件数
+    query_point: Optional[Tuple[float, ...]] = None
+    query_radius_um: Optional[float] = None
+    query_box: Optional[Tuple[Tuple[float, ...], Tuple[float, ...]]] = None
+    query_k: int = 1
+    # 再訪をまとめる座標の許容差 [um]
+    merge_tolerance_um: float = 1e-3
+    # True の場合、保存済みの位置インデックスを使わず results.json から作り直す
+    rebuild_index: bool = False
+    # True の場合、更新トークンに加えて results.json の一覧・更新時刻・サイズも比べて鮮度を判定する
+    # （save_case を通さずに results.json を変更した場合用。全ケースを走査する）
+    verify_index: bool = False
 
 
 @dataclass
@@ -37,6 +71,8 @@ class PlotterRequest:
     config_path: Optional[str] = None
     include_errorbars: bool = False
     interactive_fit_csv: Optional[str] = None
+    # インタラクティブフィット画面に 1 フレームの描画時間を表示する
+    show_frame_time: bool = False
 
 
 @dataclass
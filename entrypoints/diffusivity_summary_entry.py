@@ -1,11 +1,15 @@
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from scipy import stats
 
+from thermal_analysis import analyzer, bootstrap, fitting
+from thermal_analysis.datamodels import INPUT_DATA_JSON, INPUT_DATA_NPZ, RawData
+from thermal_analysis.spatial_index import POSITION_INDEX_FILENAME, PositionIndex, read_results_stamp, select_rows
+
 from .common_io import apply_tick_aligned_limits, find_json_files, load_json
 from .contracts import DiffusivitySummaryRequest, DiffusivitySummaryResponse
 
@@ -102,52 +106,81 @@ def _build_thickness_summary(target_dir: str) -> DiffusivitySummaryResponse:
     return DiffusivitySummaryResponse([summary_path, fig_path], len(df), warnings)
 
 
-def _build_confidence_summary(target_dir: str, confidence_percent: float) -> DiffusivitySummaryResponse:
+def _build_confidence_summary(
+    target_dir: str,
+    confidence_percent: float,
+    bootstrap_samples: int = 0,
+    bootstrap_seed: Optional[int] = None,
+    workers: int = 1,
+) -> DiffusivitySummaryResponse:
     warnings: List[str] = []
     rows = []
     conf_label = int(confidence_percent)
+    cases = []
+    columns = ["sqrt_TW_freq", "theta"]
+    if bootstrap_samples > 0:
+        columns += ["amp", "theta_sigma", "amp_sigma"]
     for item in os.listdir(target_dir):
         sub_dir = os.path.join(target_dir, item)
-        input_path = os.path.join(sub_dir, "input_data.json")
         results_path = os.path.join(sub_dir, "results.json")
-        if not os.path.isdir(sub_dir) or not os.path.exists(input_path) or not os.path.exists(results_path):
+        has_input = os.path.exists(os.path.join(sub_dir, INPUT_DATA_NPZ)) or os.path.exists(
+            os.path.join(sub_dir, INPUT_DATA_JSON)
+        )
+        if not os.path.isdir(sub_dir) or not has_input or not os.path.exists(results_path):
             continue
         try:
-            input_data = load_json(input_path)
             results_data = load_json(results_path)
             used_indices = results_data.get("used_indices", [])
             thickness_m = float(results_data.get("thickness_um", 0.0)) * 1e-6
             z_position = results_data.get("z_position")
-            df_raw = pd.DataFrame(input_data["dataframe"]["data"], columns=input_data["dataframe"]["columns"])
+            df_raw = RawData.load_input_data(sub_dir, columns=columns).df
             df_used = df_raw.iloc[used_indices]
-            x = df_used["sqrt_TW_freq"].values
-            y = df_used["theta"].values
+            x = df_used["sqrt_TW_freq"].to_numpy(dtype=float)
+            y = df_used["theta"].to_numpy(dtype=float)
             if len(x) < 3:
                 continue
-            slope, _, r_val, _, std_err = stats.linregress(x, y)
-            q = 0.5 + (confidence_percent / 200.0)
-            t_crit = stats.t.ppf(q, len(x) - 2)
-            delta_b = t_crit * std_err
+            cases.append((z_position, thickness_m, x, y, df_used, results_data.get("fit_method", "ols")))
+        except Exception as e:
+            warnings.append(f"{sub_dir}: {e}")
+
+    if cases:
+        # 全ケースを最大点数に揃えて並べ、マスク付きで一括回帰する
+        n_max = max(len(c[2]) for c in cases)
+        x_stack = np.zeros((len(cases), n_max))
+        y_stack = np.zeros((len(cases), 1, n_max))
+        mask = np.zeros((len(cases), n_max), dtype=bool)
+        for i, (_, _, x, y, _, _) in enumerate(cases):
+            x_stack[i, : len(x)] = x
+            y_stack[i, 0, : len(y)] = y
+            mask[i, : len(x)] = True
+        fits = fitting.batch_linear_regression(x_stack, y_stack, mask)
+        q = 0.5 + (confidence_percent / 200.0)
+        t_crit = stats.t.ppf(q, fits.n[:, 0] - 2)
+        boots = _bootstrap_confidence(cases, bootstrap_samples, confidence_percent, bootstrap_seed, workers, warnings)
+
+        for i, (z_position, thickness_m, _, _, _, _) in enumerate(cases):
+            slope = float(fits.slope[i, 0])
+            std_err = float(fits.stderr[i, 0])
+            delta_b = t_crit[i] * std_err
             b_abs = abs(slope)
             b_min = b_abs - delta_b
             b_max = b_abs + delta_b
             alpha = np.pi * (thickness_m / b_abs) ** 2
             alpha_upper = np.pi * (thickness_m / b_min) ** 2 if b_min > 0 else float("inf")
             alpha_lower = np.pi * (thickness_m / b_max) ** 2
-            rows.append(
-                {
-                    "z_position": z_position,
-                    "alpha": alpha,
-                    f"alpha_upper_{conf_label}%": alpha_upper,
-                    f"alpha_lower_{conf_label}%": alpha_lower,
-                    "confidence_percent": confidence_percent,
-                    "slope": slope,
-                    "slope_err": std_err,
-                    "R2": r_val**2,
-                }
-            )
-        except Exception as e:
-            warnings.append(f"{sub_dir}: {e}")
+            row = {
+                "z_position": z_position,
+                "alpha": alpha,
+                f"alpha_upper_{conf_label}%": alpha_upper,
+                f"alpha_lower_{conf_label}%": alpha_lower,
+                "confidence_percent": confidence_percent,
+                "slope": slope,
+                "slope_err": std_err,
+                "R2": float(fits.r2[i, 0]),
+            }
+            if boots is not None:
+                row.update(_bootstrap_columns(boots[i], conf_label))
+            rows.append(row)
 
     if not rows:
         return DiffusivitySummaryResponse([], 0, warnings)
@@ -158,6 +191,208 @@ def _build_confidence_summary(target_dir: str, confidence_percent: float) -> Dif
     return DiffusivitySummaryResponse([output_path], len(df), warnings)
 
 
+def _bootstrap_confidence(
+    cases: list,
+    n_boot: int,
+    confidence_percent: float,
+    seed: Optional[int],
+    workers: int,
+    warnings: List[str],
+) -> Optional[List[bootstrap.AlphaBootstrap]]:
+    """
+    各ケースの解析点から alpha_phase・alpha_amp のブートストラップ区間を求める（n_boot <= 0 なら None）。
+    results.json の fit_method が "wls" のケースは theta_sigma・amp_sigma の重み付きで回帰する。
+    """
+    if n_boot <= 0:
+        return None
+    inputs = []
+    for z_position, thickness_m, x, y, df_used, fit_method in cases:
+        amp = df_used["amp"].to_numpy(dtype=float) if "amp" in df_used.columns else np.full(len(x), np.nan)
+        sigma = None
+        if fit_method == "wls" and {"theta_sigma", "amp_sigma"} <= set(df_used.columns):
+            sigma = np.vstack([
+                df_used["theta_sigma"].to_numpy(dtype=float),
+                fitting.log_sigma(amp, df_used["amp_sigma"].to_numpy(dtype=float)),
+            ])
+        if "amp" not in df_used.columns:
+            warnings.append(f"z={z_position}: amp 列が無いため alpha_amp のブートストラップ区間は NaN です。")
+        inputs.append((x, y, amp, thickness_m * 1e6, sigma))
+    return bootstrap.bootstrap_cases(inputs, n_boot, confidence_percent, seed, workers)
+
+
+def _bootstrap_columns(boot: bootstrap.AlphaBootstrap, conf_label: int) -> Dict[str, float]:
+    """ブートストラップ結果をサマリーの列（alpha_{phase,amp}_{pct,bca}_{lower,upper}_XX%）に展開する。"""
+    row: Dict[str, float] = {}
+    for t, target in enumerate(bootstrap.TARGETS):
+        row[f"alpha_{target}_boot"] = float(boot.alpha[t])
+        row[f"alpha_{target}_pct_lower_{conf_label}%"] = float(boot.percentile_lower[t])
+        row[f"alpha_{target}_pct_upper_{conf_label}%"] = float(boot.percentile_upper[t])
+        row[f"alpha_{target}_bca_lower_{conf_label}%"] = float(boot.bca_lower[t])
+        row[f"alpha_{target}_bca_upper_{conf_label}%"] = float(boot.bca_upper[t])
+    row["bootstrap_samples"] = boot.n_boot
+    return row
+
+
+JOINT_INPUT_COLUMNS = ["sqrt_TW_freq", "theta", "amp", "theta_sigma", "amp_sigma"]
+
+
+def _build_joint_summary(target_dir: str) -> DiffusivitySummaryResponse:
+    """
+    全ケースの解析点（results.json の used_indices）について、位相と log 振幅を共通の傾きで同時回帰する。
+    ケースを最大点数に揃えて並べ、fitting.batch_joint_regression の 1 回の呼び出しで全ケースを解く
+    （theta_sigma・amp_sigma があるケースは重み付き）。
+    """
+    warnings: List[str] = []
+    cases = []
+    for path in sorted(find_json_files(target_dir, "results.json")):
+        case_dir = os.path.dirname(path)
+        if not (os.path.exists(os.path.join(case_dir, INPUT_DATA_NPZ))
+                or os.path.exists(os.path.join(case_dir, INPUT_DATA_JSON))):
+            continue
+        try:
+            res = load_json(path)
+            df = RawData.load_input_data(case_dir, columns=JOINT_INPUT_COLUMNS).df.iloc[res.get("used_indices", [])]
+            if len(df) < 2:
+                continue
+            cases.append((os.path.basename(case_dir), res, df))
+        except Exception as e:
+            warnings.append(f"{path}: {e}")
+    if not cases:
+        return DiffusivitySummaryResponse([], 0, warnings)
+
+    n_max = max(len(df) for _, _, df in cases)
+    x = np.zeros((len(cases), n_max))
+    y_amp_log = np.zeros((len(cases), n_max))
+    phase = np.zeros((len(cases), n_max))
+    sigma = np.full((len(cases), 2, n_max), np.nan)
+    mask = np.zeros((len(cases), n_max), dtype=bool)
+    thickness = np.zeros(len(cases))
+    for i, (_, res, df) in enumerate(cases):
+        n = len(df)
+        xi = df["sqrt_TW_freq"].to_numpy(dtype=float)
+        amp = df["amp"].to_numpy(dtype=float)
+        x[i, :n] = xi
+        with np.errstate(invalid="ignore", divide="ignore"):
+            y_amp_log[i, :n] = np.log(amp * xi)
+        phase[i, :n] = df["theta"].to_numpy(dtype=float)
+        if {"theta_sigma", "amp_sigma"} <= set(df.columns):
+            sigma[i, 0, :n] = df["theta_sigma"].to_numpy(dtype=float)
+            sigma[i, 1, :n] = fitting.log_sigma(amp, df["amp_sigma"].to_numpy(dtype=float))
+        mask[i, :n] = True
+        thickness[i] = float(res.get("thickness_um") or 0.0)
+    joint = fitting.batch_joint_regression(x, y_amp_log, phase, sigma, mask)
+    alpha, alpha_err = analyzer.joint_alphas(joint, thickness)
+
+    rows = []
+    for i, (case_id, res, _) in enumerate(cases):
+        rows.append(
+            {
+                "id": case_id,
+                "x_position": res.get("x_position"),
+                "y_position": res.get("y_position"),
+                "z_position": res.get("z_position"),
+                "alpha_joint": float(alpha[i]),
+                "alpha_joint_err": float(alpha_err[i]),
+                "slope": float(joint.slope[i]),
+                "slope_err": float(joint.stderr[i]),
+                "intercept_amp": float(joint.intercept_amp[i]),
+                "intercept_phase": float(joint.intercept_phase[i]),
+                "chi2_red": float(joint.chi2_red[i]),
+                "n_points": int(joint.n[i]),
+                "alpha_phase": res.get("alpha_phase"),
+                "alpha_amp": res.get("alpha_amp"),
+            }
+        )
+    df_out = pd.DataFrame(rows).sort_values(["z_position", "id"], na_position="last").reset_index(drop=True)
+    output_path = os.path.join(target_dir, "joint_alpha_summary.csv")
+    df_out.to_csv(output_path, index=False)
+    return DiffusivitySummaryResponse([output_path], len(df_out), warnings)
+
+
+def _results_stamps(target_dir: str, paths: List[str]) -> List[list]:
+    """results.json ごとの [target_dir からの相対パス, 更新時刻 (ns), サイズ]（インデックスの鮮度判定用）。"""
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stamps.append([os.path.relpath(path, target_dir), int(st.st_mtime_ns), int(st.st_size)])
+    return stamps
+
+
+def load_position_index(target_dir: str, rebuild: bool = False, verify: bool = False) -> Tuple[PositionIndex, List[str]]:
+    """
+    target_dir 以下の results.json から位置インデックスを作り、target_dir/position_index.npz に保存する。
+    保存済みのインデックスは、作成時の更新トークン（pipeline.save_case が書く target_dir/results_stamp.json）が
+    現在と同じなら results.json を探さずにそのまま使う。save_case でケースを保存した場合は自動で作り直す。
+    save_case を通さずに results.json を変更した場合は、verify=True（results.json の一覧・更新時刻・サイズも
+    比べる。全ケースを走査する）か rebuild=True（常に作り直す）を指定する。
+    """
+    index_path = os.path.join(target_dir, POSITION_INDEX_FILENAME)
+    # 作り直す場合に備えて、走査より前にトークンを読む（走査中の保存は次回の判定で検出される）
+    token = read_results_stamp(target_dir)
+    if not rebuild and os.path.exists(index_path):
+        try:
+            header = PositionIndex.read_header(index_path)
+            fresh = header.get("results_stamp") == token
+            if fresh and verify:
+                json_paths = sorted(find_json_files(target_dir, "results.json"))
+                fresh = header.get("sources") == _results_stamps(target_dir, json_paths)
+            if fresh:
+                return PositionIndex.load(index_path), []
+        except (OSError, ValueError):
+            pass
+
+    json_paths = sorted(find_json_files(target_dir, "results.json"))
+    records: List[Dict] = []
+    ids: List[str] = []
+    paths: List[str] = []
+    warnings: List[str] = []
+    for path in json_paths:
+        try:
+            records.append(load_json(path))
+        except Exception as e:
+            warnings.append(f"{path}: {e}")
+            continue
+        ids.append(os.path.basename(os.path.dirname(path)))
+        paths.append(os.path.relpath(path, target_dir))
+    index = PositionIndex.from_records(records, ids, paths)
+    index.save(index_path, extra_header={"results_stamp": token, "sources": _results_stamps(target_dir, json_paths)})
+    return index, warnings
+
+
+def _build_spatial_summary(request: DiffusivitySummaryRequest) -> DiffusivitySummaryResponse:
+    target_dir = request.target_dir
+    index, warnings = load_position_index(target_dir, rebuild=request.rebuild_index, verify=request.verify_index)
+    output_files = [os.path.join(target_dir, POSITION_INDEX_FILENAME)]
+    skipped = len(index.table) - index.n_indexed
+    if skipped:
+        warnings.append(f"座標が欠損した {skipped} 件は空間検索の対象外です。")
+    if index.n_indexed == 0:
+        return DiffusivitySummaryResponse(output_files, 0, warnings)
+
+    merged = index.merge_visits(request.merge_tolerance_um)
+    merged_path = os.path.join(target_dir, "spatial_summary.csv")
+    merged.to_csv(merged_path, index=False)
+    output_files.append(merged_path)
+    row_count = len(merged)
+
+    if request.query_point is not None or request.query_box is not None:
+        hits = select_rows(
+            index,
+            point=request.query_point,
+            radius_um=request.query_radius_um,
+            box=request.query_box,
+            k=request.query_k,
+        )
+        query_path = os.path.join(target_dir, "spatial_query.csv")
+        hits.to_csv(query_path, index=False)
+        output_files.append(query_path)
+        row_count = len(hits)
+    return DiffusivitySummaryResponse(output_files, row_count, warnings)
+
+
 def run_diffusivity_summary(request: DiffusivitySummaryRequest) -> DiffusivitySummaryResponse:
     summary_type = request.summary_type.lower()
     if summary_type == "position":
@@ -165,6 +400,16 @@ def run_diffusivity_summary(request: DiffusivitySummaryRequest) -> DiffusivitySu
     if summary_type == "thickness":
         return _build_thickness_summary(request.target_dir)
     if summary_type == "confidence":
-        return _build_confidence_summary(request.target_dir, request.confidence_percent)
+        return _build_confidence_summary(
+            request.target_dir,
+            request.confidence_percent,
+            request.bootstrap_samples,
+            request.bootstrap_seed,
+            request.workers,
+        )
+    if summary_type == "spatial":
+        return _build_spatial_summary(request)
+    if summary_type == "joint":
+        return _build_joint_summary(request.target_dir)
     raise ValueError(f"Unknown summary type: {request.summary_type}")
 
@@ -15,10 +15,11 @@ from .common_io import (
     resolve_column_name,
 )
 from .contracts import PlotterRequest, PlotterResponse
+from thermal_analysis.blit_renderer import BlitRenderer
 
 
 class InteractiveFitter:
-    def __init__(self, x, y, xlabel, ylabel, title_prefix, output_dir, output_base_name):
+    def __init__(self, x, y, xlabel, ylabel, title_prefix, output_dir, output_base_name, show_frame_time=False):
         self.x = np.array(x)
         self.y = np.array(y)
         self.output_dir = output_dir
@@ -37,6 +38,8 @@ class InteractiveFitter:
         self.text = self.ax.text(0.5, 1.02, "", transform=self.ax.transAxes, ha="center", va="bottom")
         self.ax.legend(loc="upper right")
         apply_tick_aligned_limits(self.ax, self.x, self.y)
+        self.renderer = BlitRenderer(self.fig, [self.highlight, self.line, self.text], show_frame_time=show_frame_time)
+        self._selected_span = None
 
         self.selector = SpanSelector(
             self.ax,
@@ -50,6 +53,14 @@ class InteractiveFitter:
         self.fig.canvas.mpl_connect("close_event", self.on_close)
 
     def on_select(self, xmin, xmax):
+        # ドラッグ中の連続イベントはまとめて最後の範囲だけフィットする
+        self._selected_span = (xmin, xmax)
+        self.renderer.request(self.update_fit)
+
+    def update_fit(self):
+        if self._selected_span is None:
+            return
+        xmin, xmax = self._selected_span
         idx = np.where((self.x >= xmin) & (self.x <= xmax))[0]
         if len(idx) < 2:
             return
@@ -61,7 +72,6 @@ class InteractiveFitter:
         x_line = np.linspace(np.min(x_fit), np.max(x_fit), 100)
         self.line.set_data(x_line, slope * x_line + intercept)
         self.text.set_text(f"Fit Result: y = {slope:.4f}x + {intercept:.4f}")
-        self.fig.canvas.draw_idle()
 
     def _get_output_path(self):
         base, _ = os.path.splitext(self.output_base_name)
@@ -73,8 +83,10 @@ class InteractiveFitter:
             n += 1
 
     def on_close(self, _):
+        self.renderer.flush(draw=False)
         path = self._get_output_path()
-        self.fig.savefig(path, bbox_inches="tight")
+        with self.renderer.as_static():
+            self.fig.savefig(path, bbox_inches="tight")
         print(f"Saved: {path}")
 
 
@@ -172,7 +184,12 @@ def _plot_with_config(
     return PlotterResponse(output_files, plotted, used_labels, warnings)
 
 
-def _run_interactive_fit(target_dir: str, csv_file: str, config: Optional[Dict]) -> Optional[str]:
+def _run_interactive_fit(
+    target_dir: str,
+    csv_file: str,
+    config: Optional[Dict],
+    show_frame_time: bool = False,
+) -> Optional[str]:
     csv_path = csv_file if os.path.isabs(csv_file) else os.path.join(target_dir, csv_file)
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"CSV not found: {csv_path}")
@@ -184,7 +201,10 @@ def _run_interactive_fit(target_dir: str, csv_file: str, config: Optional[Dict])
     ylabel = resolve_axis_label((config or {}).get("ylabel"), resolved_y, "Y")
     title = os.path.basename(csv_path)
 
-    fitter = InteractiveFitter(x_data.values, y_data.values, xlabel, ylabel, title, target_dir, os.path.basename(csv_path))
+    fitter = InteractiveFitter(
+        x_data.values, y_data.values, xlabel, ylabel, title, target_dir, os.path.basename(csv_path),
+        show_frame_time=show_frame_time,
+    )
     plt.show()
     return "interactive_fit_saved_on_close"
 
@@ -194,7 +214,9 @@ def run_matplotlib_plotter(request: PlotterRequest) -> PlotterResponse:
     config = load_json(config_path) if config_path else {}
 
     if request.interactive_fit_csv:
-        marker = _run_interactive_fit(request.target_dir, request.interactive_fit_csv, config)
+        marker = _run_interactive_fit(
+            request.target_dir, request.interactive_fit_csv, config, request.show_frame_time
+        )
         return PlotterResponse([marker] if marker else [], 1 if marker else 0, [], [])
 
     return _plot_with_config(request.target_dir, config, request.include_errorbars)
@@ -1,33 +1,113 @@
 import glob
 import os
-import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 
 from config import AppConfig
-from thermal_analysis import file_parser, interactive_ui, visualizer
+from thermal_analysis import analyzer, file_parser, pipeline
 
 from .contracts import TwaAnalyzerRequest, TwaAnalyzerResponse
 
 
-def _perform_save(raw_data, analysis_result, output_root_dir: str) -> bool:
+def _perform_save(raw_data, analysis_result, output_root_dir: str, input_data_format: str = "npz") -> bool:
     if analysis_result is None:
         print("  [Skip] 解析結果が無効なため保存をスキップしました。")
         return False
 
-    filename = os.path.basename(raw_data.filepath)
-    case_name = os.path.splitext(filename)[0]
-    case_dir = os.path.join(output_root_dir, case_name)
-    os.makedirs(case_dir, exist_ok=True)
-    print(f"  Saving to: {case_dir}")
-
-    analysis_result.save_to_json(case_dir)
-    raw_data.save_input_data(case_dir)
-    shutil.copy(raw_data.filepath, os.path.join(case_dir, "raw_data.txt"))
-    visualizer.save_phase_plot(raw_data, analysis_result, AppConfig, case_dir)
-    visualizer.save_amplitude_plot(raw_data, analysis_result, AppConfig, case_dir)
+    case_name = os.path.splitext(os.path.basename(raw_data.filepath))[0]
+    print(f"  Saving to: {os.path.join(output_root_dir, case_name)}")
+    pipeline.save_case(raw_data, analysis_result, output_root_dir, AppConfig, input_data_format)
     print("  -> Complete.")
     return True
 
 
+def _collect_files(request: TwaAnalyzerRequest) -> List[str]:
+    target_path = request.input_path
+    if os.path.isfile(target_path):
+        return [target_path]
+    if request.recursive:
+        patterns = [
+            os.path.join(target_path, "**", "*.txt"),
+            os.path.join(target_path, "**", "*.csv"),
+        ]
+    else:
+        patterns = [
+            os.path.join(target_path, "*.txt"),
+            os.path.join(target_path, "*.csv"),
+        ]
+    return sorted(
+        {p for pattern in patterns for p in glob.glob(pattern, recursive=request.recursive)}
+    )
+
+
+def _select_batch_indices(raw_data, fit_range: Optional[Tuple[float, float]]) -> Optional[List[int]]:
+    """
+    バッチ処理で使用する点のインデックスを決める。
+    fit_range 指定時は sqrt_TW_freq がその範囲内の点、未指定時は auto_range で窓を自動選択する。
+    """
+    indices, selection = pipeline.select_fit_indices(raw_data, AppConfig, fit_range)
+    if fit_range is None:
+        if selection is None:
+            print("  [Skip] 条件を満たす解析範囲が見つかりませんでした。")
+            return None
+        print(f"  Auto range: {selection.x_min:.3f} - {selection.x_max:.3f} ({selection.n_points} points)")
+    return indices
+
+
+def _init_batch_worker() -> None:
+    """ワーカープロセスでは GUI を使わないバックエンドで描画する。"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _process_file_batch(
+    filepath: str,
+    output_dir: str,
+    fit_range: Optional[Tuple[float, float]],
+    input_data_format: str,
+    fit_method: Optional[str] = None,
+    robust_method: Optional[str] = None,
+) -> Tuple[bool, Optional[str]]:
+    """
+    1ファイル分のバッチ処理（パース → 解析 → 保存）。
+    戻り値は (保存したか, エラーメッセージ)。プロセスプールから呼ばれるためモジュール直下に置く。
+    """
+    print(f"Processing: {os.path.basename(filepath)}")
+    try:
+        raw_data = file_parser.load_from_text(filepath)
+        indices = _select_batch_indices(raw_data, fit_range)
+        result = (
+            analyzer.run_analysis(raw_data, AppConfig, indices, method=fit_method, robust=robust_method)
+            if indices is not None
+            else None
+        )
+        if result is not None and result.excluded_indices:
+            print(f"  Outliers ({result.robust_method}): {result.excluded_indices}")
+        return _perform_save(raw_data, result, output_dir, input_data_format), None
+    except Exception as e:
+        print(f"[Error] 処理中にエラー: {e}")
+        return False, f"{filepath}: {e}"
+
+
+def _run_batch(files: List[str], request: TwaAnalyzerRequest) -> Tuple[int, int, List[str]]:
+    args = [
+        (f, request.output_dir, request.fit_range, request.input_data_format, request.fit_method, request.robust_method)
+        for f in files
+    ]
+    if request.workers <= 1:
+        # 逐次実行は呼び出し元のプロセスなのでバックエンドは切り替えない（グラフは visualizer が Agg で直接描画する）
+        outcomes = [_process_file_batch(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=request.workers, initializer=_init_batch_worker) as pool:
+            outcomes = list(pool.map(_process_file_batch, *zip(*args)))
+
+    saved = sum(1 for ok, err in outcomes if ok)
+    skipped = sum(1 for ok, err in outcomes if not ok and err is None)
+    errors = [err for _, err in outcomes if err is not None]
+    return saved, skipped, errors
+
+
 def run_twa_analyzer(request: TwaAnalyzerRequest) -> TwaAnalyzerResponse:
     target_path = request.input_path
     target_output_dir = request.output_dir
@@ -38,22 +118,7 @@ def run_twa_analyzer(request: TwaAnalyzerRequest) -> TwaAnalyzerResponse:
     if not os.path.exists(target_path):
         return TwaAnalyzerResponse(0, 0, 0, [f"パスが見つかりません: {target_path}"])
 
-    if os.path.isfile(target_path):
-        files = [target_path]
-    else:
-        if request.recursive:
-            patterns = [
-                os.path.join(target_path, "**", "*.txt"),
-                os.path.join(target_path, "**", "*.csv"),
-            ]
-        else:
-            patterns = [
-                os.path.join(target_path, "*.txt"),
-                os.path.join(target_path, "*.csv"),
-            ]
-        files = sorted(
-            {p for pattern in patterns for p in glob.glob(pattern, recursive=request.recursive)}
-        )
+    files = _collect_files(request)
 
     os.makedirs(target_output_dir, exist_ok=True)
 
@@ -61,12 +126,28 @@ def run_twa_analyzer(request: TwaAnalyzerRequest) -> TwaAnalyzerResponse:
     print(f"{len(files)}個のファイルを処理します。")
     print("-" * 50)
 
+    if not request.interactive:
+        saved_cases, skipped_cases, errors = _run_batch(files, request)
+        return TwaAnalyzerResponse(
+            processed_files=len(files),
+            saved_cases=saved_cases,
+            skipped_cases=skipped_cases,
+            errors=errors,
+        )
+
+    from thermal_analysis import interactive_ui
+
     for i, filepath in enumerate(files):
         print(f"\n[{i + 1}/{len(files)}] Processing: {os.path.basename(filepath)}")
         try:
             raw_data = file_parser.load_from_text(filepath)
-            plotter = interactive_ui.TWAInteractivePlotter(raw_data, AppConfig)
-            if _perform_save(raw_data, plotter.result, target_output_dir):
+            plotter = interactive_ui.TWAInteractivePlotter(
+                raw_data, AppConfig, show_frame_time=request.show_frame_time,
+                fit_method=request.fit_method,
+                robust_method=request.robust_method,
+                fit_range=request.fit_range,
+            )
+            if _perform_save(raw_data, plotter.result, target_output_dir, request.input_data_format):
                 saved_cases += 1
             else:
                 skipped_cases += 1
@@ -81,4 +162,3 @@ def run_twa_analyzer(request: TwaAnalyzerRequest) -> TwaAnalyzerResponse:
         skipped_cases=skipped_cases,
         errors=errors,
     )
-
@@ -1,193 +1,540 @@
 import argparse
-import json
+import csv
+import io
 import os
-from typing import Iterable
+import time
+from typing import Callable, Iterable, Optional
 
 import numpy as np
 import pandas as pd
 
+from thermal_analysis.file_parser import logger_read_options
+from thermal_analysis.position_segments import quantize_positions
+from thermal_analysis.sample_gating import (
+    DEFAULT_IGNORE_INITIAL_SECONDS,
+    DEFAULT_SETTLING_SECONDS,
+    SampleGate,
+    select_rules,
+)
+from thermal_analysis.position_store import (
+    OUTPUT_FORMATS,
+    unique_position_filename,
+    write_gate_report,
+    write_position_csv,
+    write_summary_outputs,
+)
+from thermal_analysis.shared_columns import contiguous_ranges, map_row_ranges
+from thermal_analysis.sweep_summary import (
+    OUTPUT_COLUMNS,
+    SUMMARY_INPUT_COLUMNS,
+    circular_from_mean_vectors,
+    cluster_frequency,
+    extract_metadata,
+    gated_position_codes,
+    load_logger_csv,
+    position_coordinates,
+    summarize_arrays,
+    summarize_positions,
+    summary_arrays,
+    summary_input_columns,
+)
+
+
+DEFAULT_CHUNKSIZE = 200_000
+# 追従モード（follow）で位置ごとの alpha を書き出すファイル名
+LIVE_ALPHA_FILENAME = "live_alpha.csv"
+
+
+def _summarize_range(columns: dict, task: tuple) -> pd.DataFrame:
+    """
+    位置ごとに並べ替えた共有列のうち行範囲 [start, stop) を集約する（並列処理用）。
+    out_csv_path が None でなければ位置別 CSV もワーカー側で書き出す。
+    """
+    start, stop, out_csv_path, x, y, z, tolerance_hz = task
+    summary = summarize_arrays(
+        np.zeros(stop - start, dtype=int),
+        columns["freq"][start:stop],
+        columns["amp"][start:stop],
+        columns["theta"][start:stop],
+        tolerance_hz,
+    )
+    if out_csv_path is not None:
+        write_position_csv(out_csv_path, x, y, z, summary)
+    return summary
+
+
+def run(
+    input_csv: str,
+    output_dir: str,
+    tolerance_hz: float,
+    stream: bool = False,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    workers: int = 1,
+    output_format: str = "csv",
+    position_tolerance_um: Optional[float] = None,
+    gate: Optional[SampleGate] = None,
+) -> None:
+    """
+    位置ごとに周波数スイープを集約して出力する。
+    stream=True の場合は CSV を chunksize 行ずつ読み、位置×周波数クラスタの累積量だけを
+    保持して集約する（メモリ使用量が行数に依存しない）。
+    workers が 2 以上の場合は、数値列を位置順に並べ替えて共有メモリに置き、
+    位置ごとの行範囲を workers 個のプロセスで集約・書き出しする（出力は逐次版と同一）。
+    output_format は "csv"（位置別 CSV, 既定）/ "store"（position_summary.npz）/ "both"。
+    position_tolerance_um を指定すると各軸の差がその範囲内の位置を 1 つにまとめる（stream=True では無視）。
+    gate（thermal_analysis/sample_gating.SampleGate）を指定すると、状態列・経過時間で除外したサンプルを
+    集約に使わず、位置ごとの規則別除外数を gate_report.csv に書き出す。
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if stream:
+        run_streaming(
+            input_csv, output_dir, tolerance_hz, chunksize=chunksize, output_format=output_format, gate=gate
+        )
+        return
 
-OUTPUT_COLUMNS = ["sqrt_TW_freq", "theta", "theta_sigma", "amp", "amp_sigma"]
+    df = load_logger_csv(input_csv, columns=summary_input_columns(gate))
+    base_metadata = extract_metadata(input_csv)
+    if gate is not None:
+        base_metadata["sample_gate"] = gate.settings()
+    required = set(SUMMARY_INPUT_COLUMNS)
+    missing = sorted(required - set(df.columns))
+    if missing:
+        raise ValueError(f"必要な列が不足しています: {missing}")
 
+    os.makedirs(output_dir, exist_ok=True)
+    df, codes, n_positions, gate_counts = gated_position_codes(df, gate, tolerance_um=position_tolerance_um)
+    coords = position_coordinates(df, codes, n_positions)
+    used_filenames: dict[str, int] = {}
+    filenames = [unique_position_filename(*map(float, coords[pid]), used_filenames) for pid in range(n_positions)]
+    if gate_counts is not None:
+        write_gate_report(output_dir, coords, filenames, gate_counts)
+
+    csv_written = False
+    if workers > 1:
+        order, row_bounds = contiguous_ranges(codes, n_positions)
+        freq, amp, theta = summary_arrays(df)
+        columns = {"freq": freq[order], "amp": amp[order], "theta": theta[order]}
+        write_csv = output_format in ("csv", "both")
+        tasks = [
+            (
+                int(row_bounds[pid]),
+                int(row_bounds[pid + 1]),
+                os.path.join(output_dir, filenames[pid]) if write_csv else None,
+                *map(float, coords[pid]),
+                tolerance_hz,
+            )
+            for pid in range(n_positions)
+        ]
+        summaries = map_row_ranges(_summarize_range, columns, tasks, workers=workers)
+        csv_written = write_csv
+    else:
+        table = summarize_positions(df, codes, tolerance_hz)
+        bounds = np.searchsorted(table["position_id"].to_numpy(), np.arange(n_positions + 1))
+        summaries = [table.iloc[bounds[pid] : bounds[pid + 1]] for pid in range(n_positions)]
+
+    write_summary_outputs(
+        output_dir, output_format, coords, filenames, summaries, base_metadata, tolerance_hz, csv_written=csv_written
+    )
 
-def load_logger_csv(path: str) -> pd.DataFrame:
-    last_err = None
-    for enc in ("utf-8-sig", "utf-8", "cp932"):
-        try:
-            return pd.read_csv(path, comment="#", encoding=enc)
-        except UnicodeDecodeError as e:
-            last_err = e
-    if last_err:
-        raise last_err
-    return pd.read_csv(path, comment="#")
+    print(f"完了: {n_positions} 位置を処理しました。")
+    print(f"出力先: {output_dir}")
 
 
-def extract_metadata(path: str) -> dict:
-    metadata: dict = {"meta_map": {}, "meta_items": [], "raw_meta_lines": [], "input_file": os.path.abspath(path)}
-    last_err = None
-    text = None
-    for enc in ("utf-8-sig", "utf-8", "cp932"):
-        try:
-            with open(path, "r", encoding=enc) as f:
-                text = f.read()
-            break
-        except UnicodeDecodeError as e:
-            last_err = e
-    if text is None:
-        if last_err:
-            raise last_err
-        return metadata
-
-    for line in text.splitlines():
-        if not line.startswith("#META,"):
-            continue
-        metadata["raw_meta_lines"].append(line)
-        body = line[len("#META,") :]
-        parts = [p.strip() for p in body.split(",")]
-        if len(parts) == 2:
-            section, value = parts
-            metadata["meta_map"][section] = value
-            metadata["meta_items"].append({"section": section, "value": value})
-        elif len(parts) >= 3:
-            section, key = parts[0], parts[1]
-            value = ",".join(parts[2:])
-            metadata["meta_map"].setdefault(section, {})[key] = value
-            metadata["meta_items"].append({"section": section, "key": key, "value": value})
-    return metadata
-
-
-def _circular_stats(rad_values: np.ndarray) -> tuple[float, float]:
-    valid = np.isfinite(rad_values)
-    vals = rad_values[valid]
-    if vals.size == 0:
-        return np.nan, np.nan
-
-    unit = np.exp(1j * vals)
-    mean_vec = np.mean(unit)
-    mean_angle = float(np.angle(mean_vec))
-    r = float(np.abs(mean_vec))
-    r = min(max(r, 1e-12), 1.0)
-    sigma = float(np.sqrt(-2.0 * np.log(r)))
-    if abs(sigma) < 1e-15:
-        sigma = 0.0
-    elif sigma < 0.0:
-        sigma = 0.0
-    return mean_angle, sigma
-
-
-def _cluster_frequency(values_hz: Iterable[float], tolerance_hz: float) -> np.ndarray:
-    arr = np.asarray(list(values_hz), dtype=float)
-    out = np.full(arr.shape, -1, dtype=int)
-    valid_idx = np.where(np.isfinite(arr))[0]
-    if valid_idx.size == 0:
-        return out
-
-    order = valid_idx[np.argsort(arr[valid_idx])]
-    cluster_id = 0
-    out[order[0]] = cluster_id
-    anchor = arr[order[0]]
-
-    for idx in order[1:]:
-        if abs(arr[idx] - anchor) > tolerance_hz:
-            cluster_id += 1
-            anchor = arr[idx]
-        out[idx] = cluster_id
-    return out
-
-
-def summarize_position(df_pos: pd.DataFrame, tolerance_hz: float) -> pd.DataFrame:
-    df = df_pos.copy()
-    df["freq_cluster"] = _cluster_frequency(df["LI_RefFreq_Hz"].to_numpy(dtype=float), tolerance_hz)
-    df = df[df["freq_cluster"] >= 0]
-    rows: list[dict] = []
-
-    for _, part in df.groupby("freq_cluster", sort=True):
-        freq_mean = float(np.nanmean(part["LI_RefFreq_Hz"]))
-        amp_vals = pd.to_numeric(part["LI_Amp"], errors="coerce").to_numpy(dtype=float)
-        theta_deg = pd.to_numeric(part["LI_Theta_deg"], errors="coerce").to_numpy(dtype=float)
-        theta_rad = np.deg2rad(theta_deg)
-        theta_mean, theta_sigma = _circular_stats(theta_rad)
-
-        rows.append(
+class _PositionAccumulator:
+    """
+    1位置分の周波数クラスタ累積量（ストリーミング・追従集約用）。
+
+    クラスタは最初に現れた周波数をアンカーとし、以降の値は最も近いアンカーとの差が
+    tolerance_hz 以内ならそのクラスタに加える。各クラスタは件数・周波数和・
+    振幅の Welford 統計量（件数・平均・偏差平方和 M2）・位相の単位ベクトル和のみを保持する。
+    チャンク単位の更新は、チャンク内の平均と M2 を既存の値と併合して行う（Chan らの併合式）。
+    周波数ステップ間隔が tolerance_hz の2倍より大きいスイープではバッチ版と同じクラスタになる。
+    """
+
+    def __init__(self, tolerance_hz: float):
+        self.tolerance_hz = tolerance_hz
+        self.xyz_sum = np.zeros(3)
+        self.xyz_n = np.zeros(3)
+        self.anchor = np.empty(0)
+        self.n = np.empty(0)
+        self.freq_sum = np.empty(0)
+        self.amp_n = np.empty(0)
+        self.amp_mean = np.empty(0)
+        self.amp_m2 = np.empty(0)
+        self.theta_n = np.empty(0)
+        self.theta_vec = np.empty(0, dtype=complex)
+        # サンプル選別時の [サンプル数, 採用数, 規則ごとの除外数]
+        self.gate_counts: Optional[np.ndarray] = None
+
+    def _grow(self, new_anchors: np.ndarray) -> None:
+        k = new_anchors.size
+        self.anchor = np.concatenate([self.anchor, new_anchors])
+        for name in ("n", "freq_sum", "amp_n", "amp_mean", "amp_m2", "theta_n"):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(k)]))
+        self.theta_vec = np.concatenate([self.theta_vec, np.zeros(k, dtype=complex)])
+
+    def _assign_clusters(self, freq: np.ndarray) -> np.ndarray:
+        cid = np.full(freq.shape, -1, dtype=int)
+        if self.anchor.size > 0:
+            order = np.argsort(self.anchor)
+            sorted_anchor = self.anchor[order]
+            right = np.clip(np.searchsorted(sorted_anchor, freq), 0, sorted_anchor.size - 1)
+            left = np.clip(right - 1, 0, sorted_anchor.size - 1)
+            use_left = np.abs(freq - sorted_anchor[left]) <= np.abs(freq - sorted_anchor[right])
+            nearest = np.where(use_left, left, right)
+            matched = np.abs(freq - sorted_anchor[nearest]) <= self.tolerance_hz
+            cid[matched] = order[nearest[matched]]
+
+        unmatched = np.where(cid < 0)[0]
+        if unmatched.size > 0:
+            local = cluster_frequency(freq[unmatched], self.tolerance_hz)
+            n_new = int(local.max()) + 1
+            new_anchors = np.full(n_new, np.inf)
+            np.minimum.at(new_anchors, local, freq[unmatched])
+            cid[unmatched] = self.anchor.size + local
+            self._grow(new_anchors)
+        return cid
+
+    def update(self, xyz: np.ndarray, freq: np.ndarray, amp: np.ndarray, theta_rad: np.ndarray) -> None:
+        finite_xyz = np.isfinite(xyz)
+        self.xyz_sum += np.where(finite_xyz, xyz, 0.0).sum(axis=0)
+        self.xyz_n += finite_xyz.sum(axis=0)
+
+        valid = np.isfinite(freq)
+        if not valid.any():
+            return
+        freq, amp, theta_rad = freq[valid], amp[valid], theta_rad[valid]
+        cid = self._assign_clusters(freq)
+        k = self.anchor.size
+        self.n += np.bincount(cid, minlength=k)
+        self.freq_sum += np.bincount(cid, weights=freq, minlength=k)
+
+        amp_ok = np.isfinite(amp)
+        a_cid, a_val = cid[amp_ok], amp[amp_ok]
+        b_n = np.bincount(a_cid, minlength=k).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            b_mean = np.bincount(a_cid, weights=a_val, minlength=k) / b_n
+            d = a_val - b_mean[a_cid]
+            b_m2 = np.bincount(a_cid, weights=d * d, minlength=k)
+            total = self.amp_n + b_n
+            delta = b_mean - self.amp_mean
+            has_b = b_n > 0
+            self.amp_mean = np.where(has_b, self.amp_mean + delta * b_n / total, self.amp_mean)
+            self.amp_m2 = np.where(has_b, self.amp_m2 + b_m2 + delta * delta * self.amp_n * b_n / total, self.amp_m2)
+        self.amp_n = total
+
+        th_ok = np.isfinite(theta_rad)
+        t_cid, t_val = cid[th_ok], theta_rad[th_ok]
+        self.theta_n += np.bincount(t_cid, minlength=k)
+        self.theta_vec += np.bincount(t_cid, weights=np.cos(t_val), minlength=k) + 1j * np.bincount(
+            t_cid, weights=np.sin(t_val), minlength=k
+        )
+
+    def position(self) -> tuple[float, float, float]:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.xyz_sum / self.xyz_n
+        return float(mean[0]), float(mean[1]), float(mean[2])
+
+    def summary(self) -> pd.DataFrame:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            freq_mean = self.freq_sum / self.n
+            theta_mean, theta_sigma = circular_from_mean_vectors(self.theta_vec / self.theta_n)
+            has_amp = self.amp_n > 0
+            amp_mean = np.where(has_amp, self.amp_mean, np.nan)
+            amp_sigma = np.where(has_amp, np.sqrt(np.maximum(self.amp_m2, 0.0) / self.amp_n), np.nan)
+        no_theta = self.theta_n == 0
+        theta_mean[no_theta] = np.nan
+        theta_sigma[no_theta] = np.nan
+        out = pd.DataFrame(
             {
-                "sqrt_TW_freq": float(np.sqrt(max(freq_mean, 0.0))),
+                "sqrt_TW_freq": np.sqrt(np.maximum(freq_mean, 0.0)),
                 "theta": theta_mean,
                 "theta_sigma": theta_sigma,
-                "amp": float(np.nanmean(amp_vals)),
-                "amp_sigma": float(np.nanstd(amp_vals, ddof=0)),
-            }
+                "amp": amp_mean,
+                "amp_sigma": amp_sigma,
+            },
+            columns=OUTPUT_COLUMNS,
         )
-
-    out = pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
-    return out.sort_values("sqrt_TW_freq").reset_index(drop=True)
+        return out.sort_values("sqrt_TW_freq").reset_index(drop=True)
 
 
-def build_position_key(df: pd.DataFrame) -> pd.Series:
-    x = pd.to_numeric(df["Stage_X_um"], errors="coerce").round(6)
-    y = pd.to_numeric(df["Stage_Y_um"], errors="coerce").round(6)
-    z = pd.to_numeric(df["Stage_Z_um"], errors="coerce").round(6)
-    return "x" + x.astype(str) + "_y" + y.astype(str) + "_z" + z.astype(str)
+def _update_accumulators(
+    accumulators: dict, chunk: pd.DataFrame, tolerance_hz: float, gate: Optional[SampleGate] = None
+) -> None:
+    """
+    読み込んだ行（チャンク）を位置ごとの累積量に加える。
+    gate 指定時は除外したサンプルを累積せず、位置ごとの規則別除外数を数える（チャンクはファイル順に渡すこと）。
+    """
+    missing = sorted(set(SUMMARY_INPUT_COLUMNS) - set(chunk.columns))
+    if missing:
+        raise ValueError(f"必要な列が不足しています: {missing}")
+    xyz = chunk[["Stage_X_um", "Stage_Y_um", "Stage_Z_um"]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    q, _ = quantize_positions(xyz)
+    result = gate.apply(chunk) if gate is not None else None
+    if len(chunk) == 0:
+        return
+    rows = np.arange(len(chunk))
+    freq = chunk["LI_RefFreq_Hz"].to_numpy(dtype=float)
+    if result is not None:
+        freq = np.where(result.accepted, freq, np.nan)
+        flags = np.column_stack([np.ones(len(chunk), dtype=bool), result.accepted, *result.rejected.values()])
+    amp = chunk["LI_Amp"].to_numpy(dtype=float)
+    theta = np.deg2rad(chunk["LI_Theta_deg"].to_numpy(dtype=float))
+    # 量子化座標ごとに行をまとめる（チャンク内の出現順）。キーはチャンクをまたいで共通
+    unique_q, first, inverse = np.unique(q[rows], axis=0, return_index=True, return_inverse=True)
+    order, bounds = contiguous_ranges(inverse.reshape(-1), len(unique_q))
+    for u in np.argsort(first, kind="stable"):
+        idx = rows[order[bounds[u] : bounds[u + 1]]]
+        key = tuple(int(v) for v in unique_q[u])
+        acc = accumulators.get(key)
+        if acc is None:
+            acc = accumulators[key] = _PositionAccumulator(tolerance_hz)
+        acc.update(xyz[idx], freq[idx], amp[idx], theta[idx])
+        if result is not None:
+            counts = flags[idx].sum(axis=0)
+            acc.gate_counts = counts if acc.gate_counts is None else acc.gate_counts + counts
+
+
+def _accumulate_stream(
+    input_csv: str, tolerance_hz: float, chunksize: int, encoding: str, gate: Optional[SampleGate] = None
+) -> dict:
+    accumulators: dict[tuple, _PositionAccumulator] = {}
+    if gate is not None:
+        gate.reset()
+    reader = pd.read_csv(
+        input_csv,
+        comment="#",
+        encoding=encoding,
+        chunksize=chunksize,
+        **logger_read_options(summary_input_columns(gate)),
+    )
+    with reader:
+        for chunk in reader:
+            _update_accumulators(accumulators, chunk, tolerance_hz, gate)
+    return accumulators
+
+
+def _accumulator_gate_counts(accumulators: dict, gate: SampleGate) -> pd.DataFrame:
+    """累積量に記録した規則別除外数を GateResult.counts と同じ形式の表にする。"""
+    names = ["n_samples", "n_accepted"] + gate.rule_names
+    rows = [
+        acc.gate_counts if acc.gate_counts is not None else np.zeros(len(names), dtype=int)
+        for acc in accumulators.values()
+    ]
+    return pd.DataFrame(
+        np.array(rows, dtype=int).reshape(-1, len(names)),
+        columns=names,
+        index=pd.RangeIndex(len(rows), name="position_id"),
+    )
 
 
-def _format_axis_value(value: float) -> str:
-    if not np.isfinite(value):
-        return "nan"
-    rounded = round(float(value), 6)
-    mag = abs(rounded)
-    text = f"{mag:.6f}".rstrip("0").rstrip(".")
-    if text == "":
-        text = "0"
-    text = text.replace(".", "p")
-    prefix = "m" if rounded < 0 else ""
-    return prefix + text
+def _accumulator_outputs(accumulators: dict) -> tuple[np.ndarray, list[str], list[pd.DataFrame]]:
+    """累積量から (座標, 位置別ファイル名, 位置ごとの集約表) を作る。"""
+    used_filenames: dict[str, int] = {}
+    coords = np.array([acc.position() for acc in accumulators.values()], dtype=float).reshape(-1, 3)
+    filenames = [unique_position_filename(*map(float, xyz), used_filenames) for xyz in coords]
+    summaries = [acc.summary() for acc in accumulators.values()]
+    return coords, filenames, summaries
+
+
+def run_streaming(
+    input_csv: str,
+    output_dir: str,
+    tolerance_hz: float,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    output_format: str = "csv",
+    gate: Optional[SampleGate] = None,
+) -> None:
+    """
+    run のストリーミング版。CSV を chunksize 行ずつ読み、位置×周波数クラスタごとの
+    累積量（件数・和・二乗和・位相の複素和）だけを保持して、run と同じ形式の
+    位置別 CSV と meta_summary.json を出力する。
+    """
+    base_metadata = extract_metadata(input_csv, header_only=True)
+    if gate is not None:
+        base_metadata["sample_gate"] = gate.settings()
+    accumulators = None
+    last_err = None
+    for enc in ("utf-8-sig", "utf-8", "cp932"):
+        try:
+            accumulators = _accumulate_stream(input_csv, tolerance_hz, chunksize, enc, gate)
+            break
+        except UnicodeDecodeError as e:
+            last_err = e
+    if accumulators is None:
+        raise last_err
 
+    os.makedirs(output_dir, exist_ok=True)
+    coords, filenames, summaries = _accumulator_outputs(accumulators)
+    write_summary_outputs(output_dir, output_format, coords, filenames, summaries, base_metadata, tolerance_hz)
+    if gate is not None:
+        write_gate_report(output_dir, coords, filenames, _accumulator_gate_counts(accumulators, gate))
 
-def build_position_filename(x: float, y: float, z: float) -> str:
-    return f"x{_format_axis_value(x)},y{_format_axis_value(y)},z{_format_axis_value(z)}.csv"
+    print(f"完了: {len(accumulators)} 位置を処理しました。")
+    print(f"出力先: {output_dir}")
 
 
-def run(input_csv: str, output_dir: str, tolerance_hz: float) -> None:
-    df = load_logger_csv(input_csv)
-    base_metadata = extract_metadata(input_csv)
-    required = {"Stage_X_um", "Stage_Y_um", "Stage_Z_um", "LI_Amp", "LI_Theta_deg", "LI_RefFreq_Hz"}
-    missing = sorted(required - set(df.columns))
-    if missing:
-        raise ValueError(f"必要な列が不足しています: {missing}")
+class LogTail:
+    """
+    追記され続けるロガー CSV を前回の読み取り位置（バイトオフセット）から読み進める。
+    read_new() は改行で終わった完全な行だけを DataFrame として返し、
+    書きかけの最終行は次回に持ち越す。先頭の # 行は読み飛ばし、最初の非 # 行を列名とする。
+    """
+
+    def __init__(self, path: str, columns: Optional[Iterable[str]] = SUMMARY_INPUT_COLUMNS):
+        self.path = path
+        self.columns = list(columns) if columns is not None else None
+        self.offset = 0
+        self.rows = 0
+        self.names: Optional[list[str]] = None
+        self.encoding: Optional[str] = None
+
+    def _decode(self, data: bytes) -> str:
+        if self.encoding is None:
+            last_err = None
+            for enc in ("utf-8-sig", "utf-8", "cp932"):
+                try:
+                    text = data.decode(enc)
+                except UnicodeDecodeError as e:
+                    last_err = e
+                    continue
+                # BOM はファイル先頭にしか無いので、以降のチャンクは utf-8 で読む
+                self.encoding = "utf-8" if enc == "utf-8-sig" else enc
+                return text
+            raise last_err
+        return data.decode(self.encoding)
 
+    def read_new(self) -> Optional[pd.DataFrame]:
+        """前回以降に追記された完全な行を読む。新しい行が無ければ None。"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return None
+        if size < self.offset:
+            raise RuntimeError(f"ファイルが切り詰められました（追従を中止します）: {self.path}")
+        if size == self.offset:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            return None
+        self.offset += cut + 1
+        lines = self._decode(data[: cut + 1]).splitlines(keepends=True)
+
+        if self.names is None:
+            i = 0
+            while i < len(lines) and (lines[i].startswith("#") or not lines[i].strip()):
+                i += 1
+            if i == len(lines):
+                return None
+            self.names = [c.strip() for c in next(csv.reader([lines[i]]))]
+            lines = lines[i + 1 :]
+
+        body = "".join(line for line in lines if not line.startswith("#"))
+        if not body.strip():
+            return None
+        read_kwargs = logger_read_options(self.columns, available=self.names) if self.columns is not None else {}
+        chunk = pd.read_csv(io.StringIO(body), header=None, names=self.names, **read_kwargs)
+        self.rows += len(chunk)
+        return chunk
+
+
+def _flush_follow(
+    input_csv: str,
+    output_dir: str,
+    output_format: str,
+    accumulators: dict,
+    tolerance_hz: float,
+    live_alpha: bool,
+    fit_range: Optional[tuple[float, float]],
+    gate: Optional[SampleGate] = None,
+) -> Optional[pd.DataFrame]:
+    """追従中の累積量から集約出力を書き出し、live_alpha=True なら位置ごとの alpha も求めて live_alpha.csv に書く。"""
     os.makedirs(output_dir, exist_ok=True)
-    df = df.copy()
-    df["position_key"] = build_position_key(df)
-    used_filenames: dict[str, int] = {}
-
-    for key, part in df.groupby("position_key", sort=False):
-        x = float(pd.to_numeric(part["Stage_X_um"], errors="coerce").mean())
-        y = float(pd.to_numeric(part["Stage_Y_um"], errors="coerce").mean())
-        z = float(pd.to_numeric(part["Stage_Z_um"], errors="coerce").mean())
-        out_name = build_position_filename(x, y, z)
-        if out_name in used_filenames:
-            used_filenames[out_name] += 1
-            stem, ext = os.path.splitext(out_name)
-            out_name = f"{stem}__{used_filenames[out_name]}{ext}"
-        else:
-            used_filenames[out_name] = 1
-        out_csv_path = os.path.join(output_dir, out_name)
-        summary = summarize_position(part, tolerance_hz=tolerance_hz)
-        with open(out_csv_path, "w", encoding="utf-8", newline="") as f:
-            f.write(f"#META,position,x_pos,{x:.6f}\n")
-            f.write(f"#META,position,y_pos,{y:.6f}\n")
-            f.write(f"#META,position,z_pos,{z:.6f}\n")
-            summary.to_csv(f, index=False, columns=OUTPUT_COLUMNS)
-
-    meta_summary = dict(base_metadata)
-    meta_summary["freq_tolerance_hz"] = float(tolerance_hz)
-    meta_summary["position_count"] = int(df["position_key"].nunique())
-    meta_summary["output_dir"] = os.path.abspath(output_dir)
-    meta_path = os.path.join(output_dir, "meta_summary.json")
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta_summary, f, indent=2, ensure_ascii=False)
-
-    print(f"完了: {df['position_key'].nunique()} 位置を処理しました。")
+    coords, filenames, summaries = _accumulator_outputs(accumulators)
+    base_metadata = extract_metadata(input_csv, header_only=True)
+    if gate is not None:
+        base_metadata["sample_gate"] = gate.settings()
+    write_summary_outputs(output_dir, output_format, coords, filenames, summaries, base_metadata, tolerance_hz)
+    if gate is not None:
+        write_gate_report(output_dir, coords, filenames, _accumulator_gate_counts(accumulators, gate))
+    if not live_alpha:
+        return None
+
+    from thermal_analysis import pipeline
+
+    results = pipeline.analyze_summaries(coords, filenames, summaries, output_dir, fit_range=fit_range)
+    table = pipeline.results_table(coords, results)
+    table.drop(columns="result").to_csv(os.path.join(output_dir, LIVE_ALPHA_FILENAME))
+    return table
+
+
+def follow(
+    input_csv: str,
+    output_dir: str,
+    tolerance_hz: float,
+    poll_interval_s: float = 1.0,
+    flush_interval_s: float = 10.0,
+    idle_timeout_s: Optional[float] = None,
+    output_format: str = "csv",
+    live_alpha: bool = False,
+    fit_range: Optional[tuple[float, float]] = None,
+    on_flush: Optional[Callable[[dict, Optional[pd.DataFrame]], None]] = None,
+    gate: Optional[SampleGate] = None,
+) -> dict:
+    """
+    測定中に追記されるロガー CSV を追従して集約する（tail -f 相当）。
+
+    poll_interval_s ごとに前回のバイトオフセット以降の完全な行だけを読み、位置×周波数クラスタの
+    累積量（振幅は Welford、位相は単位ベクトルの複素和）を更新する。更新があれば flush_interval_s ごとに
+    run と同じ集約出力を書き直し、live_alpha=True なら位置ごとの alpha（auto_range または fit_range）を
+    live_alpha.csv に書き出す。idle_timeout_s の間追記が無いか Ctrl+C で終了し、最後に出力を確定する。
+    on_flush(accumulators, alpha_table) は書き出しのたびに呼ばれる。戻り値は位置ごとの累積量。
+    gate を指定すると run と同様に除外したサンプルを累積せず、gate_report.csv も更新する。
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    tail = LogTail(input_csv, columns=summary_input_columns(gate))
+    if gate is not None:
+        gate.reset()
+    accumulators: dict[tuple, _PositionAccumulator] = {}
+    last_data = last_flush = time.monotonic()
+    dirty = False
+
+    def flush() -> None:
+        table = _flush_follow(
+            input_csv, output_dir, output_format, accumulators, tolerance_hz, live_alpha, fit_range, gate
+        )
+        print(f"[follow] {tail.rows} 行 / {len(accumulators)} 位置を集約しました。")
+        if on_flush is not None:
+            on_flush(accumulators, table)
+
+    try:
+        while True:
+            chunk = tail.read_new()
+            now = time.monotonic()
+            if chunk is not None and len(chunk) > 0:
+                _update_accumulators(accumulators, chunk, tolerance_hz, gate)
+                dirty = True
+                last_data = now
+            if dirty and now - last_flush >= flush_interval_s:
+                flush()
+                dirty = False
+                last_flush = now
+            if idle_timeout_s is not None and now - last_data >= idle_timeout_s:
+                break
+            if chunk is None:
+                time.sleep(poll_interval_s)
+    except KeyboardInterrupt:
+        pass
+
+    if dirty or not os.path.exists(os.path.join(output_dir, "meta_summary.json")):
+        flush()
     print(f"出力先: {output_dir}")
+    return accumulators
 
 
 def parse_args() -> argparse.Namespace:
@@ -206,17 +553,119 @@ def parse_args() -> argparse.Namespace:
         default=3.0,
         help="近接周波数を同一クラスタとして扱う閾値 [Hz]",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="CSV をチャンク単位で読み、累積量のみで集約する（巨大ファイル向け）",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=DEFAULT_CHUNKSIZE,
+        help="--stream 時に1度に読み込む行数",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="位置ごとの集約を並列に行うプロセス数（--stream 時は無視）",
+    )
+    parser.add_argument(
+        "--position-tolerance-um",
+        type=float,
+        default=None,
+        help="各軸の座標差がこの値 [um] 以内の位置を同一位置にまとめる（ステージ読み戻しの揺れ対策、--stream/--follow 時は無視）",
+    )
+    parser.add_argument(
+        "--gate",
+        action="store_true",
+        help="状態列（接続・ロックイン自動調整・FG 出力など）と経過時間でサンプルを選別してから集約する",
+    )
+    parser.add_argument(
+        "--gate-rules",
+        default=None,
+        help="--gate 時に使う状態列の規則名（カンマ区切り、省略時は全規則: "
+        "stage_disconnected, stage_mock, lockin_disconnected, lockin_not_measuring, lockin_auto_adjust, fg_output_off）",
+    )
+    parser.add_argument(
+        "--ignore-initial-seconds",
+        type=float,
+        default=DEFAULT_IGNORE_INITIAL_SECONDS,
+        help="--gate 時、測定開始からこの秒数のサンプルを除外する（既定: config の IGNORE_INITIAL_SECONDS）",
+    )
+    parser.add_argument(
+        "--settle-seconds",
+        type=float,
+        default=DEFAULT_SETTLING_SECONDS,
+        help="--gate 時、周波数ステップごとに先頭からこの秒数のサンプルを除外する（既定: config の SETTLING_SECONDS）",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="測定中に追記される CSV を追従し、追記分だけを読んで集約を定期的に更新する",
+    )
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="--follow 時の追記確認間隔 [s]")
+    parser.add_argument("--flush-interval", type=float, default=10.0, help="--follow 時の出力更新間隔 [s]")
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="--follow 時、この秒数追記が無ければ終了する（省略時は Ctrl+C まで継続）",
+    )
+    parser.add_argument(
+        "--live-alpha",
+        action="store_true",
+        help="--follow 時、出力更新のたびに位置ごとの alpha を live_alpha.csv に書き出す",
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="出力形式: 位置別CSV / 統合ストア position_summary.npz / 両方",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
     in_path = os.path.abspath(args.input_csv)
-    if not os.path.isfile(in_path):
+    if not os.path.isfile(in_path) and not args.follow:
         raise FileNotFoundError(f"入力ファイルが見つかりません: {in_path}")
 
     out_dir = args.output_dir
     if out_dir is None:
         stem = os.path.splitext(os.path.basename(in_path))[0]
         out_dir = os.path.join(os.path.dirname(in_path), f"{stem}_pos_freq_summary")
-    run(in_path, os.path.abspath(out_dir), args.freq_tolerance_hz)
+    gate = None
+    if args.gate:
+        gate = SampleGate(
+            rules=select_rules(args.gate_rules.split(",") if args.gate_rules else None),
+            ignore_initial_s=args.ignore_initial_seconds,
+            settle_s=args.settle_seconds,
+            step_tolerance_hz=args.freq_tolerance_hz,
+        )
+    if args.follow:
+        follow(
+            in_path,
+            os.path.abspath(out_dir),
+            args.freq_tolerance_hz,
+            poll_interval_s=args.poll_interval,
+            flush_interval_s=args.flush_interval,
+            idle_timeout_s=args.idle_timeout,
+            output_format=args.output_format,
+            live_alpha=args.live_alpha,
+            gate=gate,
+        )
+        raise SystemExit(0)
+    run(
+        in_path,
+        os.path.abspath(out_dir),
+        args.freq_tolerance_hz,
+        stream=args.stream,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        output_format=args.output_format,
+        position_tolerance_um=args.position_tolerance_um,
+        gate=gate,
+    )
@@ -4,7 +4,15 @@ import matplotlib.pyplot as plt
 import pandas as pd
 
 from config import AppConfig
-from freq_sweep_summary import build_position_filename, build_position_key, load_logger_csv, run
+from freq_sweep_summary import run
+from thermal_analysis.position_store import build_position_filename
+from thermal_analysis.shared_columns import contiguous_ranges, map_row_ranges
+from thermal_analysis.sweep_summary import (
+    SUMMARY_INPUT_COLUMNS,
+    load_logger_csv,
+    position_codes,
+    position_coordinates,
+)
 
 
 def _resolve_elapsed_seconds(df: pd.DataFrame) -> pd.Series:
@@ -20,71 +28,100 @@ def _resolve_elapsed_seconds(df: pd.DataFrame) -> pd.Series:
     raise ValueError("時間列が見つかりません。Elapsed_s または Sys_Timestamp が必要です。")
 
 
-def _save_time_series_plots(input_csv: str, output_dir: str) -> None:
+def _init_plot_worker() -> None:
+    """ワーカープロセスでは GUI を使わないバックエンドで描画する。"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _plot_position_range(columns: dict, task: tuple) -> str:
+    """位置ごとに並べ替えた共有列のうち行範囲 [start, stop) の時系列グラフ2種を保存する。"""
+    start, stop, pos_name, pos_dir = task
+    os.makedirs(pos_dir, exist_ok=True)
+    t = columns["t"][start:stop]
+    freq = columns["freq"][start:stop]
+    phase_deg = columns["phase_deg"][start:stop]
+    amp = columns["amp"][start:stop]
+
+    # 1) 経過時間 vs (周波数, 位相差)
+    fig1, ax1 = plt.subplots(figsize=(10, 5))
+    ax1.scatter(t, freq, color="tab:blue", s=12, alpha=0.8, label="Frequency [Hz]")
+    ax1.set_xlabel("Elapsed Time [s]")
+    ax1.set_ylabel("Frequency [Hz]", color="tab:blue")
+    ax1.tick_params(axis="y", labelcolor="tab:blue")
+    ax1.grid(True, alpha=0.3)
+
+    ax1b = ax1.twinx()
+    ax1b.scatter(t, phase_deg, color="tab:orange", s=12, alpha=0.8, label="Phase Diff [deg]")
+    ax1b.set_ylabel("Phase Diff [deg]", color="tab:orange")
+    ax1b.tick_params(axis="y", labelcolor="tab:orange")
+    ax1.set_title(f"{pos_name} : Frequency & Phase vs Time")
+    fig1.tight_layout()
+    fig1.savefig(os.path.join(pos_dir, "time_vs_frequency_phase.png"), dpi=150)
+    plt.close(fig1)
+
+    # 2) 経過時間 vs (周波数, 振幅)
+    fig2, ax2 = plt.subplots(figsize=(10, 5))
+    ax2.scatter(t, freq, color="tab:blue", s=12, alpha=0.8, label="Frequency [Hz]")
+    ax2.set_xlabel("Elapsed Time [s]")
+    ax2.set_ylabel("Frequency [Hz]", color="tab:blue")
+    ax2.tick_params(axis="y", labelcolor="tab:blue")
+    ax2.grid(True, alpha=0.3)
+
+    ax2b = ax2.twinx()
+    ax2b.scatter(t, amp, color="tab:green", s=12, alpha=0.8, label="Amplitude")
+    ax2b.set_ylabel("Amplitude", color="tab:green")
+    ax2b.tick_params(axis="y", labelcolor="tab:green")
+    ax2.set_title(f"{pos_name} : Frequency & Amplitude vs Time")
+    fig2.tight_layout()
+    fig2.savefig(os.path.join(pos_dir, "time_vs_frequency_amplitude.png"), dpi=150)
+    plt.close(fig2)
+    return pos_dir
+
+
+def _save_time_series_plots(input_csv: str, output_dir: str, workers: int = 1) -> None:
     """
     各位置の時系列データについて、以下2種類を保存する。
     - 周波数 + 位相差 vs 経過時間
     - 周波数 + 振幅   vs 経過時間
+    workers が 2 以上の場合は、数値列を共有メモリに置いて位置ごとに並列描画する。
     """
-    df = load_logger_csv(input_csv).copy()
-    required = {"Stage_X_um", "Stage_Y_um", "Stage_Z_um", "LI_RefFreq_Hz", "LI_Theta_deg", "LI_Amp"}
+    df = load_logger_csv(input_csv, columns=SUMMARY_INPUT_COLUMNS + ["Elapsed_s", "Sys_Timestamp"]).copy()
+    required = set(SUMMARY_INPUT_COLUMNS)
     missing = sorted(required - set(df.columns))
     if missing:
         raise ValueError(f"時系列グラフに必要な列が不足しています: {missing}")
 
     elapsed = _resolve_elapsed_seconds(df)
     df["elapsed_s_plot"] = elapsed
-    df["position_key"] = build_position_key(df)
+    df, codes, n_positions = position_codes(df)
+    coords = position_coordinates(df, codes, n_positions)
 
     plot_root = os.path.join(output_dir, "time_series_plots")
     os.makedirs(plot_root, exist_ok=True)
 
-    for _, part in df.groupby("position_key", sort=False):
-        x = float(pd.to_numeric(part["Stage_X_um"], errors="coerce").mean())
-        y = float(pd.to_numeric(part["Stage_Y_um"], errors="coerce").mean())
-        z = float(pd.to_numeric(part["Stage_Z_um"], errors="coerce").mean())
-        pos_name = os.path.splitext(build_position_filename(x, y, z))[0]
-        pos_dir = os.path.join(plot_root, pos_name)
-        os.makedirs(pos_dir, exist_ok=True)
-
-        t = pd.to_numeric(part["elapsed_s_plot"], errors="coerce")
-        freq = pd.to_numeric(part["LI_RefFreq_Hz"], errors="coerce")
-        phase_deg = pd.to_numeric(part["LI_Theta_deg"], errors="coerce")
-        amp = pd.to_numeric(part["LI_Amp"], errors="coerce")
-
-        # 1) 経過時間 vs (周波数, 位相差)
-        fig1, ax1 = plt.subplots(figsize=(10, 5))
-        ax1.scatter(t, freq, color="tab:blue", s=12, alpha=0.8, label="Frequency [Hz]")
-        ax1.set_xlabel("Elapsed Time [s]")
-        ax1.set_ylabel("Frequency [Hz]", color="tab:blue")
-        ax1.tick_params(axis="y", labelcolor="tab:blue")
-        ax1.grid(True, alpha=0.3)
-
-        ax1b = ax1.twinx()
-        ax1b.scatter(t, phase_deg, color="tab:orange", s=12, alpha=0.8, label="Phase Diff [deg]")
-        ax1b.set_ylabel("Phase Diff [deg]", color="tab:orange")
-        ax1b.tick_params(axis="y", labelcolor="tab:orange")
-        ax1.set_title(f"{pos_name} : Frequency & Phase vs Time")
-        fig1.tight_layout()
-        fig1.savefig(os.path.join(pos_dir, "time_vs_frequency_phase.png"), dpi=150)
-        plt.close(fig1)
-
-        # 2) 経過時間 vs (周波数, 振幅)
-        fig2, ax2 = plt.subplots(figsize=(10, 5))
-        ax2.scatter(t, freq, color="tab:blue", s=12, alpha=0.8, label="Frequency [Hz]")
-        ax2.set_xlabel("Elapsed Time [s]")
-        ax2.set_ylabel("Frequency [Hz]", color="tab:blue")
-        ax2.tick_params(axis="y", labelcolor="tab:blue")
-        ax2.grid(True, alpha=0.3)
-
-        ax2b = ax2.twinx()
-        ax2b.scatter(t, amp, color="tab:green", s=12, alpha=0.8, label="Amplitude")
-        ax2b.set_ylabel("Amplitude", color="tab:green")
-        ax2b.tick_params(axis="y", labelcolor="tab:green")
-        ax2.set_title(f"{pos_name} : Frequency & Amplitude vs Time")
-        fig2.tight_layout()
-        fig2.savefig(os.path.join(pos_dir, "time_vs_frequency_amplitude.png"), dpi=150)
-        plt.close(fig2)
+    order, bounds = contiguous_ranges(codes, n_positions)
+    columns = {
+        name: pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)[order]
+        for name, col in (
+            ("t", "elapsed_s_plot"),
+            ("freq", "LI_RefFreq_Hz"),
+            ("phase_deg", "LI_Theta_deg"),
+            ("amp", "LI_Amp"),
+        )
+    }
+    tasks = []
+    for pid in range(n_positions):
+        pos_name = os.path.splitext(build_position_filename(*map(float, coords[pid])))[0]
+        tasks.append((int(bounds[pid]), int(bounds[pid + 1]), pos_name, os.path.join(plot_root, pos_name)))
+    map_row_ranges(
+        _plot_position_range,
+        columns,
+        tasks,
+        workers=workers,
+        initializer=_init_plot_worker,
+    )
 
     print(f"時系列グラフを保存しました: {plot_root}")
 
@@ -115,14 +152,19 @@ def main() -> None:
     tol_input = input("Freq Tolerance Hz (Default: 3.0) > ").strip()
     freq_tolerance_hz = float(tol_input) if tol_input else 3.0
 
+    workers_input = input("Workers (Default: 1) > ").strip()
+    workers = int(workers_input) if workers_input else 1
+
     run(
         input_csv=input_csv,
         output_dir=os.path.abspath(output_dir),
         tolerance_hz=freq_tolerance_hz,
+        workers=workers,
     )
     _save_time_series_plots(
         input_csv=input_csv,
         output_dir=os.path.abspath(output_dir),
+        workers=workers,
     )
 
 
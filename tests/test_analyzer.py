@@ -0,0 +1,60 @@
+"""
+analyzer.run_analysis とインタラクティブ画面のプレビュー（fitting.RunningLinearStats）の一致の確認
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import AppConfig
+from thermal_analysis import analyzer, fitting
+from thermal_analysis.datamodels import RawData
+
+THICKNESS_UM = 50.0
+
+
+def _raw_data(with_sigma: bool = False) -> RawData:
+    rng = np.random.default_rng(3)
+    x = np.linspace(10.0, 20.0, 10)
+    phase = -0.08 * x + rng.normal(0.0, 0.01, x.size)
+    amp = np.exp(-0.08 * x + rng.normal(0.0, 0.01, x.size)) / x
+    amp[4] = 0.0  # log 振幅が -inf になる点
+    df = pd.DataFrame({AppConfig.COL_FREQ_SQRT: x, AppConfig.COL_AMP: amp, AppConfig.COL_PHASE: phase})
+    if with_sigma:
+        df["theta_sigma"] = 0.01
+        df["amp_sigma"] = 0.01 * amp
+    return RawData(df=df, metadata={"試料厚": THICKNESS_UM}, filepath="synthetic")
+
+
+def _preview(raw: RawData):
+    x = raw.df[AppConfig.COL_FREQ_SQRT].to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y_amp_log = np.log(raw.df[AppConfig.COL_AMP].to_numpy() * x)
+    stats = fitting.RunningLinearStats(x, np.vstack([raw.df[AppConfig.COL_PHASE].to_numpy(), y_amp_log]))
+    stats.reset(np.ones(x.size, dtype=bool))
+    return analyzer.alphas_from_fits(stats.fit(0), stats.fit(1), THICKNESS_UM)
+
+
+def test_confirmed_result_matches_preview_with_nonpositive_amplitude():
+    raw = _raw_data()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = analyzer.run_analysis(raw, AppConfig, method="ols", robust="none")
+    alpha_phase, alpha_amp, alpha_ratio = _preview(raw)
+    assert np.isfinite(result.alpha_amp)
+    assert result.alpha_phase == pytest.approx(alpha_phase)
+    assert result.alpha_amp == pytest.approx(alpha_amp)
+    assert result.alpha_ratio == pytest.approx(alpha_ratio)
+
+
+def test_weighted_fit_skips_nonpositive_amplitude_for_amplitude_only():
+    raw = _raw_data(with_sigma=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = analyzer.run_analysis(raw, AppConfig, method="wls", robust="none")
+    assert result.fit_method == "wls"
+    assert np.isfinite(result.alpha_amp) and np.isfinite(result.alpha_phase)
+
+
+def test_running_stats_invalid_fit_is_nan():
+    stats = fitting.RunningLinearStats(np.array([1.0, 1.0, 2.0]), np.array([[0.0, 1.0, 2.0]]))
+    stats.reset(np.array([True, True, False]))
+    fit = stats.fit(0)
+    assert not fit.is_valid and np.isnan(fit.slope)
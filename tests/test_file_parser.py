@@ -0,0 +1,33 @@
+"""
+file_parser の位相アンラップ（位置ごとのリセット）の確認
+"""
+import numpy as np
+import pandas as pd
+
+from thermal_analysis import file_parser
+
+
+def test_nan_phase_stays_local_within_segments():
+    phase = np.array([0.1, 0.2, np.nan, 0.3, 0.4, 0.5, 0.6])
+    out = file_parser.unwrap_phase_segments(phase, starts=np.array([0, 4]))
+    expected = phase.copy()
+    assert np.isnan(out[2])
+    np.testing.assert_allclose(np.delete(out, 2), np.delete(expected, 2))
+
+
+def test_jump_across_nan_is_corrected_and_reset_at_next_segment():
+    # 1 つ目の位置では NaN をまたいで pi の飛び、2 つ目の位置の先頭で補正がリセットされる
+    phase = np.array([0.1, np.nan, 0.1 + np.pi, 0.2 + np.pi, 1.0, 1.1])
+    out = file_parser.unwrap_phase_segments(phase, starts=np.array([0, 4]))
+    np.testing.assert_allclose(out[[0, 2, 3, 4, 5]], [0.1, 0.1, 0.2, 1.0, 1.1])
+    assert np.isnan(out[1])
+
+
+def test_adjust_phase_continuity_with_missing_theta():
+    df = pd.DataFrame({
+        "Stage_X_um": [0.0, 0.0, 0.0, 10.0, 10.0, 10.0],
+        "theta": [0.1, np.nan, 0.1 - np.pi, 2.0, 2.1 + np.pi, 2.2 + np.pi],
+    })
+    out = file_parser.adjust_phase_continuity(df.copy(), "theta")["theta"].to_numpy()
+    assert np.isnan(out[1])
+    np.testing.assert_allclose(out[[0, 2, 3, 4, 5]], [0.1, 0.1, 2.0, 2.1, 2.2])
@@ -0,0 +1,95 @@
+"""
+freq_sweep_summary の追従モード（follow / LogTail）の確認
+
+別プロセスの書き込み側がロガー CSV を行の途中で切れる大きさずつ追記し、
+追従側の集約結果が書き込み完了後のファイルをバッチ（run）で集約した結果と一致することを確かめる。
+"""
+import glob
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import freq_sweep_summary
+
+SOURCE_CSV = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data_raw", "z_freq_sweep_test0422_20260422_210553", "data_1.csv",
+)
+# 行の途中で切れる追記単位 [byte]
+PIECE_BYTES = 7919
+
+WRITER = """
+import sys, time
+src, dst, piece = sys.argv[1], sys.argv[2], int(sys.argv[3])
+with open(src, "rb") as f:
+    data = f.read()
+with open(dst, "ab") as out:
+    for start in range(0, len(data), piece):
+        out.write(data[start:start + piece])
+        out.flush()
+        time.sleep(0.002)
+"""
+
+
+def _position_tables(output_dir: str) -> dict:
+    tables = {}
+    for path in glob.glob(os.path.join(output_dir, "*.csv")):
+        name = os.path.basename(path)
+        if name in ("gate_report.csv", freq_sweep_summary.LIVE_ALPHA_FILENAME):
+            continue
+        tables[name] = pd.read_csv(path, comment="#")
+    return tables
+
+
+def test_follow_matches_batch_with_writer_process(tmp_path):
+    log_path = str(tmp_path / "data_1.csv")
+    writer = subprocess.Popen([sys.executable, "-c", WRITER, SOURCE_CSV, log_path, str(PIECE_BYTES)])
+    try:
+        freq_sweep_summary.follow(
+            log_path, str(tmp_path / "follow"), 3.0,
+            poll_interval_s=0.01, flush_interval_s=3600.0, idle_timeout_s=2.0,
+        )
+    finally:
+        assert writer.wait(timeout=60) == 0
+    freq_sweep_summary.run(log_path, str(tmp_path / "batch"), 3.0)
+
+    followed = _position_tables(str(tmp_path / "follow"))
+    batch = _position_tables(str(tmp_path / "batch"))
+    assert len(batch) == 21
+    assert sorted(followed) == sorted(batch)
+    for name, table in batch.items():
+        assert list(followed[name].columns) == list(table.columns)
+        np.testing.assert_allclose(followed[name].to_numpy(), table.to_numpy(), rtol=1e-9, atol=1e-12)
+
+
+def test_log_tail_holds_back_partial_line(tmp_path):
+    path = tmp_path / "log.csv"
+    path.write_bytes(b"#META,format,column,description\nLI_RefFreq_Hz,LI_Amp\n1.0,2.0\n3.0,4")
+    tail = freq_sweep_summary.LogTail(str(path), columns=None)
+    chunk = tail.read_new()
+    assert chunk.to_numpy().tolist() == [[1.0, 2.0]]
+    assert tail.read_new() is None
+    with open(path, "ab") as f:
+        f.write(b".5\n")
+    assert tail.read_new().to_numpy().tolist() == [[3.0, 4.5]]
+    assert tail.rows == 2
+
+
+def test_follow_stops_when_log_is_truncated(tmp_path):
+    log_path = tmp_path / "data_1.csv"
+    with open(SOURCE_CSV, "rb") as f:
+        log_path.write_bytes(f.read(200_000))
+
+    def truncate(accumulators, table):
+        with open(log_path, "r+b") as f:
+            f.truncate(1000)
+
+    with pytest.raises(RuntimeError, match="切り詰め"):
+        freq_sweep_summary.follow(
+            str(log_path), str(tmp_path / "follow"), 3.0,
+            poll_interval_s=0.01, flush_interval_s=0.0, idle_timeout_s=5.0, on_flush=truncate,
+        )
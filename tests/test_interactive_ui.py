@@ -0,0 +1,63 @@
+"""
+interactive_ui.TWAInteractivePlotter の自動除外がバッチ処理と一致することの確認（Agg で画面を開かずに実行）
+"""
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+from config import AppConfig  # noqa: E402
+from thermal_analysis import analyzer, interactive_ui, pipeline  # noqa: E402
+from thermal_analysis.datamodels import RawData  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _close_figures():
+    yield
+    plt.close("all")
+
+
+def _raw_data() -> RawData:
+    # 低周波側（x < 8）は直線から曲がり、直線部分の x = 14 に外れ値が 1 点ある
+    rng = np.random.default_rng(11)
+    x = np.arange(4.0, 21.0)
+    bend = 0.4 * np.clip(8.0 - x, 0.0, None) ** 1.5
+    phase = -0.1 * x + bend + rng.normal(0.0, 0.005, x.size)
+    log_amp = -0.1 * x + bend + rng.normal(0.0, 0.005, x.size)
+    phase[x == 14.0] += 0.3
+    df = pd.DataFrame({
+        AppConfig.COL_FREQ_SQRT: x,
+        AppConfig.COL_PHASE: phase,
+        AppConfig.COL_AMP: np.exp(log_amp) / x,
+    })
+    return RawData(df=df, metadata={"試料厚": 50.0}, filepath="synthetic.csv")
+
+
+@pytest.mark.parametrize("method", ["huber", "theilsen", "ransac"])
+def test_initial_exclusion_matches_batch(method):
+    raw = _raw_data()
+    fit_range = (8.0, 20.0)
+    indices, _ = pipeline.select_fit_indices(raw, AppConfig, fit_range)
+    batch = analyzer.run_analysis(raw, AppConfig, indices, robust=method)
+    plotter = interactive_ui.TWAInteractivePlotter(raw, AppConfig, robust_method=method, fit_range=fit_range)
+    assert plotter.result.excluded_indices == batch.excluded_indices == [10]
+    assert plotter.result.used_indices == batch.used_indices
+
+
+def test_exclusion_follows_range_and_keeps_clicks():
+    raw = _raw_data()
+    plotter = interactive_ui.TWAInteractivePlotter(raw, AppConfig, robust_method="ransac", fit_range=(8.0, 20.0))
+    # 外れ値を含まない範囲に選び直すと自動除外は無くなる
+    plotter.on_range_select(15.0, 20.0)
+    plotter.renderer.flush(draw=False)
+    assert plotter.finalize_result().excluded_indices == []
+    # クリックで除外した点は範囲を選び直しても除外のまま
+    plotter.user_set[12] = True
+    plotter.user_keep[12] = False
+    plotter.on_range_select(8.0, 20.0)
+    plotter.renderer.flush(draw=False)
+    assert plotter.finalize_result().excluded_indices == [10, 12]
@@ -0,0 +1,71 @@
+"""
+diffusivity_summary_entry.load_position_index の保存済みインデックスの鮮度判定の確認
+"""
+import json
+import os
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+from config import AppConfig  # noqa: E402
+from entrypoints import diffusivity_summary_entry as entry  # noqa: E402
+from thermal_analysis import analyzer, pipeline  # noqa: E402
+from thermal_analysis.datamodels import RawData  # noqa: E402
+
+
+def _save_case(output_dir: str, name: str, x_um: float) -> None:
+    x = np.linspace(10.0, 20.0, 8)
+    df = pd.DataFrame({
+        AppConfig.COL_FREQ_SQRT: x,
+        AppConfig.COL_PHASE: -0.1 * x,
+        AppConfig.COL_AMP: np.exp(-0.1 * x) / x,
+    })
+    metadata = {"試料厚": 50.0, AppConfig.KEY_X_POS: x_um, AppConfig.KEY_Y_POS: 0.0, AppConfig.KEY_Z_POS: 0.0}
+    raw = RawData(df=df, metadata=metadata, filepath=os.path.join(output_dir, f"{name}.csv"))
+    pipeline.save_case(raw, analyzer.run_analysis(raw, AppConfig), output_dir, AppConfig)
+
+
+def _no_walk(*args, **kwargs):
+    raise AssertionError("results.json を走査しました")
+
+
+def test_saved_index_is_reused_without_walking(tmp_path, monkeypatch):
+    out = str(tmp_path)
+    _save_case(out, "a", 0.0)
+    index, _ = entry.load_position_index(out)
+    assert len(index.table) == 1
+
+    monkeypatch.setattr(entry, "find_json_files", _no_walk)
+    index, _ = entry.load_position_index(out)
+    assert len(index.table) == 1
+
+
+def test_index_rebuilds_after_save_case(tmp_path):
+    out = str(tmp_path)
+    _save_case(out, "a", 0.0)
+    entry.load_position_index(out)
+    _save_case(out, "b", 10.0)
+    index, _ = entry.load_position_index(out)
+    assert sorted(index.table["id"]) == ["a", "b"]
+
+
+def test_external_edit_needs_verify(tmp_path):
+    out = str(tmp_path)
+    _save_case(out, "a", 0.0)
+    entry.load_position_index(out)
+    path = os.path.join(out, "a", "results.json")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["x_position"] = 123.0
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+
+    index, _ = entry.load_position_index(out)
+    assert index.table["x_position"].tolist() == [0.0]
+    index, _ = entry.load_position_index(out, verify=True)
+    assert index.table["x_position"].tolist() == [pytest.approx(123.0)]
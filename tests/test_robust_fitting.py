@@ -0,0 +1,44 @@
+"""
+fitting.robust_inlier_mask の誤除外率の確認
+
+外れ値の無い正規ノイズの直線（位相・log 振幅の 2 目的変数、解析窓として典型的な 5〜10 点）で、
+正常な点を外れ値と判定する割合が threshold=3 の名目（約 0.27%）に近いことを確かめる。
+"""
+import numpy as np
+import pytest
+
+from thermal_analysis import fitting
+
+N_TRIALS = 300
+# 名目 0.27% に対し、少数点での尺度推定のばらつきを見込んだ上限
+MAX_FALSE_REJECTION = 0.015
+
+
+def _clean_lines(rng: np.random.Generator, n: int):
+    x = np.sort(rng.uniform(10.0, 20.0, n))
+    y = np.vstack([
+        -0.1 * x + rng.normal(0.0, 0.02, n),
+        -0.1 * x + 1.0 + rng.normal(0.0, 0.02, n),
+    ])
+    return x, y
+
+
+@pytest.mark.parametrize("method", list(fitting.ROBUST_REGRESSIONS))
+@pytest.mark.parametrize("n", [5, 6, 8, 10])
+def test_clean_data_false_rejection_near_nominal(method, n):
+    rng = np.random.default_rng(12345 + n)
+    dropped = 0
+    for _ in range(N_TRIALS):
+        x, y = _clean_lines(rng, n)
+        dropped += int((~fitting.robust_inlier_mask(x, y, method, threshold=3.0)).sum())
+    assert dropped / (N_TRIALS * n) <= MAX_FALSE_REJECTION
+
+
+@pytest.mark.parametrize("method", list(fitting.ROBUST_REGRESSIONS))
+def test_gross_outlier_is_excluded(method):
+    rng = np.random.default_rng(7)
+    x, y = _clean_lines(rng, 8)
+    y[1, 3] += 0.5  # 残差の標準偏差の 25 倍
+    keep = fitting.robust_inlier_mask(x, y, method, threshold=3.0)
+    assert not keep[3]
+    assert keep.sum() == 7
@@ -0,0 +1,22 @@
+"""
+thermal_analysis.sweep_summary（位置別周波数スイープ集約の本体）の確認
+"""
+import subprocess
+import sys
+
+import numpy as np
+
+
+def test_pipeline_does_not_import_summary_script():
+    code = "import sys, thermal_analysis.pipeline; print('freq_sweep_summary' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_cluster_frequencies_per_segment():
+    from thermal_analysis import sweep_summary
+
+    segment = np.array([0, 0, 0, 1, 1])
+    freq = np.array([10.0, 11.0, 20.0, 10.5, np.nan])
+    ids = sweep_summary.cluster_frequencies(segment, freq, tolerance_hz=3.0)
+    assert ids.tolist() == [0, 0, 1, 2, -1]
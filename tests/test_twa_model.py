@@ -0,0 +1,50 @@
+"""
+twa_model.fit_twa_model の有効点の扱いの確認
+"""
+import numpy as np
+
+from thermal_analysis import twa_model
+
+THICKNESS_UM = 100.0
+ALPHA = 1e-7
+
+
+def _sweep(n: int = 12):
+    sqrt_f = np.sqrt(np.linspace(5.0, 50.0, n))
+    log_amp, phase = twa_model.model(sqrt_f, ALPHA, 0.0, 0.1, THICKNESS_UM)
+    return sqrt_f, np.exp(log_amp), phase
+
+
+def test_invalid_sigma_is_filled_not_dropped():
+    sqrt_f, amp, phase = _sweep()
+    sigma = np.full((2, sqrt_f.size), 0.01)
+    sigma[0, 3] = 0.0
+    sigma[1, 5] = np.nan
+    result = twa_model.fit_twa_model(sqrt_f, amp, phase, THICKNESS_UM, sigma)
+    assert result.n_points == sqrt_f.size
+    assert result.success
+    assert np.isclose(result.alpha, ALPHA, rtol=1e-6)
+
+
+def test_no_usable_points_returns_invalid_result():
+    for sqrt_f, amp, phase in [
+        (np.array([]), np.array([]), np.array([])),
+        (np.full(5, np.nan), np.full(5, np.nan), np.full(5, np.nan)),
+    ]:
+        for sigma in (None, np.full((2, sqrt_f.size), 0.01)):
+            result = twa_model.fit_twa_model(sqrt_f, amp, phase, THICKNESS_UM, sigma)
+            assert result.n_points == 0
+            assert not result.success
+            assert np.isnan(result.alpha)
+
+
+def test_batch_continues_past_empty_case():
+    sqrt_f, amp, phase = _sweep()
+    sigma = np.full((2, sqrt_f.size), 0.01)
+    nan = np.full(4, np.nan)
+    results = twa_model.fit_twa_model_batch([
+        (sqrt_f, amp, phase, THICKNESS_UM, sigma),
+        (nan, nan, nan, THICKNESS_UM, np.full((2, 4), 0.01)),
+        (sqrt_f, amp, phase, THICKNESS_UM, sigma),
+    ])
+    assert [r.success for r in results] == [True, False, True]
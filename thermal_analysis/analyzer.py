@@ -1,15 +1,134 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import numpy as np
 from .datamodels import RawData, AnalysisResult
-from . import fitting, physics
+from . import fitting, physics, twa_model
 
-def run_analysis(raw_data: RawData, config, used_indices: Optional[List[int]] = None) -> AnalysisResult:
+# run_analysis の回帰方法と、外れ値の自動除外に使うロバスト回帰（"none" は除外しない）
+FIT_METHODS = ("ols", "wls")
+ROBUST_METHODS = ("none",) + tuple(fitting.ROBUST_REGRESSIONS)
+
+def _usable(fit: fitting.FitResult) -> bool:
+    """alpha を計算できる回帰結果か（有効かつ傾きが有限で 0 でない）。"""
+    return bool(fit.is_valid and np.isfinite(fit.slope) and fit.slope != 0)
+
+
+def alphas_from_fits(fit_phase: fitting.FitResult, fit_amp: fitting.FitResult, thickness: float) -> Tuple[float, float, float]:
+    """位相・振幅の回帰結果から (alpha_phase, alpha_amp, alpha_ratio) を計算する。無効な回帰の alpha は NaN。"""
+    alpha_phase = physics.calculate_alpha_from_slope(fit_phase.slope, thickness) if _usable(fit_phase) else float("nan")
+    alpha_amp = physics.calculate_alpha_from_slope(fit_amp.slope, thickness) if _usable(fit_amp) else float("nan")
+    alpha_ratio = 0.0
+    if alpha_amp > 0 and alpha_phase > 0:
+        alpha_ratio = min(alpha_amp, alpha_phase) / max(alpha_amp, alpha_phase)
+    return alpha_phase, alpha_amp, alpha_ratio
+
+
+def alpha_stderrs_from_fits(fit_phase: fitting.FitResult, fit_amp: fitting.FitResult, thickness: float) -> Tuple[float, float]:
+    """位相・振幅の傾きの標準誤差から (alpha_phase_err, alpha_amp_err) を誤差伝播で計算する。無効な回帰は NaN。"""
+    err_phase = (physics.calculate_alpha_stderr_from_slope(fit_phase.slope, fit_phase.stderr, thickness)
+                 if _usable(fit_phase) else float("nan"))
+    err_amp = (physics.calculate_alpha_stderr_from_slope(fit_amp.slope, fit_amp.stderr, thickness)
+               if _usable(fit_amp) else float("nan"))
+    return float(err_phase), float(err_amp)
+
+
+def fit_sigmas(raw_data: RawData, config) -> Optional[np.ndarray]:
+    """
+    位相・log(振幅*sqrt(f)) の各点の標準偏差 (2, 点数) を返す。sigma 列が無いデータでは None。
+    振幅の sigma は fitting.log_sigma で log 領域へ伝播する。
+    """
+    phase_sigma_col = getattr(config, "COL_PHASE_SIGMA", "theta_sigma")
+    amp_sigma_col = getattr(config, "COL_AMP_SIGMA", "amp_sigma")
+    df = raw_data.df
+    if phase_sigma_col not in df.columns or amp_sigma_col not in df.columns:
+        return None
+    amp = df[config.COL_AMP].to_numpy(dtype=float)
+    return np.vstack([
+        df[phase_sigma_col].to_numpy(dtype=float),
+        fitting.log_sigma(amp, df[amp_sigma_col].to_numpy(dtype=float)),
+    ])
+
+
+def joint_alphas(joint: fitting.JointFitResult, thickness) -> Tuple[np.ndarray, np.ndarray]:
+    """同時回帰の共通の傾きから (alpha, alpha の標準誤差) をケースごとに求める（thickness はスカラーまたはケースごと）。"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        alpha = physics.calculate_alpha_from_slope(joint.slope, thickness)
+        alpha_err = physics.calculate_alpha_stderr_from_slope(joint.slope, joint.stderr, thickness)
+    return alpha, alpha_err
+
+
+def fit_targets(x: np.ndarray, y: np.ndarray, mask: fitting.MaskLike = None, sigma: Optional[np.ndarray] = None,
+                method: str = "ols") -> fitting.BatchFitResult:
+    """
+    位相・log 振幅などの目的変数 y を method で一括回帰する（形状は fitting.batch_linear_regression と同じ）。
+    method="wls" は sigma（y と同形状）を重みに使う。複数ケースを (m, k, n) に並べれば 1 回で誤差まで求まる。
+    """
+    if method not in FIT_METHODS:
+        raise ValueError(f"未知の回帰方法です: {method}（使用可能: {FIT_METHODS}）")
+    if method == "wls":
+        if sigma is None:
+            raise ValueError("method='wls' には sigma が必要です。")
+        return fitting.batch_weighted_regression(x, y, sigma, mask)
+    return fitting.batch_linear_regression(x, y, mask)
+
+
+def exclude_outliers(x: np.ndarray, phase: np.ndarray, y_amp_log: np.ndarray, indices: List[int], robust: str,
+                     threshold: float = 3.0) -> Tuple[List[int], List[int]]:
+    """
+    indices の点を位相・log 振幅のロバスト回帰（fitting.robust_inlier_mask）で判定し、
+    (残す点, 外れ値として除いた点) のインデックスを返す。robust="none" なら除外しない。
+    """
+    if robust not in ROBUST_METHODS:
+        raise ValueError(f"未知のロバスト回帰です: {robust}（使用可能: {ROBUST_METHODS}）")
+    indices = np.asarray(indices, dtype=int)
+    if robust == "none" or len(indices) == 0:
+        return indices.tolist(), []
+    keep = fitting.robust_inlier_mask(
+        x[indices], np.vstack([phase[indices], y_amp_log[indices]]), robust, threshold=threshold
+    )
+    return indices[keep].tolist(), indices[~keep].tolist()
+
+
+def model_inputs(raw_data: RawData, config, method: Optional[str] = None):
+    """
+    twa_model.fit_twa_model に渡す (sqrt_f, 振幅, 位相, 厚み [um], sigma) を全点について作る。
+    method（None なら config.FIT_METHOD）が "wls" の場合のみ theta_sigma・amp_sigma を重みに使う。
+    """
+    df = raw_data.df
+    thickness = raw_data.metadata.get("試料厚", config.DEFAULT_THICKNESS_UM)
+    method = method or getattr(config, "FIT_METHOD", "ols")
+    sigma = fit_sigmas(raw_data, config) if method == "wls" else None
+    return (
+        df[config.COL_FREQ_SQRT].to_numpy(dtype=float),
+        df[config.COL_AMP].to_numpy(dtype=float),
+        df[config.COL_PHASE].to_numpy(dtype=float),
+        float(thickness),
+        sigma,
+    )
+
+
+def run_model_fit(raw_data: RawData, config, method: Optional[str] = None,
+                  x0: Optional[np.ndarray] = None) -> twa_model.ModelFitResult:
+    """スイープ全体に有限厚みの温度波応答モデル（twa_model）を当てはめる。解析範囲の選択は不要。"""
+    return twa_model.fit_twa_model(*model_inputs(raw_data, config, method), x0=x0)
+
+
+def run_analysis(raw_data: RawData, config, used_indices: Optional[List[int]] = None,
+                 method: Optional[str] = None, robust: Optional[str] = None) -> AnalysisResult:
     """
     生データと指定されたインデックス（範囲）に基づいて解析を実行し、
     メタデータ等を含めた完全なAnalysisResultオブジェクトを生成して返す。
     
     used_indicesがNoneの場合は、全データを使用する。
+    method は回帰方法（"ols" / "wls"。None なら config.FIT_METHOD）。
+    "wls" でも theta_sigma・amp_sigma 列が無いデータでは "ols" で回帰する（AnalysisResult.fit_method に記録）。
+    robust は外れ値の自動除外（"none" / "huber" / "theilsen" / "ransac"。None なら config.ROBUST_METHOD）。
+    used_indices のうち外れ値と判定した点を除いてから method で回帰し、除いた点を excluded_indices に記録する。
     """
+    method = method or getattr(config, "FIT_METHOD", "ols")
+    if method not in FIT_METHODS:
+        raise ValueError(f"未知の回帰方法です: {method}（使用可能: {FIT_METHODS}）")
+    robust = robust or getattr(config, "ROBUST_METHOD", "none")
+
     # データ抽出
     x_data = raw_data.df[config.COL_FREQ_SQRT].values
     amp_data = raw_data.df[config.COL_AMP].values
@@ -19,9 +138,17 @@ def run_analysis(raw_data: RawData, config, used_indices: Optional[List[int]] =
     
     thickness = raw_data.metadata.get("試料厚", config.DEFAULT_THICKNESS_UM)
 
+    sigma = fit_sigmas(raw_data, config) if method == "wls" else None
+    if sigma is None:
+        method = "ols"
+
     # インデックスの決定（指定がなければ全範囲）
     if used_indices is None:
         used_indices = list(range(len(x_data)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        used_indices, excluded_indices = exclude_outliers(
+            x_data, phase_data, y_amp_log, used_indices, robust, getattr(config, "ROBUST_THRESHOLD", 3.0)
+        )
     
     # 解析可能な点数かチェック
     if len(used_indices) < 2:
@@ -30,6 +157,9 @@ def run_analysis(raw_data: RawData, config, used_indices: Optional[List[int]] =
             filename=raw_data.filepath,
             thickness_um=thickness,
             used_indices=[],
+            fit_method=method,
+            robust_method=robust,
+            excluded_indices=excluded_indices,
             freq_range_min=0, freq_range_max=0,
             kd_min=0, kd_max=0
         )
@@ -37,13 +167,27 @@ def run_analysis(raw_data: RawData, config, used_indices: Optional[List[int]] =
     # 部分データの抽出
     x_sub = x_data[used_indices]
     
-    # 1. フィッティング実行
-    fit_phase = fitting.linear_regression_subset(x_data, phase_data, used_indices)
-    fit_amp = fitting.linear_regression_subset(x_data, y_amp_log, used_indices)
+    # 1. フィッティング実行（位相・振幅を一括回帰。傾きの標準誤差も同時に求まる）
+    # 目的変数ごとに有限な点だけを使う（振幅 <= 0 の点は log 振幅の回帰からだけ外す。
+    # インタラクティブ画面のプレビュー fitting.RunningLinearStats と同じ扱い）ため、
+    # 位相・log 振幅を別々のケース (2, 1, n) として回帰する
+    y_targets = np.vstack([phase_data, y_amp_log])
+    target_masks = fitting.indices_to_mask([used_indices], len(x_data)) & np.isfinite(x_data) & np.isfinite(y_targets)
+    fits = fit_targets(
+        x_data, y_targets[:, None, :], target_masks, None if sigma is None else sigma[:, None, :], method
+    )
+    fit_phase = fits.fit(0, 0)
+    fit_amp = fits.fit(1, 0)
 
     # 2. 物理量計算
-    alpha_phase = physics.calculate_alpha_from_slope(fit_phase.slope, thickness)
-    alpha_amp = physics.calculate_alpha_from_slope(fit_amp.slope, thickness)
+    alpha_phase, alpha_amp, alpha_ratio = alphas_from_fits(fit_phase, fit_amp, thickness)
+    alpha_phase_err, alpha_amp_err = alpha_stderrs_from_fits(fit_phase, fit_amp, thickness)
+
+    # 位相・log 振幅を共通の傾きで同時回帰（sigma 列があれば method によらず重み付き）
+    joint = fitting.batch_joint_regression(
+        x_data, y_amp_log, phase_data, sigma if sigma is not None else fit_sigmas(raw_data, config), [used_indices]
+    )
+    alpha_joint, alpha_joint_err = (float(v[0]) for v in joint_alphas(joint, thickness))
 
     # kd計算 (Phase由来のAlphaを使用)
     # x = sqrt(f) なので f = x^2
@@ -52,11 +196,6 @@ def run_analysis(raw_data: RawData, config, used_indices: Optional[List[int]] =
     kd_min = float(np.min(kd_values)) if len(kd_values) > 0 else 0.0
     kd_max = float(np.max(kd_values)) if len(kd_values) > 0 else 0.0
 
-    # 比率計算
-    alpha_ratio = 0.0
-    if alpha_amp > 0 and alpha_phase > 0:
-        alpha_ratio = min(alpha_amp, alpha_phase) / max(alpha_amp, alpha_phase)
-
     # 3. メタデータ抽出 (configのキー設定に従う)
     meta = raw_data.metadata
     x_pos = meta.get(config.KEY_X_POS)
@@ -79,12 +218,22 @@ def run_analysis(raw_data: RawData, config, used_indices: Optional[List[int]] =
         intercept_phase=fit_phase.intercept,
         
         alpha_ratio=alpha_ratio,
+
+        fit_method=method,
+        slope_phase_err=fit_phase.stderr,
+        slope_amp_err=fit_amp.stderr,
+        alpha_phase_err=alpha_phase_err,
+        alpha_amp_err=alpha_amp_err,
+        alpha_joint=alpha_joint,
+        alpha_joint_err=alpha_joint_err,
         
         x_position=x_pos,
         y_position=y_pos,
         z_position=z_pos,
         
         used_indices=used_indices,
+        robust_method=robust,
+        excluded_indices=excluded_indices,
         freq_range_min=float(np.min(x_sub)),
         freq_range_max=float(np.max(x_sub)),
         kd_min=kd_min,
@@ -0,0 +1,179 @@
+"""
+解析範囲（フィット窓）の自動選択
+
+sqrt_TW_freq で並べた点列の連続区間 [i, j) をすべて候補とし、位相・log(振幅*sqrt(f)) の
+線形回帰を累積和（prefix sum）から閉形式で一括評価して、評価基準が最大の区間を返す。
+区間ごとに scipy.stats.linregress を呼ばないため、O(n^2) 個の候補を NumPy のベクトル演算で処理できる。
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+try:
+    import config
+    DEFAULT_R2_THRESHOLD = config.analysis.R2_THRESHOLD
+    DEFAULT_MIN_POINTS = config.analysis.AUTO_RANGE_MIN_POINTS
+except (ImportError, AttributeError):
+    DEFAULT_R2_THRESHOLD = 0.90
+    DEFAULT_MIN_POINTS = 5
+
+# 1ブロックで評価する開始点の数（メモリ使用量 = ブロック数 × n）
+_BLOCK_SIZE = 256
+
+
+@dataclass
+class RangeSelection:
+    """自動選択したフィット窓"""
+    indices: List[int] = field(default_factory=list)  # 元データ（DataFrame）の行インデックス
+    x_min: float = 0.0
+    x_max: float = 0.0
+    n_points: int = 0
+    r2_phase: float = 0.0
+    r2_amp: float = 0.0
+    alpha_ratio: float = 0.0
+    kd_min: float = 0.0
+    kd_max: float = 0.0
+    score: float = 0.0
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    out = np.zeros(values.size + 1)
+    np.cumsum(values, out=out[1:])
+    return out
+
+
+def _score_ratio(stats: Dict[str, np.ndarray]) -> np.ndarray:
+    """alpha_ratio（位相・振幅由来 alpha の一致度）を最大化。同率なら点数の多い窓を優先。"""
+    return stats["alpha_ratio"] + 1e-9 * stats["n"]
+
+
+def _score_r2(stats: Dict[str, np.ndarray]) -> np.ndarray:
+    """位相・振幅の R^2 の小さい方を最大化。"""
+    return np.minimum(stats["r2_phase"], stats["r2_amp"]) + 1e-9 * stats["n"]
+
+
+def _score_combined(stats: Dict[str, np.ndarray]) -> np.ndarray:
+    """R^2 の小さい方 × alpha_ratio を最大化。"""
+    return np.minimum(stats["r2_phase"], stats["r2_amp"]) * stats["alpha_ratio"] + 1e-9 * stats["n"]
+
+
+CRITERIA: Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]] = {
+    "ratio": _score_ratio,
+    "r2": _score_r2,
+    "combined": _score_combined,
+}
+
+
+def select_fit_window(
+    x: np.ndarray,
+    phase: np.ndarray,
+    amp: np.ndarray,
+    min_points: int = DEFAULT_MIN_POINTS,
+    r2_threshold: float = DEFAULT_R2_THRESHOLD,
+    kd_bounds: Optional[tuple] = None,
+    criterion: Union[str, Callable[[Dict[str, np.ndarray]], np.ndarray]] = "ratio",
+) -> Optional[RangeSelection]:
+    """
+    連続するフィット窓を全探索し、評価基準が最大の窓を返す。
+
+    Parameters:
+      x, phase, amp: sqrt_TW_freq, 位相 [rad], 振幅（元データの行順）
+      min_points: 窓に含める最小点数
+      r2_threshold: 位相・振幅の両方の R^2 がこれ以上の窓のみを候補とする
+      kd_bounds: (kd_min, kd_max)。窓内の kd がこの範囲に収まる窓のみを候補とする（None 側は制限なし）
+      criterion: "ratio" / "r2" / "combined"、または窓ごとの統計量 dict
+                 (n, r2_phase, r2_amp, slope_phase, slope_amp, alpha_ratio, kd_min, kd_max) からスコア配列を返す関数
+
+    kd は kd = sqrt(f) * |位相の傾き| で評価する（kd = L*sqrt(pi*f/alpha), alpha = pi*L^2/slope^2 より）。
+    候補が無い場合は None。
+    """
+    score_fn = CRITERIA[criterion] if isinstance(criterion, str) else criterion
+    x = np.asarray(x, dtype=float)
+    phase = np.asarray(phase, dtype=float)
+    amp = np.asarray(amp, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y_amp = np.log(amp * x)
+    valid = np.isfinite(x) & np.isfinite(phase) & np.isfinite(y_amp)
+    rows = np.where(valid)[0]
+    order = rows[np.argsort(x[rows], kind="stable")]
+    n = order.size
+    min_points = max(int(min_points), 3)
+    if n < min_points:
+        return None
+
+    xs = x[order]
+    # 平行移動しても傾き・R^2 は不変なので、桁落ちを避けるため中心化してから累積和を取る
+    xc = xs - xs.mean()
+    yp = phase[order] - phase[order].mean()
+    ya = y_amp[order] - y_amp[order].mean()
+    P = {
+        "x": _prefix(xc), "xx": _prefix(xc * xc),
+        "p": _prefix(yp), "pp": _prefix(yp * yp), "xp": _prefix(xc * yp),
+        "a": _prefix(ya), "aa": _prefix(ya * ya), "xa": _prefix(xc * ya),
+    }
+
+    best_score = -np.inf
+    best = None
+    ends = np.arange(1, n + 1)
+    for start in range(0, n - min_points + 1, _BLOCK_SIZE):
+        starts = np.arange(start, min(start + _BLOCK_SIZE, n - min_points + 1))
+        i = starts[:, None]
+        j = ends[None, :]
+        cnt = (j - i).astype(float)
+        ok = cnt >= min_points
+
+        def win(key):
+            return P[key][j] - P[key][i]
+
+        sx, sxx = win("x"), win("xx")
+        sxx_c = cnt * sxx - sx * sx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats = {"n": cnt}
+            for tag, s, ss, sxy in (("phase", "p", "pp", "xp"), ("amp", "a", "aa", "xa")):
+                sy = win(s)
+                sxy_c = cnt * win(sxy) - sx * sy
+                syy_c = cnt * win(ss) - sy * sy
+                stats[f"slope_{tag}"] = sxy_c / sxx_c
+                stats[f"r2_{tag}"] = np.where(syy_c > 0, sxy_c * sxy_c / (sxx_c * syy_c), 0.0)
+            sp2 = stats["slope_phase"] ** 2
+            sa2 = stats["slope_amp"] ** 2
+            # alpha ∝ 1/slope^2 なので alpha_ratio = min(slope^2)/max(slope^2)
+            stats["alpha_ratio"] = np.minimum(sp2, sa2) / np.maximum(sp2, sa2)
+            abs_sp = np.abs(stats["slope_phase"])
+            stats["kd_min"] = xs[i] * abs_sp
+            stats["kd_max"] = xs[j - 1] * abs_sp
+
+        ok &= np.isfinite(stats["slope_phase"]) & np.isfinite(stats["slope_amp"]) & (sxx_c > 0)
+        ok &= (stats["r2_phase"] >= r2_threshold) & (stats["r2_amp"] >= r2_threshold)
+        if kd_bounds is not None:
+            kd_lo, kd_hi = kd_bounds
+            if kd_lo is not None:
+                ok &= stats["kd_min"] >= kd_lo
+            if kd_hi is not None:
+                ok &= stats["kd_max"] <= kd_hi
+        if not ok.any():
+            continue
+
+        score = np.where(ok, score_fn(stats), -np.inf)
+        flat = int(np.argmax(score))
+        if score.flat[flat] > best_score:
+            best_score = float(score.flat[flat])
+            r, c = np.unravel_index(flat, score.shape)
+            best = (int(starts[r]), int(ends[c]), {k: float(v[r, c]) for k, v in stats.items()})
+
+    if best is None:
+        return None
+    s, e, st = best
+    return RangeSelection(
+        indices=sorted(int(k) for k in order[s:e]),
+        x_min=float(xs[s]),
+        x_max=float(xs[e - 1]),
+        n_points=e - s,
+        r2_phase=st["r2_phase"],
+        r2_amp=st["r2_amp"],
+        alpha_ratio=st["alpha_ratio"],
+        kd_min=st["kd_min"],
+        kd_max=st["kd_max"],
+        score=best_score,
+    )
@@ -0,0 +1,161 @@
+"""
+インタラクティブ画面の差分描画（blit）
+
+軸・目盛り・全データ点などの静的な部分は draw_event のたびに背景としてキャッシュし、
+操作で変化するアーティスト（選択点・除外点・フィット線・ステータス文字列）だけを
+animated=True にして背景の上に描き直す。
+SpanSelector のドラッグのように短時間に連続するイベントは debounce_ms の間まとめ、
+最後の状態で 1 回だけ再計算・再描画する。
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+from matplotlib.backend_bases import TimerBase
+
+try:
+    import config
+    DEFAULT_DEBOUNCE_MS = config.plots.INTERACTIVE_DEBOUNCE_MS
+except (ImportError, AttributeError):
+    DEFAULT_DEBOUNCE_MS = 30
+
+# フレーム時間表示の移動平均の重み
+_FRAME_TIME_SMOOTHING = 0.2
+
+
+class BlitRenderer:
+    """
+    figure の animated アーティストを背景キャッシュ + blit で更新する。
+
+    Parameters:
+      fig: 対象の Figure
+      artists: 操作のたびに変化するアーティスト（animated=True に設定される）
+      debounce_ms: 連続する request() をまとめる時間 [ms]。0 以下なら即時に描画する
+      show_frame_time: True の場合、軸の左下に 1 フレームの処理時間を表示する
+    """
+
+    def __init__(self, fig, artists: Iterable, debounce_ms: int = DEFAULT_DEBOUNCE_MS,
+                 show_frame_time: bool = False):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.artists = list(artists)
+        for artist in self.artists:
+            artist.set_animated(True)
+
+        self.frame_ms: Optional[float] = None
+        self.frame_ms_avg: Optional[float] = None
+        self.frame_text = None
+        if show_frame_time:
+            ax = self.fig.axes[0]
+            self.frame_text = ax.text(
+                0.01, 0.01, "", transform=ax.transAxes, ha="left", va="bottom",
+                fontsize=8, family="monospace", color="dimgray", animated=True, zorder=10,
+            )
+
+        self._background = None
+        self._pending: Optional[Callable[[], None]] = None
+        self._timer = None
+        if debounce_ms > 0:
+            timer = self.canvas.new_timer(interval=int(debounce_ms))
+            # 非対話バックエンド（Agg 等）のタイマーは発火しないので即時描画にする
+            if type(timer) is not TimerBase:
+                timer.single_shot = True
+                timer.add_callback(self.flush)
+                self._timer = timer
+
+        self._cids = [
+            self.canvas.mpl_connect("draw_event", self._on_draw),
+            self.canvas.mpl_connect("close_event", self._on_close),
+        ]
+
+    def _animated_artists(self):
+        """blit で描き直すアーティスト。SpanSelector 等の animated なウィジェットも含める。"""
+        artists = [a for ax in self.fig.get_axes() for a in ax.get_children() if a.get_animated()]
+        artists.extend(a for a in self.artists if a not in artists)
+        return sorted(artists, key=lambda a: a.get_zorder())
+
+    def _draw_animated(self):
+        for artist in self._animated_artists():
+            if artist.get_visible():
+                self.fig.draw_artist(artist)
+
+    def _on_draw(self, event):
+        """全体の再描画後に静的背景を取り直し、animated アーティストを重ねる。"""
+        if event is not None and event.canvas is not self.canvas:
+            return
+        if not getattr(self.canvas, "supports_blit", False):
+            return
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _on_close(self, event):
+        if self._timer is not None:
+            self._timer.stop()
+
+    def request(self, update: Optional[Callable[[], None]] = None) -> None:
+        """
+        再描画を予約する。update には描画前に呼ぶ再計算関数を渡す。
+        debounce 中に再度呼ばれた場合はタイマーを延長し、最後の update のみ実行する。
+        """
+        if update is not None:
+            self._pending = update
+        if self._timer is None:
+            self.flush()
+            return
+        self._timer.stop()
+        self._timer.start()
+
+    def flush(self, draw: bool = True) -> None:
+        """予約中の再計算を実行し、draw=True なら画面を更新する。"""
+        if self._timer is not None:
+            self._timer.stop()
+        start = time.perf_counter()
+        update, self._pending = self._pending, None
+        if update is not None:
+            update()
+        if draw:
+            self.blit()
+            self._record_frame_time(time.perf_counter() - start)
+
+    def blit(self) -> None:
+        """背景を復元して animated アーティストだけを描き直す。背景が無ければ通常の再描画。"""
+        if self.frame_text is not None and self.frame_ms is not None:
+            self.frame_text.set_text(f"frame {self.frame_ms:6.1f} ms (avg {self.frame_ms_avg:6.1f} ms)")
+        if self._background is None or not getattr(self.canvas, "supports_blit", False):
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+    def _record_frame_time(self, seconds: float) -> None:
+        self.frame_ms = seconds * 1e3
+        if self.frame_ms_avg is None:
+            self.frame_ms_avg = self.frame_ms
+        else:
+            self.frame_ms_avg += _FRAME_TIME_SMOOTHING * (self.frame_ms - self.frame_ms_avg)
+
+    @contextmanager
+    def as_static(self):
+        """
+        savefig 用に一時的に animated を解除する（animated アーティストは通常描画で省略されるため）。
+        フレーム時間の表示は保存しない。
+        """
+        for artist in self.artists:
+            artist.set_animated(False)
+        if self.frame_text is not None:
+            self.frame_text.set_visible(False)
+        try:
+            yield self.fig
+        finally:
+            for artist in self.artists:
+                artist.set_animated(True)
+            if self.frame_text is not None:
+                self.frame_text.set_visible(True)
+
+    def disconnect(self) -> None:
+        for cid in self._cids:
+            self.canvas.mpl_disconnect(cid)
+        self._cids = []
+        self._on_close(None)
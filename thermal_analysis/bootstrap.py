@@ -0,0 +1,193 @@
+"""
+alpha のブートストラップ信頼区間
+
+解析に使った点を復元抽出した B 個の再標本を 1 つのインデックス行列 (B, n) として作り、
+fitting.batch_linear_regression（重み付きなら batch_weighted_regression）で全再標本の傾きを一度に求める。
+傾きから alpha = pi * L^2 / slope^2 を計算し、パーセンタイル区間と BCa 区間を位相・振幅の両方について返す。
+BCa の加速度はジャックナイフ（1 点除外の n 通りをマスク行列で一括回帰）から求める。
+ケースごとの計算は bootstrap_cases でプロセスプールに分配できる。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import stats
+
+try:
+    from . import fitting
+except ImportError:
+    import fitting
+
+TARGETS = ("phase", "amp")
+DEFAULT_N_BOOT = 2000
+# 1 ブロックで回帰する要素数の上限（再標本数 × 点数 × 目的変数数）
+_BLOCK_ELEMENTS = 4_000_000
+
+
+@dataclass
+class AlphaBootstrap:
+    """
+    1 ケース分のブートストラップ結果。各配列は目的変数（TARGETS: 位相, 振幅）ごとの値。
+    n_valid は傾きが求まった再標本の数（x がすべて同じ値の再標本などは除く）。
+    """
+    alpha: np.ndarray
+    percentile_lower: np.ndarray
+    percentile_upper: np.ndarray
+    bca_lower: np.ndarray
+    bca_upper: np.ndarray
+    n_valid: np.ndarray
+    n_boot: int
+    confidence_percent: float
+
+
+def _regress(x: np.ndarray, y: np.ndarray, sigma: Optional[np.ndarray], mask=None) -> np.ndarray:
+    """(m, n) の x と (m, k, n) の y を一括回帰して傾き (m, k) を返す。"""
+    if sigma is None:
+        return fitting.batch_linear_regression(x, y, mask).slope
+    return fitting.batch_weighted_regression(x, y, sigma, mask).slope
+
+
+def bootstrap_slopes(
+    x: np.ndarray,
+    y: np.ndarray,
+    n_boot: int = DEFAULT_N_BOOT,
+    sigma: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """
+    x (n,), y (k, n) の点を復元抽出した n_boot 個の再標本の傾き (n_boot, k) を返す。
+    sigma（y と同形状）を指定すると重み付き最小二乗で回帰する。傾きが求まらない再標本は NaN。
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    x = np.asarray(x, dtype=float)
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    n = x.size
+    k = y.shape[0]
+    index = rng.integers(0, n, size=(n_boot, n))
+    slopes = np.empty((n_boot, k))
+    block = max(1, _BLOCK_ELEMENTS // max(n * k, 1))
+    for start in range(0, n_boot, block):
+        idx = index[start : start + block]
+        ys = np.moveaxis(y[:, idx], 0, 1)
+        sig = np.moveaxis(sigma[:, idx], 0, 1) if sigma is not None else None
+        slopes[start : start + block] = _regress(x[idx], ys, sig)
+    return slopes
+
+
+def jackknife_slopes(x: np.ndarray, y: np.ndarray, sigma: Optional[np.ndarray] = None) -> np.ndarray:
+    """1 点ずつ除いた n 通りの傾き (n, k) を、除外点を False にしたマスク行列で一括回帰して返す。"""
+    x = np.asarray(x, dtype=float)
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    return _regress(x, y, sigma, ~np.eye(x.size, dtype=bool))
+
+
+def percentile_interval(samples: np.ndarray, confidence_percent: float) -> Tuple[np.ndarray, np.ndarray]:
+    """再標本の統計量 (B, k) の列ごとのパーセンタイル区間（NaN は除く）。"""
+    tail = (100.0 - confidence_percent) / 200.0
+    lower, upper = np.nanquantile(samples, [tail, 1.0 - tail], axis=0)
+    return lower, upper
+
+
+def bca_interval(
+    samples: np.ndarray,
+    estimate: np.ndarray,
+    jackknife: np.ndarray,
+    confidence_percent: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    BCa（バイアス補正・加速）区間。samples は再標本の統計量 (B, k)、estimate は元データの統計量 (k,)、
+    jackknife は 1 点除外の統計量 (n, k)。補正量が求まらない列はパーセンタイル区間と同じになる。
+    """
+    tail = (100.0 - confidence_percent) / 200.0
+    valid = np.isfinite(samples)
+    n_valid = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # バイアス補正 z0（推定値と等しい再標本は半分ずつ数える）
+        below = ((samples < estimate) & valid).sum(axis=0) + 0.5 * ((samples == estimate) & valid).sum(axis=0)
+        z0 = stats.norm.ppf(below / n_valid)
+        # 加速度 a（ジャックナイフ値の歪度から）
+        d = np.nanmean(jackknife, axis=0) - jackknife
+        num = np.nansum(d ** 3, axis=0)
+        den = 6.0 * np.nansum(d ** 2, axis=0) ** 1.5
+        accel = np.where(den > 0, num / den, 0.0)
+        z = stats.norm.ppf([tail, 1.0 - tail])[:, None]
+        adjusted = stats.norm.cdf(z0 + (z0 + z) / (1.0 - accel * (z0 + z)))
+    adjusted = np.where(np.isfinite(adjusted), adjusted, np.array([[tail], [1.0 - tail]]))
+    lower = np.empty(samples.shape[1])
+    upper = np.empty(samples.shape[1])
+    for col in range(samples.shape[1]):
+        column = samples[valid[:, col], col]
+        if column.size == 0:
+            lower[col] = upper[col] = np.nan
+            continue
+        lower[col], upper[col] = np.quantile(column, adjusted[:, col])
+    return lower, upper
+
+
+def alpha_from_slope(slope: np.ndarray, thickness_um: float) -> np.ndarray:
+    """alpha = pi * L^2 / slope^2（physics.calculate_alpha_from_slope の配列版。傾き 0 は NaN）。"""
+    L_meter = thickness_um * 1e-6
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(slope != 0, np.pi * L_meter ** 2 / np.square(slope), np.nan)
+
+
+def bootstrap_alpha(
+    x: np.ndarray,
+    phase: np.ndarray,
+    amp: np.ndarray,
+    thickness_um: float,
+    n_boot: int = DEFAULT_N_BOOT,
+    confidence_percent: float = 95.0,
+    sigma: Optional[np.ndarray] = None,
+    seed=None,
+) -> AlphaBootstrap:
+    """
+    解析に使った点 x = sqrt_TW_freq, 位相, 振幅 から alpha_phase・alpha_amp のブートストラップ区間を求める。
+    sigma を指定する場合は (2, n) の (位相の sigma, log 振幅の sigma) で、重み付き最小二乗で回帰する。
+    """
+    x = np.asarray(x, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y = np.vstack([np.asarray(phase, dtype=float), np.log(np.asarray(amp, dtype=float) * x)])
+    sigma = np.asarray(sigma, dtype=float) if sigma is not None else None
+
+    estimate = alpha_from_slope(_regress(x, y, sigma)[0], thickness_um)
+    samples = alpha_from_slope(bootstrap_slopes(x, y, n_boot, sigma, np.random.default_rng(seed)), thickness_um)
+    jack = alpha_from_slope(jackknife_slopes(x, y, sigma), thickness_um)
+    pct_lower, pct_upper = percentile_interval(samples, confidence_percent)
+    bca_lower, bca_upper = bca_interval(samples, estimate, jack, confidence_percent)
+    return AlphaBootstrap(
+        alpha=estimate,
+        percentile_lower=pct_lower,
+        percentile_upper=pct_upper,
+        bca_lower=bca_lower,
+        bca_upper=bca_upper,
+        n_valid=np.isfinite(samples).sum(axis=0),
+        n_boot=int(n_boot),
+        confidence_percent=float(confidence_percent),
+    )
+
+
+def _bootstrap_case(args) -> AlphaBootstrap:
+    x, phase, amp, thickness_um, n_boot, confidence_percent, sigma, seed = args
+    return bootstrap_alpha(x, phase, amp, thickness_um, n_boot, confidence_percent, sigma, seed)
+
+
+def bootstrap_cases(
+    cases: Sequence[Tuple[np.ndarray, np.ndarray, np.ndarray, float, Optional[np.ndarray]]],
+    n_boot: int = DEFAULT_N_BOOT,
+    confidence_percent: float = 95.0,
+    seed: Optional[int] = None,
+    workers: int = 1,
+) -> List[AlphaBootstrap]:
+    """
+    ケース (x, 位相, 振幅, 厚み [um], sigma または None) のリストそれぞれに bootstrap_alpha を行う。
+    乱数はケースごとに SeedSequence(seed) から派生させるため、結果は workers によらず同じになる。
+    workers > 1 ならケースをプロセスプールに分配する。
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(cases))
+    args = [(x, p, a, t, n_boot, confidence_percent, s, ss) for (x, p, a, t, s), ss in zip(cases, seeds)]
+    if workers <= 1 or len(args) <= 1:
+        return [_bootstrap_case(a) for a in args]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_bootstrap_case, args, chunksize=max(1, len(args) // (4 * workers))))
@@ -0,0 +1,154 @@
+"""
+DataFrame の列指向バイナリ保存（.npz）
+
+DataFrame を列ごとの numpy 配列に分解し、列情報・メタデータを JSON ヘッダとして
+同じ .npz に格納する。np.savez は無圧縮 ZIP のため、各列は
+メモリマップで直接参照でき、必要な列だけを読み出せる。
+パースキャッシュ（parse_cache）とケース保存（RawData.save_input_data）で共用する。
+"""
+import json
+import struct
+import zipfile
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+HEADER_KEY = "__header__"
+
+
+def encode_dataframe(df: pd.DataFrame) -> Tuple[Dict[str, np.ndarray], List[dict]]:
+    """
+    DataFrame を列ごとの配列に変換する。
+    数値・bool 列はそのまま保存し、それ以外（object / 文字列列）は欠損マスクと
+    値配列（bool のみの object 列は bool、それ以外は文字列）に分けて保存する。
+    """
+    arrays: Dict[str, np.ndarray] = {}
+    columns: List[dict] = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        values = series.to_numpy()
+        entry = {"name": str(col), "dtype": str(series.dtype), "kind": "native"}
+        if values.dtype.kind in "biufc":
+            arrays[f"c{i}"] = values
+        else:
+            mask = series.isna().to_numpy()
+            if pd.api.types.infer_dtype(series, skipna=True) == "boolean":
+                arrays[f"c{i}"] = np.array([(not m) and bool(v) for v, m in zip(values, mask)], dtype=bool)
+                entry["kind"] = "masked_bool"
+            else:
+                arrays[f"c{i}"] = np.array(["" if m else str(v) for v, m in zip(values, mask)], dtype=str)
+                entry["kind"] = "masked_str"
+            arrays[f"m{i}"] = mask
+        columns.append(entry)
+    return arrays, columns
+
+
+def decode_dataframe(arrays: Mapping[str, np.ndarray], columns: List[dict],
+                     names: Optional[List[str]] = None) -> pd.DataFrame:
+    """encode_dataframe の逆変換。names を指定した場合はその列だけを復元する。"""
+    wanted = set(names) if names is not None else None
+    data = {}
+    for i, entry in enumerate(columns):
+        if wanted is not None and entry["name"] not in wanted:
+            continue
+        values = arrays[f"c{i}"]
+        if entry["kind"] == "native":
+            series = pd.Series(values, copy=False)
+        else:
+            obj = np.asarray(values).astype(object)
+            obj[np.asarray(arrays[f"m{i}"])] = np.nan
+            series = pd.Series(obj)
+        if str(series.dtype) != entry["dtype"]:
+            try:
+                series = series.astype(entry["dtype"])
+            except (TypeError, ValueError):
+                pass
+        data[entry["name"]] = series
+    return pd.DataFrame(data, copy=False)
+
+
+def write_npz(file, df: pd.DataFrame, extra_header: Optional[dict] = None) -> None:
+    """df と任意のヘッダ情報（JSON 化可能な dict）を無圧縮 .npz に書き出す。"""
+    arrays, columns = encode_dataframe(df)
+    header = dict(extra_header or {})
+    header["columns"] = columns
+    arrays[HEADER_KEY] = np.array(json.dumps(header, ensure_ascii=False, default=_json_default))
+    np.savez(file, **arrays)
+
+
+def _json_default(o):
+    if isinstance(o, (np.integer,)):
+        return int(o)
+    if isinstance(o, (np.floating,)):
+        return float(o)
+    return str(o)
+
+
+def _mmap_members(path: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    無圧縮 .npz 内の各 .npy をメモリマップで開く。
+    圧縮されている・object 配列を含む等でマップできない場合は None。
+    """
+    members: Dict[str, np.ndarray] = {}
+    with zipfile.ZipFile(path) as zf:
+        infos = zf.infolist()
+    with open(path, "rb") as f:
+        for info in infos:
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith(".npy"):
+                return None
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_len, extra_len = struct.unpack("<HH", local_header[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                return None
+            key = info.filename[: -len(".npy")]
+            if len(shape) == 0 or int(np.prod(shape)) == 0:
+                members[key] = None  # 0次元・空配列はマップせず通常読み込みする
+                continue
+            members[key] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return members
+
+
+def read_header(path: str) -> dict:
+    """.npz のヘッダ（列情報とメタデータ）だけを読み込む。列データは読まない。"""
+    with np.load(path, allow_pickle=False) as npz:
+        return json.loads(str(npz[HEADER_KEY]))
+
+
+def read_npz(path: str, columns: Optional[List[str]] = None, mmap: bool = False,
+             rows: Optional[slice] = None) -> Tuple[pd.DataFrame, dict]:
+    """
+    write_npz で保存した .npz を読み込み (DataFrame, ヘッダ) を返す。
+    columns を指定した場合はその列だけを復元する。mmap=True の場合、数値列は
+    ファイルをメモリマップした配列をコピーせずに参照する（読み取り専用）。
+    rows（slice）を指定した場合はその行範囲だけを復元する。mmap=True と併用すると
+    範囲外の行はディスクから読まれない（範囲内はコピーして返す）。
+    """
+    with np.load(path, allow_pickle=False) as npz:
+        header = json.loads(str(npz[HEADER_KEY]))
+        mapped = _mmap_members(path) if mmap else None
+        if mapped is None:
+            arrays = npz
+        else:
+            arrays = {k: (v if v is not None else npz[k]) for k, v in mapped.items()}
+        if rows is not None:
+            wanted = set(columns) if columns is not None else None
+            arrays = {
+                k: np.array(arrays[k][rows])
+                for i, entry in enumerate(header["columns"])
+                if wanted is None or entry["name"] in wanted
+                for k in (f"c{i}", f"m{i}")
+                if k in arrays
+            }
+        df = decode_dataframe(arrays, header["columns"], columns)
+    return df, header
@@ -3,7 +3,15 @@ import pandas as pd
 import json
 import os
 import numpy as np
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional
+
+try:
+    from . import columnar
+except ImportError:
+    import columnar
+
+INPUT_DATA_NPZ = "input_data.npz"
+INPUT_DATA_JSON = "input_data.json"
 
 @dataclass
 class RawData:
@@ -11,15 +19,51 @@ class RawData:
     df: pd.DataFrame
     metadata: Dict[str, float]
     filepath: str
+    # 列射影読み込み時に省いた列を読み込む関数（列名リスト -> DataFrame）
+    column_loader: Optional[Callable[[List[str]], pd.DataFrame]] = field(default=None, repr=False, compare=False)
+    # データロガー CSV の RAW_Unmapped 列のアクセサ（unmapped_fields.UnmappedFields）。df には読み込まない
+    unmapped: Optional[Any] = field(default=None, repr=False, compare=False)
+
+    def get_columns(self, names: List[str]) -> pd.DataFrame:
+        """
+        指定列を返す。df に無い列は column_loader から読み込んで df に追加する。
+        """
+        missing = [n for n in names if n not in self.df.columns]
+        if missing:
+            if self.column_loader is None:
+                raise KeyError(f"列が見つかりません: {missing}")
+            extra = self.column_loader(missing)
+            if len(extra) != len(self.df):
+                raise ValueError("遅延読み込みした列の行数が一致しません。")
+            for name in extra.columns:
+                self.df[name] = extra[name].to_numpy()
+        return self.df[names]
+
+    def get_unmapped(self, keys: List[str], rows: Optional[slice] = None) -> pd.DataFrame:
+        """
+        RAW_Unmapped 列の JSON からキー keys の値を、行範囲 rows（既定: 全行）だけデコードして返す。
+        """
+        if self.unmapped is None:
+            raise KeyError("RAW_Unmapped 列がありません。")
+        return self.unmapped.get(keys, rows)
 
-    def save_input_data(self, output_dir: str):
+    def save_input_data(self, output_dir: str, fmt: str = "npz"):
         """
-        RawDataを再利用可能なJSON形式で保存
-        input_data.json として保存します
+        RawDataを再利用可能な形式で保存
+        fmt="npz"  : input_data.npz（列ごとの配列 + メタデータ。columnar.read_npz でメモリマップ読み込み可）
+        fmt="json" : input_data.json（従来形式, DataFrame を split 形式で保存）
         """
         if not os.path.exists(output_dir):
             os.makedirs(output_dir, exist_ok=True)
 
+        if fmt == "npz":
+            save_path = os.path.join(output_dir, INPUT_DATA_NPZ)
+            columnar.write_npz(save_path, self.df, {"metadata": self.metadata, "filepath": self.filepath})
+            print(f"Saved Input Data: {save_path}")
+            return
+        if fmt != "json":
+            raise ValueError(f"Unknown input data format: {fmt}")
+
         # DataFrameをJSONシリアライズ可能な辞書形式(split)に変換
         # split形式: {'index': [...], 'columns': [...], 'data': [[...], ...]}
         df_dict = self.df.to_dict(orient='split')
@@ -30,7 +74,7 @@ class RawData:
             "dataframe": df_dict
         }
 
-        save_path = os.path.join(output_dir, "input_data.json")
+        save_path = os.path.join(output_dir, INPUT_DATA_JSON)
         
         def default_converter(o):
             if isinstance(o, (np.int64, np.int32)): return int(o)
@@ -41,6 +85,25 @@ class RawData:
             json.dump(save_data, f, indent=4, ensure_ascii=False, default=default_converter)
         print(f"Saved Input Data: {save_path}")
 
+    @classmethod
+    def load_input_data(cls, case_dir: str, columns: Optional[List[str]] = None, mmap: bool = True) -> 'RawData':
+        """
+        save_input_data で保存したケースを読み込む。
+        input_data.npz を優先し（mmap=True なら数値列はメモリマップ）、無ければ従来の input_data.json を読む。
+        columns を指定した場合はその列だけを復元する。
+        """
+        npz_path = os.path.join(case_dir, INPUT_DATA_NPZ)
+        if os.path.exists(npz_path):
+            df, header = columnar.read_npz(npz_path, columns=columns, mmap=mmap)
+            return cls(df=df, metadata=header.get("metadata", {}), filepath=header.get("filepath", ""))
+
+        with open(os.path.join(case_dir, INPUT_DATA_JSON), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        df = pd.DataFrame(data["dataframe"]["data"], columns=data["dataframe"]["columns"])
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        return cls(df=df, metadata=data.get("metadata", {}), filepath=data.get("filepath", ""))
+
 @dataclass
 class AnalysisResult:
     """解析結果を保持するクラス"""
@@ -63,6 +126,20 @@ class AnalysisResult:
 
     alpha_ratio: Optional[float] = None
 
+    #--- Fit uncertainty (傾きの標準誤差と、そこから誤差伝播した alpha の標準誤差) ---
+    fit_method: str = "ols"  # "ols"（通常の最小二乗）/ "wls"（theta_sigma・amp_sigma による重み付き最小二乗）
+    slope_phase_err: Optional[float] = None
+    slope_amp_err: Optional[float] = None
+    alpha_phase_err: Optional[float] = None
+    alpha_amp_err: Optional[float] = None
+    # 位相と log 振幅を共通の傾きで同時回帰した alpha（fitting.batch_joint_regression。sigma 列があれば重み付き）
+    alpha_joint: Optional[float] = None
+    alpha_joint_err: Optional[float] = None
+
+    #--- Finite-thickness model fit (twa_model。スイープ全体に 1 次元温度波応答を当てはめた alpha) ---
+    alpha_model: Optional[float] = None
+    alpha_model_err: Optional[float] = None
+
     #--- Position ---
     x_position: Optional[float] = None
     y_position: Optional[float] = None
@@ -71,6 +148,9 @@ class AnalysisResult:
 
     #--- analysis range ---
     used_indices: List[int] = field(default_factory=list)
+    # ロバスト回帰（robust_method）で外れ値として自動除外した点、またはインタラクティブ画面で除外した点
+    robust_method: str = "none"
+    excluded_indices: List[int] = field(default_factory=list)
     freq_range_min: float = 0.0
     freq_range_max: float = 0.0
     kd_min: Optional[float] = None
@@ -2,12 +2,18 @@ import pandas as pd
 import io
 import os
 import numpy as np
-from typing import Dict, Tuple
+import functools
+from typing import Dict, Iterable, List, Optional, Tuple
 
 try:
     from .datamodels import RawData
+    from . import parse_cache, position_store
+    from .unmapped_fields import UNMAPPED_COLUMN, UnmappedFields
 except ImportError:
     from datamodels import RawData
+    import parse_cache
+    import position_store
+    from unmapped_fields import UNMAPPED_COLUMN, UnmappedFields
 
 # configから位相列名を取得するためのインポート
 try:
@@ -16,6 +22,12 @@ try:
 except ImportError:
     PHASE_COL_NAME = "theta"
 
+# パース結果に影響する変更を加えたら更新する（parse_cache のキーに含まれる）
+PARSER_VERSION = 3
+
+# 位相アンラップをリセットする区切り（データロガー CSV の位置の切り替わり）
+PHASE_SEGMENT_COLUMNS: Tuple[str, ...] = ("Stage_X_um", "Stage_Y_um", "Stage_Z_um")
+
 
 def _canonical_twa_column_names() -> Tuple[str, str, str, str]:
     """解析パイプラインが参照する列名（config が無い場合は従来の既定）。"""
@@ -26,7 +38,7 @@ def _canonical_twa_column_names() -> Tuple[str, str, str, str]:
         return "sqrt_TW_freq", "amp", "theta", "z_pos"
 
 
-def _canonical_twa_position_keys() -> Tuple[str, str, str]:
+def canonical_twa_position_keys() -> Tuple[str, str, str]:
     """解析結果に反映する座標メタデータのキー名。"""
     try:
         c = config.columns
@@ -35,39 +47,70 @@ def _canonical_twa_position_keys() -> Tuple[str, str, str]:
         return "x_pos", "y_pos", "z_pos"
 
 
-def _load_csv_table(filepath: str) -> pd.DataFrame:
-    """#META 行付きのデータロガー CSV 等を読み込む（# で始まる行はスキップ）。"""
+_TEXT_ENCODINGS: Tuple[str, ...] = ("utf-8-sig", "utf-8", "cp932")
+
+# データロガー CSV の列射影読み込みで読む列と型。
+# 解析に使う数値列は float64、状態フラグは nullable boolean、状態文字列は category とする。
+# ここに無い列（FG_Waveform 等）は RawData.get_columns で必要時に読み込む。
+# RAW_Unmapped（JSON 文字列）は列射影の有無によらず読み込まず、RawData.get_unmapped で必要なキーだけをデコードする。
+LOGGER_COLUMN_DTYPES: Dict[str, str] = {
+    "Sys_Timestamp": "float64",
+    "Elapsed_s": "float64",
+    "Stage_X_um": "float64",
+    "Stage_Y_um": "float64",
+    "Stage_Z_um": "float64",
+    "LI_Amp": "float64",
+    "LI_Theta_deg": "float64",
+    "LI_RefFreq_Hz": "float64",
+    "FG_Freq_Hz": "float64",
+    "Stage_Connected": "boolean",
+    "Stage_Status": "category",
+    "Stage_IsMock": "boolean",
+    "LI_Connected": "boolean",
+    "LI_Status": "category",
+    "LI_AutoAdjustActive": "boolean",
+    "FG_Output": "boolean",
+}
+
+
+def _read_text_once(filepath: str) -> str:
+    """
+    ファイルをバイト列として1度だけ読み込み、utf-8-sig → utf-8 → cp932 の順でデコードする。
+    エンコーディング判定のためにファイルを開き直すことはしない。
+    """
+    with open(filepath, "rb") as f:
+        data = f.read()
     last_err: Exception | None = None
-    for enc in ("utf-8-sig", "utf-8", "cp932"):
+    for enc in _TEXT_ENCODINGS:
         try:
-            return pd.read_csv(filepath, comment="#", encoding=enc)
+            return data.decode(enc)
         except UnicodeDecodeError as e:
             last_err = e
-    if last_err:
-        raise last_err
-    return pd.read_csv(filepath, comment="#")
+    raise last_err
 
 
-def _load_csv_meta(filepath: str) -> Dict[str, float]:
-    """CSV先頭の #META 行から座標メタデータを読み込む。"""
-    x_key, y_key, z_key = _canonical_twa_position_keys()
+def _split_csv_header(text: str) -> Tuple[List[str], str]:
+    """
+    先頭に連続する # 行（#META ブロック）とデータ本体を分割する。
+    戻り値は (ヘッダ行のリスト, 本体文字列)。本体はコピーせずスライスで返す。
+    """
+    header_lines: List[str] = []
+    pos = 0
+    n = len(text)
+    while pos < n and text.startswith("#", pos):
+        end = text.find("\n", pos)
+        end = n if end == -1 else end + 1
+        header_lines.append(text[pos:end])
+        pos = end
+    return header_lines, text[pos:]
+
+
+def _parse_csv_meta(header_lines: List[str]) -> Dict[str, float]:
+    """#META 行から座標メタデータを読み込む。"""
+    x_key, y_key, z_key = canonical_twa_position_keys()
     key_map = {"x_pos": x_key, "y_pos": y_key, "z_pos": z_key}
     metadata: Dict[str, float] = {}
-    last_err: Exception | None = None
-    lines = None
-    for enc in ("utf-8-sig", "utf-8", "cp932"):
-        try:
-            with open(filepath, "r", encoding=enc) as f:
-                lines = f.readlines()
-            break
-        except UnicodeDecodeError as e:
-            last_err = e
-    if lines is None:
-        if last_err:
-            raise last_err
-        return metadata
-
-    for raw_line in lines:
+    for raw_line in header_lines:
         line = raw_line.strip()
         if not line.startswith("#META,"):
             continue
@@ -81,6 +124,72 @@ def _load_csv_meta(filepath: str) -> Dict[str, float]:
     return metadata
 
 
+def _meta_column_table(header_lines: List[str]) -> List[str]:
+    """
+    #META の列定義表（"#META,format,column,description" 以降の "#META,<列名>,<説明>" 行）から
+    ファイルに含まれる列名を取り出す。表が無い場合は空リスト。
+    """
+    columns: List[str] = []
+    in_table = False
+    for raw_line in header_lines:
+        line = raw_line.strip()
+        if not line.startswith("#META,"):
+            continue
+        parts = [p.strip() for p in line[len("#META,"):].split(",", 1)]
+        if parts[0] == "format":
+            in_table = len(parts) == 2 and parts[1].startswith("column")
+            continue
+        if in_table and parts[0] not in ("config", "position"):
+            columns.append(parts[0])
+    return columns
+
+
+def logger_read_options(columns: Optional[Iterable[str]] = None,
+                        available: Optional[Iterable[str]] = None) -> Dict[str, object]:
+    """
+    データロガー CSV を列射影・型指定付きで読むための pd.read_csv 引数を返す。
+    columns 省略時は LOGGER_COLUMN_DTYPES の列。available（#META の列定義表など）が
+    分かっていれば存在する列だけを指定し、分からなければ列名で判定する。
+    """
+    wanted = list(columns) if columns is not None else list(LOGGER_COLUMN_DTYPES)
+    if available:
+        available_set = {c.strip() for c in available}
+        wanted = [c for c in wanted if c in available_set]
+    wanted_set = set(wanted)
+    return {
+        "usecols": lambda c: c.strip() in wanted_set,
+        "dtype": {c: LOGGER_COLUMN_DTYPES[c] for c in wanted if c in LOGGER_COLUMN_DTYPES},
+    }
+
+
+def _load_csv(filepath: str, projected: bool = False,
+              columns: Optional[Iterable[str]] = None) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """
+    #META 行付きのデータロガー CSV 等を1パスで読み込む。
+    デコード済みテキストから先頭の # 行ブロックを切り出してメタデータとし、
+    残りの本体をバッファとして pd.read_csv に渡す（本体中の # 行はコメント扱い）。
+    projected=True の場合は #META の列定義表に基づき columns（既定: LOGGER_COLUMN_DTYPES）のみを読む。
+    RAW_Unmapped 列はどちらの場合も読まない（UnmappedFields で遅延デコードする）。
+    """
+    text = _read_text_once(filepath)
+    header_lines, body = _split_csv_header(text)
+    read_kwargs: Dict[str, object] = {"usecols": lambda c: c.strip() != UNMAPPED_COLUMN}
+    if projected:
+        read_kwargs = logger_read_options(columns, _meta_column_table(header_lines))
+    df = pd.read_csv(io.StringIO(body), comment="#", **read_kwargs)
+    return df, _parse_csv_meta(header_lines)
+
+
+def load_csv_columns(filepath: str, columns: List[str]) -> pd.DataFrame:
+    """CSV から指定列のみを読み込む（列射影読み込み時に省いた列の遅延読み込み用）。"""
+    wanted = set(columns)
+    text = _read_text_once(filepath)
+    _, body = _split_csv_header(text)
+    df = pd.read_csv(io.StringIO(body), comment="#", usecols=lambda c: c.strip() in wanted)
+    df.columns = [c.strip() for c in df.columns]
+    return df
+
+
 def _ensure_twa_canonical_columns(df: pd.DataFrame, metadata: Dict[str, float]) -> None:
     """
     TWA 解析用の列（sqrt_TW_freq, amp, theta）が無い場合、
@@ -89,7 +198,7 @@ def _ensure_twa_canonical_columns(df: pd.DataFrame, metadata: Dict[str, float])
     既に canonical 列が揃っていれば何もしない。
     """
     sqrt_n, amp_n, phase_n, z_key = _canonical_twa_column_names()
-    x_key, y_key, _ = _canonical_twa_position_keys()
+    x_key, y_key, _ = canonical_twa_position_keys()
     if sqrt_n in df.columns and amp_n in df.columns and phase_n in df.columns:
         return
 
@@ -134,6 +243,65 @@ def _ensure_twa_canonical_columns(df: pd.DataFrame, metadata: Dict[str, float])
                 metadata[meta_key] = float(vals.mean())
 
 
+def segment_starts(*labels: np.ndarray, decimals: Optional[int] = 6) -> np.ndarray:
+    """
+    行ごとのラベル列（位置座標・周波数クラスタ番号など）から、各セグメントの先頭行インデックスを返す。
+    いずれかのラベルが直前の行と異なる行を新しいセグメントの先頭とする（0 行目は常に先頭）。
+    数値ラベルは decimals 桁に丸めて比較し、NaN 同士は同じ値とみなす。
+    """
+    n = len(labels[0]) if labels else 0
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    change = np.zeros(n, dtype=bool)
+    change[0] = True
+    for label in labels:
+        values = np.asarray(label)
+        if values.dtype.kind == "f":
+            if decimals is not None:
+                values = np.round(values, decimals)
+            prev, cur = values[:-1], values[1:]
+            change[1:] |= (prev != cur) & ~(np.isnan(prev) & np.isnan(cur))
+        else:
+            change[1:] |= values[:-1] != values[1:]
+    return np.flatnonzero(change)
+
+
+def unwrap_phase_segments(phase_data: np.ndarray, starts: Optional[np.ndarray] = None,
+                          period: float = np.pi, threshold: float = 3.0) -> np.ndarray:
+    """
+    セグメントごとに独立した位相アンラップを 1 パスで行う。
+
+    starts は各セグメントの先頭行インデックス（昇順、segment_starts の戻り値）。
+    セグメント境界をまたぐ差分は補正せず、累積補正量は各セグメントの先頭で 0 に戻す
+    （全体の cumsum から、各行が属するセグメント先頭での累積値を引く）。
+    starts=None なら全体を 1 セグメントとして unwrap_phase_custom と同じ結果になる。
+    非有限の位相の行は NaN のまま残し、他の行の補正には影響させない。
+    """
+    phase = np.asarray(phase_data, dtype=float)
+    n = phase.shape[0]
+    if n == 0:
+        return phase.copy()
+
+    # 非有限の行は直前の有限な値との差分で飛びを判定し（その行自体は NaN のまま）、
+    # 補正量は 0 にして後続の行の累積補正へ NaN が伝播しないようにする
+    finite = np.isfinite(phase)
+    last = np.maximum.accumulate(np.where(finite, np.arange(n), 0))
+    diff = np.diff(phase[last])
+    correction = np.zeros(n)
+    correction[1:] = np.where(np.isfinite(diff), -np.round(diff / period) * (np.abs(diff) > threshold) * period, 0.0)
+    if starts is None:
+        starts = np.zeros(1, dtype=int)
+    starts = np.asarray(starts, dtype=int)
+    correction[starts] = 0.0
+
+    cumulative = np.cumsum(correction)
+    # 各行が属するセグメントの先頭インデックス（先頭行に自身の番号を置き、前方へ最大値で伝播）
+    head = np.zeros(n, dtype=int)
+    head[starts] = starts
+    head = np.maximum.accumulate(head)
+    return phase + (cumulative - cumulative[head])
+
+
 def unwrap_phase_custom(phase_data: np.ndarray, period: float = np.pi, threshold: float = 3.0) -> np.ndarray:
     """
     位相アンラップ処理（ベクトル化済み）
@@ -147,43 +315,80 @@ def unwrap_phase_custom(phase_data: np.ndarray, period: float = np.pi, threshold
       threshold: 補正判定を行う差分の閾値（ユーザー要件により 3.0 をデフォルト設定）
                  ※通常のunwrapは period/2 ですが、急激な物理変化を許容するため高めに設定可能です
     """
-    diff = np.diff(phase_data)
-
-    mask = np.abs(diff) > threshold
-
-    k = np.round(diff / period) * mask
-
-    correction = -k * period
-
-    cumulative_correction = np.cumsum(correction)
-
-    unwrapped_phase = phase_data.copy()
-    unwrapped_phase[1:] += cumulative_correction
+    return unwrap_phase_segments(phase_data, None, period=period, threshold=threshold)
 
-    return unwrapped_phase
 
-
-def adjust_phase_continuity(df: pd.DataFrame, col_name: str) -> pd.DataFrame:
+def adjust_phase_continuity(df: pd.DataFrame, col_name: str,
+                            segment_by: Optional[Iterable[str]] = PHASE_SEGMENT_COLUMNS) -> pd.DataFrame:
     """
     DataFrame内の指定列に対して位相アンラップを適用
+    segment_by の列（既定: ステージ座標）の値が変わる行でアンラップの累積補正をリセットし、
+    位置の切り替わりでの位相の飛びが後続の位置へ伝播しないようにする。
+    df に無い列は無視し、該当列が 1 つも無ければ全体を 1 系列として扱う。
     """
     if col_name not in df.columns:
         return df
 
-    phase_values = df[col_name].values
+    phase_values = df[col_name].to_numpy(dtype=float)
+    labels = [df[c].to_numpy() for c in (segment_by or ()) if c in df.columns]
+    starts = segment_starts(*labels) if labels else None
 
-    new_phase = unwrap_phase_custom(phase_values, period=np.pi, threshold=3.0)
+    new_phase = unwrap_phase_segments(phase_values, starts, period=np.pi, threshold=3.0)
 
     df[col_name] = new_phase
     return df
 
 
-def load_from_text(filepath: str, sep: str = "\t") -> RawData:
+def load_from_text(filepath: str, sep: str = "\t", use_cache: bool = True, projected: bool = False) -> RawData:
+    """
+    生データファイル（従来 .txt / データロガー .csv）を RawData として読み込む。
+    use_cache=True の場合、ファイルが前回から変更されていなければ
+    parse_cache に保存されたパース結果をそのまま返す。
+    projected=True の場合、データロガー CSV は LOGGER_COLUMN_DTYPES の列だけを型指定で読み込み、
+    それ以外の列は RawData.get_columns で必要になった時点で読み込む。
+    """
+    is_csv = os.path.splitext(filepath)[1].lower() == ".csv"
+    if not use_cache:
+        raw_data = _parse_file(filepath, sep, projected)
+    else:
+        key = parse_cache.cache_key(filepath, PARSER_VERSION, sep, projected and is_csv)
+        raw_data = parse_cache.load(key, filepath) if key is not None else None
+        if raw_data is None:
+            raw_data = _parse_file(filepath, sep, projected)
+            if key is not None:
+                parse_cache.store(key, raw_data)
+
+    if projected and is_csv:
+        raw_data.column_loader = functools.partial(load_csv_columns, filepath)
+    if is_csv:
+        raw_data.unmapped = UnmappedFields(filepath)
+    return raw_data
+
+
+def load_position_from_store(store_path: str, x: float, y: float, z: float, tolerance_um: float = 1e-3) -> RawData:
+    """
+    freq_sweep_summary の統合ストア（position_summary.npz）から座標 (x, y, z) の位置だけを読み込む。
+    位置別 CSV を load_from_text で読んだ場合と同じ列・座標メタデータの RawData を返す
+    （他の位置の行は読まない）。
+    """
+    df, entry, _ = position_store.read_position(store_path, x, y, z, tolerance_um=tolerance_um)
+    x_key, y_key, z_key = canonical_twa_position_keys()
+    # 位置別 CSV の #META 行と同じく小数点以下6桁に丸める
+    metadata: Dict[str, float] = {
+        x_key: round(entry["x_pos"], 6),
+        y_key: round(entry["y_pos"], 6),
+        z_key: round(entry["z_pos"], 6),
+    }
+    if PHASE_COL_NAME in df.columns:
+        df = adjust_phase_continuity(df, PHASE_COL_NAME)
+    return RawData(df=df, metadata=metadata, filepath=store_path)
+
+
+def _parse_file(filepath: str, sep: str, projected: bool = False) -> RawData:
     ext = os.path.splitext(filepath)[1].lower()
     if ext == ".csv":
-        df = _load_csv_table(filepath)
+        df, metadata = _load_csv(filepath, projected=projected)
         df.columns = [c.strip() for c in df.columns]
-        metadata: Dict[str, float] = _load_csv_meta(filepath)
         _ensure_twa_canonical_columns(df, metadata)
         if PHASE_COL_NAME in df.columns:
             df = adjust_phase_continuity(df, PHASE_COL_NAME)
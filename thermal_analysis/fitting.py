@@ -1,7 +1,9 @@
+import warnings
+
 import numpy as np
 from scipy import stats
 from dataclasses import dataclass
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, Sequence, Union
 
 @dataclass
 class FitResult:
@@ -9,6 +11,605 @@ class FitResult:
     intercept: float
     r2: float
     is_valid: bool
+    # 以下は一括回帰（batch_linear_regression）で得られる追加情報
+    stderr: float = 0.0            # 傾きの標準誤差
+    intercept_stderr: float = 0.0  # 切片の標準誤差
+    resid_var: float = 0.0         # 残差分散 SSE / (n - 2)（重み付き回帰では換算カイ二乗 χ² / (n - 2)）
+    n: int = 0                     # 使用点数
+    covariance: float = 0.0        # 傾きと切片の共分散
+
+
+@dataclass
+class BatchFitResult:
+    """
+    一括線形回帰の結果。各配列の形状は (ケース数 m, 目的変数数 k)。
+    n のみ (m, 1)。
+    """
+    slope: np.ndarray
+    intercept: np.ndarray
+    r2: np.ndarray
+    stderr: np.ndarray
+    intercept_stderr: np.ndarray
+    resid_var: np.ndarray
+    n: np.ndarray
+    is_valid: np.ndarray
+    covariance: Optional[np.ndarray] = None  # 傾きと切片の共分散
+
+    def fit(self, case: int = 0, target: int = 0) -> FitResult:
+        """
+        1ケース・1目的変数分を従来の FitResult として取り出す。
+        無効な回帰（点数不足・x が一定・目的変数に NaN を含むなど）は傾き等を NaN とする
+        （0 を返すと alpha = pi * L^2 / slope^2 がゼロ除算になるため）。
+        """
+        n = int(np.broadcast_to(self.n, self.slope.shape)[case, target])
+        valid = bool(np.broadcast_to(self.is_valid, self.slope.shape)[case, target])
+        if not valid:
+            nan = float("nan")
+            return FitResult(nan, nan, nan, False, stderr=nan, intercept_stderr=nan, resid_var=nan, n=n, covariance=nan)
+        return FitResult(
+            slope=float(self.slope[case, target]),
+            intercept=float(self.intercept[case, target]),
+            r2=float(self.r2[case, target]),
+            is_valid=True,
+            stderr=float(self.stderr[case, target]),
+            intercept_stderr=float(self.intercept_stderr[case, target]),
+            resid_var=float(self.resid_var[case, target]),
+            n=n,
+            covariance=float(self.covariance[case, target]) if self.covariance is not None else 0.0,
+        )
+
+
+MaskLike = Union[None, np.ndarray, Sequence[Sequence[int]]]
+
+
+def indices_to_mask(indices_list: Sequence[Sequence[int]], n: int) -> np.ndarray:
+    """インデックスのリスト（ケースごと）を (ケース数, n) の bool マスクに変換する。"""
+    mask = np.zeros((len(indices_list), n), dtype=bool)
+    for row, indices in enumerate(indices_list):
+        if len(indices) > 0:
+            mask[row, np.asarray(indices, dtype=int)] = True
+    return mask
+
+
+def windows_to_mask(windows: Sequence[Tuple[int, int]], n: int) -> np.ndarray:
+    """連続区間 [start, stop) のリストを (区間数, n) の bool マスクに変換する。"""
+    pos = np.arange(n)
+    w = np.asarray(windows, dtype=int).reshape(-1, 2)
+    return (pos[None, :] >= w[:, :1]) & (pos[None, :] < w[:, 1:])
+
+
+def batch_linear_regression(x: np.ndarray, y: np.ndarray, mask: MaskLike = None) -> BatchFitResult:
+    """
+    複数ケース・複数目的変数の線形回帰 y = slope * x + intercept を閉形式の十分統計量で一括計算する。
+
+    Parameters:
+      x: (n,) または (m, n)。(m, n) の場合はケースごとに異なる x（長さが違う場合はマスクで埋める）
+      y: (n,), (k, n) または (m, k, n)。k 個の目的変数（位相と log 振幅など）
+      mask: None（全点）, (n,) / (m, n) の bool 配列, またはケースごとのインデックスのリスト
+
+    戻り値の各配列は (m, k)。点数が 2 未満のケースは is_valid=False（値は NaN）。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n_pts = x.shape[-1]
+
+    if mask is None:
+        w = np.ones((1, n_pts), dtype=bool)
+    elif isinstance(mask, np.ndarray) and mask.dtype == bool:
+        w = mask.reshape(-1, n_pts)
+    else:
+        w = indices_to_mask(mask, n_pts)
+
+    m = max(w.shape[0], x.shape[0] if x.ndim == 2 else 1, y.shape[0] if y.ndim == 3 else 1)
+    X = np.broadcast_to(x.reshape(-1, n_pts), (m, n_pts))
+    if y.ndim == 1:
+        y = y[None, :]
+    Y = np.broadcast_to(y if y.ndim == 3 else y[None, :, :], (m, y.shape[-2], n_pts))
+    W = np.broadcast_to(w, (m, n_pts)).astype(float)
+
+    # マスク外の値（NaN を含みうる）は 0 に置き換えてから和を取る
+    Xz = np.where(W > 0, X, 0.0)
+    Yz = np.where(W[:, None, :] > 0, Y, 0.0)
+    cnt = W.sum(axis=-1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = Xz.sum(axis=-1) / cnt
+        y_mean = Yz.sum(axis=-1) / cnt[:, None]
+        # 2パス（中心化してから積和）で桁落ちを避ける
+        xc = (Xz - x_mean[:, None]) * W
+        yc = (Yz - y_mean[:, :, None]) * W[:, None, :]
+        sxx = np.einsum("mn,mn->m", xc, xc)[:, None]
+        sxy = np.einsum("mn,mkn->mk", xc, yc)
+        syy = np.einsum("mkn,mkn->mk", yc, yc)
+
+        slope = sxy / sxx
+        intercept = y_mean - slope * x_mean[:, None]
+        r2 = np.where(syy > 0, sxy * sxy / (sxx * syy), 0.0)
+        r2 = np.minimum(r2, 1.0)
+        dof = (cnt - 2)[:, None]
+        sse = np.maximum(syy - slope * sxy, 0.0)
+        resid_var = np.where(dof > 0, sse / dof, np.nan)
+        stderr = np.sqrt(resid_var / sxx)
+        intercept_stderr = np.sqrt(resid_var * (1.0 / cnt[:, None] + (x_mean[:, None] ** 2) / sxx))
+        covariance = -resid_var * x_mean[:, None] / sxx
+
+    is_valid = (cnt >= 2)[:, None] & np.isfinite(slope)
+    return BatchFitResult(
+        slope=slope,
+        intercept=intercept,
+        r2=r2,
+        stderr=stderr,
+        intercept_stderr=intercept_stderr,
+        resid_var=resid_var,
+        n=cnt.astype(int)[:, None],
+        is_valid=is_valid,
+        covariance=covariance,
+    )
+
+
+def log_sigma(values: np.ndarray, sigma: np.ndarray) -> np.ndarray:
+    """
+    values の標準偏差 sigma を log(values) の標準偏差に伝播する（1次近似: sigma / |values|）。
+    log(amp * sqrt(f)) の sqrt(f) は誤差なしとして扱うため、振幅の sigma にそのまま使える。
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.asarray(sigma, dtype=float) / np.abs(np.asarray(values, dtype=float))
+
+
+def sigma_weights(sigma: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    重み 1/sigma^2（mask 外は 0）。無効な sigma（NaN・0 以下）は同じケース・目的変数（最後の軸）の
+    有効な sigma の最大値で埋め、有効な sigma が無ければ等重み（1）にする。
+    """
+    good = mask & np.isfinite(sigma) & (sigma > 0)
+    s_max = np.max(np.where(good, sigma, 0.0), axis=-1, keepdims=True, initial=0.0)
+    s = np.where(good, sigma, np.where(s_max > 0, s_max, 1.0))
+    s = np.where(good.any(axis=-1, keepdims=True), s, 1.0)
+    return np.where(mask, 1.0 / (s * s), 0.0)
+
+
+def batch_weighted_regression(
+    x: np.ndarray,
+    y: np.ndarray,
+    sigma: np.ndarray,
+    mask: MaskLike = None,
+    absolute_sigma: bool = False,
+) -> BatchFitResult:
+    """
+    各点の標準偏差 sigma を重み 1/sigma^2 とする重み付き最小二乗を、batch_linear_regression と同じ形状で一括計算する。
+
+    Parameters:
+      x, y, mask: batch_linear_regression と同じ
+      sigma: y と同じ形状（またはブロードキャスト可能な形状）の標準偏差
+      absolute_sigma: True なら sigma を絶対的な誤差として共分散を 1/Σw 系で求める。
+                      False（既定）なら相対的な重みとみなし、換算カイ二乗で共分散をスケールする
+                      （scipy.optimize.curve_fit と同じ扱い。sigma がクラスタ内の標準偏差であり
+                      平均値の誤差そのものではないため）
+
+    sigma が NaN・0 以下の点は、同じケース・目的変数の有効な sigma の最大値（最も小さい重み）で置き換える。
+    有効な sigma が 1 点も無いケース・目的変数は等重み（通常の最小二乗と同じ傾き）になる。
+    r2 は重み付きの決定係数、resid_var は換算カイ二乗 χ² / (n - 2)。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n_pts = x.shape[-1]
+
+    if mask is None:
+        w = np.ones((1, n_pts), dtype=bool)
+    elif isinstance(mask, np.ndarray) and mask.dtype == bool:
+        w = mask.reshape(-1, n_pts)
+    else:
+        w = indices_to_mask(mask, n_pts)
+
+    if y.ndim == 1:
+        y = y[None, :]
+    sigma = np.asarray(sigma, dtype=float)
+    if sigma.ndim == 1:
+        sigma = sigma[None, :]
+    m = max(
+        w.shape[0],
+        x.shape[0] if x.ndim == 2 else 1,
+        y.shape[0] if y.ndim == 3 else 1,
+        sigma.shape[0] if sigma.ndim == 3 else 1,
+    )
+    k = y.shape[-2]
+    X = np.broadcast_to(x.reshape(-1, n_pts)[:, None, :], (m, k, n_pts))
+    Y = np.broadcast_to(y if y.ndim == 3 else y[None, :, :], (m, k, n_pts))
+    S = np.broadcast_to(sigma if sigma.ndim == 3 else sigma[None, :, :], (m, k, n_pts))
+    M = np.broadcast_to(w.reshape(-1, n_pts)[:, None, :], (m, k, n_pts))
+
+    W = sigma_weights(S, M)
+
+    Xz = np.where(M, X, 0.0)
+    Yz = np.where(M, Y, 0.0)
+    cnt = M.sum(axis=-1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sw = W.sum(axis=-1)
+        x_mean = (W * Xz).sum(axis=-1) / sw
+        y_mean = (W * Yz).sum(axis=-1) / sw
+        xc = np.where(M, Xz - x_mean[..., None], 0.0)
+        yc = np.where(M, Yz - y_mean[..., None], 0.0)
+        sxx = (W * xc * xc).sum(axis=-1)
+        sxy = (W * xc * yc).sum(axis=-1)
+        syy = (W * yc * yc).sum(axis=-1)
+
+        slope = sxy / sxx
+        intercept = y_mean - slope * x_mean
+        r2 = np.where(syy > 0, sxy * sxy / (sxx * syy), 0.0)
+        r2 = np.minimum(r2, 1.0)
+        dof = cnt - 2
+        chi2 = np.maximum(syy - slope * sxy, 0.0)
+        resid_var = np.where(dof > 0, chi2 / dof, np.nan)
+        scale = np.ones_like(resid_var) if absolute_sigma else resid_var
+        stderr = np.sqrt(scale / sxx)
+        intercept_stderr = np.sqrt(scale * (1.0 / sw + x_mean * x_mean / sxx))
+        covariance = -scale * x_mean / sxx
+
+    is_valid = (cnt >= 2) & np.isfinite(slope)
+    return BatchFitResult(
+        slope=slope,
+        intercept=intercept,
+        r2=r2,
+        stderr=stderr,
+        intercept_stderr=intercept_stderr,
+        resid_var=resid_var,
+        n=cnt[:, :1].astype(int),
+        is_valid=is_valid,
+        covariance=covariance,
+    )
+
+
+@dataclass
+class JointFitResult:
+    """
+    位相と log 振幅に共通の傾きを持たせた同時回帰の結果（ケース数 m）。
+    slope, intercept_amp, intercept_phase, stderr, chi2_red, n, is_valid: (m,)
+    covariance: (m, 3, 3)。パラメータの並びは (slope, intercept_amp, intercept_phase)
+    """
+    slope: np.ndarray
+    intercept_amp: np.ndarray
+    intercept_phase: np.ndarray
+    stderr: np.ndarray
+    covariance: np.ndarray
+    chi2_red: np.ndarray
+    n: np.ndarray
+    is_valid: np.ndarray
+
+
+def batch_joint_regression(
+    x: np.ndarray,
+    y_amp_log: np.ndarray,
+    phase: np.ndarray,
+    sigma: Optional[np.ndarray] = None,
+    mask: MaskLike = None,
+    absolute_sigma: bool = False,
+) -> JointFitResult:
+    """
+    複素応答 A * e^{i*theta} の対数 log(A * sqrt(f)) + i*theta を、kd >> 1 の漸近形
+        log(A * sqrt(f)) = c_amp + slope * x,  theta = c_phase + slope * x  (x = sqrt(f))
+    で 1 つの最小二乗問題として当てはめる（傾きは共通、切片は実部・虚部で別）。
+    全ケースの 3x3 正規方程式を作り、np.linalg.solve の 1 回の呼び出しでまとめて解く。
+
+    Parameters:
+      x: (n,) または (m, n)
+      y_amp_log, phase: (n,) または (m, n)
+      sigma: None（等重み）または (2, n) / (m, 2, n) の (位相の sigma, log 振幅の sigma)。
+             無効な sigma の扱いと absolute_sigma は batch_weighted_regression と同じ
+      mask: batch_linear_regression と同じ
+
+    点数 2 未満・x が一定のケースは is_valid=False（値は NaN）。自由度は 2n - 3。
+    """
+    x = np.asarray(x, dtype=float)
+    n_pts = x.shape[-1]
+    if mask is None:
+        w = np.ones((1, n_pts), dtype=bool)
+    elif isinstance(mask, np.ndarray) and mask.dtype == bool:
+        w = mask.reshape(-1, n_pts)
+    else:
+        w = indices_to_mask(mask, n_pts)
+    ya = np.asarray(y_amp_log, dtype=float).reshape(-1, n_pts)
+    yp = np.asarray(phase, dtype=float).reshape(-1, n_pts)
+    sig = np.ones((1, 2, n_pts)) if sigma is None else np.asarray(sigma, dtype=float).reshape(-1, 2, n_pts)
+    m = max(w.shape[0], x.reshape(-1, n_pts).shape[0], ya.shape[0], yp.shape[0], sig.shape[0])
+    X = np.broadcast_to(x.reshape(-1, n_pts), (m, n_pts))
+    M = np.broadcast_to(w, (m, n_pts)) & np.isfinite(X)
+    M = M & np.isfinite(np.broadcast_to(ya, (m, n_pts))) & np.isfinite(np.broadcast_to(yp, (m, n_pts)))
+    S = np.broadcast_to(sig, (m, 2, n_pts))
+    W = sigma_weights(S, np.broadcast_to(M[:, None, :], (m, 2, n_pts)))
+    wp, wa = W[:, 0], W[:, 1]
+    Ya = np.where(M, np.broadcast_to(ya, (m, n_pts)), 0.0)
+    Yp = np.where(M, np.broadcast_to(yp, (m, n_pts)), 0.0)
+    cnt = M.sum(axis=-1)
+
+    # 桁落ちを避けるため x を点の平均 x0 で中心化して解き、後で切片と共分散を戻す
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x0 = np.where(M, X, 0.0).sum(axis=-1) / cnt
+        xc = np.where(M, X - np.nan_to_num(x0)[:, None], 0.0)
+        normal = np.empty((m, 3, 3))
+        normal[:, 0, 0] = ((wa + wp) * xc * xc).sum(axis=-1)
+        normal[:, 0, 1] = normal[:, 1, 0] = (wa * xc).sum(axis=-1)
+        normal[:, 0, 2] = normal[:, 2, 0] = (wp * xc).sum(axis=-1)
+        normal[:, 1, 1] = wa.sum(axis=-1)
+        normal[:, 2, 2] = wp.sum(axis=-1)
+        normal[:, 1, 2] = normal[:, 2, 1] = 0.0
+        rhs = np.stack([(wa * xc * Ya + wp * xc * Yp).sum(axis=-1), (wa * Ya).sum(axis=-1), (wp * Yp).sum(axis=-1)], axis=-1)
+
+        is_valid = (cnt >= 2) & (normal[:, 0, 0] > 0)
+        # 解けないケースは単位行列に置き換えてまとめて解き、結果を NaN にする
+        eye = np.broadcast_to(np.eye(3), normal.shape)
+        normal_ok = np.where(is_valid[:, None, None], normal, eye)
+        inv = np.linalg.inv(normal_ok)
+        params = np.einsum("mij,mj->mi", inv, np.where(is_valid[:, None], rhs, 0.0))
+
+        resid_a = np.where(M, Ya - params[:, 1:2] - params[:, 0:1] * xc, 0.0)
+        resid_p = np.where(M, Yp - params[:, 2:3] - params[:, 0:1] * xc, 0.0)
+        chi2 = (wa * resid_a * resid_a + wp * resid_p * resid_p).sum(axis=-1)
+        dof = 2 * cnt - 3
+        chi2_red = np.where(dof > 0, chi2 / dof, np.nan)
+        scale = np.ones(m) if absolute_sigma else chi2_red
+        cov_c = inv * scale[:, None, None]
+        # 中心化を戻す: c = c' - slope * x0
+        back = np.broadcast_to(np.eye(3), (m, 3, 3)).copy()
+        back[:, 1, 0] = back[:, 2, 0] = -x0
+        covariance = back @ cov_c @ np.swapaxes(back, 1, 2)
+
+    nan = np.where(is_valid, 1.0, np.nan)
+    slope = params[:, 0] * nan
+    return JointFitResult(
+        slope=slope,
+        intercept_amp=(params[:, 1] - params[:, 0] * x0) * nan,
+        intercept_phase=(params[:, 2] - params[:, 0] * x0) * nan,
+        stderr=np.sqrt(covariance[:, 0, 0]) * nan,
+        covariance=covariance * nan[:, None, None],
+        chi2_red=chi2_red * nan,
+        n=cnt.astype(int),
+        is_valid=is_valid & np.isfinite(slope),
+    )
+
+
+@dataclass
+class RobustLine:
+    """
+    ロバスト回帰の結果（1ケース、k 個の目的変数）。
+    slope, intercept: ロバスト推定の直線 (k,)
+    scale: inliers の最小二乗の残差標準偏差（自由度 n_inliers - 2）(k,)
+    inliers: (k, n) の bool
+    """
+    slope: np.ndarray
+    intercept: np.ndarray
+    scale: np.ndarray
+    inliers: np.ndarray
+
+
+# 正規分布で MAD を標準偏差に換算する係数
+_MAD_TO_SIGMA = 1.4826
+
+
+def _prepare_robust(x: np.ndarray, y: np.ndarray, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """x (n,), y (k, n) と、有限値かつ mask 内の点の bool (k, n) を返す。"""
+    x = np.asarray(x, dtype=float)
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    use = np.ones(x.shape, dtype=bool) if mask is None else np.asarray(mask, dtype=bool).copy()
+    use = use[None, :] & np.isfinite(x)[None, :] & np.isfinite(y)
+    return x, y, use
+
+
+def _scale_floor(use: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """完全に直線に乗る場合に尺度が 0 にならないよう、丸め誤差程度の下限 (k,)。"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        floor = 64 * np.finfo(float).eps * np.nanmax(np.where(use, np.abs(y), np.nan), axis=-1)
+    return np.nan_to_num(floor) + np.finfo(float).tiny
+
+
+def _small_sample_factor(use: np.ndarray, n_params: int = 2) -> np.ndarray:
+    """
+    中央値ベースの尺度の有限標本補正 1 + 5 / (n - p)（Rousseeuw & Leroy の LMS 尺度の補正）。
+    直線を当てはめた残差は点数が少ないほど小さく出るため、補正しないと 5〜10 点では正常な点を多く外れ値にする。
+    """
+    dof = np.maximum(use.sum(axis=-1) - n_params, 1)
+    return 1.0 + 5.0 / dof
+
+
+def _robust_scale(resid: np.ndarray, use: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """残差 (k, n) の 1.4826 * MAD に有限標本補正を掛けた頑健な尺度（下限は _scale_floor）。"""
+    r = np.where(use, resid, np.nan)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        med = np.nanmedian(r, axis=-1, keepdims=True)
+        scale = _MAD_TO_SIGMA * _small_sample_factor(use) * np.nanmedian(np.abs(r - med), axis=-1)
+    return np.fmax(np.nan_to_num(scale), _scale_floor(use, y))
+
+
+def _weighted_line(x: np.ndarray, y: np.ndarray, w: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """重み w (k, n)（0 の点は不使用）の重み付き最小二乗の (傾き, 切片)。"""
+    xz = np.where(w > 0, x[None, :], 0.0)
+    yz = np.where(w > 0, y, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sw = w.sum(axis=-1)
+        xm = (w * xz).sum(axis=-1) / sw
+        ym = (w * yz).sum(axis=-1) / sw
+        xc = np.where(w > 0, xz - xm[:, None], 0.0)
+        slope = (w * xc * (yz - ym[:, None])).sum(axis=-1) / (w * xc * xc).sum(axis=-1)
+    return slope, ym - slope * xm
+
+
+def _refine_inliers(x: np.ndarray, y: np.ndarray, use: np.ndarray, candidates: np.ndarray,
+                    threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ロバスト推定で残した候補点 candidates (k, n) を最小二乗で当てはめ直し、その残差から外れ値を判定し直す。
+    尺度は候補点の残差二乗和 / (n_c - 2) とし、
+    - 候補点は 1 点除外の（外部）スチューデント化残差 r / (s_(i) * sqrt(1 - h)) を自由度 n_c - 3 の t 分布で、
+    - 候補外の点は予測残差 r / (s * sqrt(1 + h)) を自由度 n_c - 2 の t 分布で
+    検定する。t 分布の臨界値は「正規分布で threshold σ を超える両側確率」と同じ確率になるよう選ぶため、
+    外れ値の無いデータで正常な点を除外する割合は点数によらずほぼその確率（threshold=3 で約 0.27%）になる。
+    自由度が足りない（候補点 3 点以下）場合、判定できない点は候補の判定のまま残す。
+    戻り値は (inliers (k, n), 候補点の残差標準偏差 (k,))。
+    """
+    w = (candidates & use).astype(float)
+    n_c = w.sum(axis=-1)
+    slope, intercept = _weighted_line(x, y, w)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xm = (w * np.where(w > 0, x[None, :], 0.0)).sum(axis=-1) / n_c
+        dx = x[None, :] - xm[:, None]
+        sxx = (w * np.where(w > 0, dx, 0.0) ** 2).sum(axis=-1)
+        resid = y - (slope[:, None] * x[None, :] + intercept[:, None])
+        sse = (w * np.where(w > 0, resid, 0.0) ** 2).sum(axis=-1)
+        dof = n_c - 2
+        floor2 = _scale_floor(use, y) ** 2
+        s2 = np.fmax(sse / dof, floor2)
+        h = 1.0 / n_c[:, None] + dx * dx / sxx[:, None]
+        # 候補点: 1 点除外の残差分散（sse - r^2 / (1 - h)) / (dof - 1)
+        s2_del = np.fmax((sse[:, None] - resid * resid / (1.0 - h)) / (dof[:, None] - 1), floor2[:, None])
+        t_in = np.abs(resid) / np.sqrt(s2_del * (1.0 - h))
+        t_out = np.abs(resid) / np.sqrt(s2[:, None] * (1.0 + h))
+        tail = stats.norm.sf(threshold)
+        crit_in = stats.t.isf(tail, np.maximum(dof - 1, 1))[:, None]
+        crit_out = stats.t.isf(tail, np.maximum(dof, 1))[:, None]
+    is_cand = w > 0
+    keep_in = np.where((dof - 1 >= 1)[:, None], t_in <= crit_in, True)
+    keep_out = np.where((dof >= 1)[:, None], t_out <= crit_out, False)
+    inliers = use & np.where(is_cand, keep_in, keep_out)
+    return inliers, np.sqrt(np.where(dof > 0, s2, np.nan))
+
+
+def _refine_until_stable(x: np.ndarray, y: np.ndarray, use: np.ndarray, candidates: np.ndarray,
+                         threshold: float, max_iter: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    _refine_inliers を判定が変わらなくなるまで繰り返す。ロバスト推定の候補は直線に近い点に偏っていて
+    尺度が小さめに出るため、1 回目で戻った正常な点を含めて当てはめ直すと判定が名目の確率に近づく。
+    """
+    inliers, scale = _refine_inliers(x, y, use, candidates, threshold)
+    for _ in range(max_iter - 1):
+        if np.array_equal(inliers, candidates):
+            break
+        candidates = inliers
+        inliers, scale = _refine_inliers(x, y, use, candidates, threshold)
+    return inliers, scale
+
+
+def _line_result(x, y, use, slope, intercept, threshold) -> RobustLine:
+    resid = y - (slope[:, None] * x[None, :] + intercept[:, None])
+    scale = _robust_scale(resid, use, y)
+    candidates = use & (np.abs(resid) <= threshold * scale[:, None])
+    inliers, refined_scale = _refine_until_stable(x, y, use, candidates, threshold)
+    return RobustLine(slope=slope, intercept=intercept, scale=refined_scale, inliers=inliers)
+
+
+def theil_sen_regression(x: np.ndarray, y: np.ndarray, mask: Optional[np.ndarray] = None,
+                         threshold: float = 3.0) -> RobustLine:
+    """
+    Theil–Sen 推定: 全点対の傾き (y_j - y_i) / (x_j - x_i) を一度に作り、その中央値を傾きとする。
+    切片は y - slope * x の中央値。|残差| が threshold × 補正済み 1.4826 * MAD 以下の点を候補とし、
+    _refine_inliers で inliers を決める。
+    """
+    x, y, use = _prepare_robust(x, y, mask)
+    i, j = np.triu_indices(x.size, 1)
+    dx = x[j] - x[i]
+    pair_ok = use[:, i] & use[:, j] & (dx != 0)[None, :]
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        slope = np.nanmedian(np.where(pair_ok, (y[:, j] - y[:, i]) / dx, np.nan), axis=-1)
+        intercept = np.nanmedian(np.where(use, y - slope[:, None] * x[None, :], np.nan), axis=-1)
+    return _line_result(x, y, use, slope, intercept, threshold)
+
+
+def huber_regression(x: np.ndarray, y: np.ndarray, mask: Optional[np.ndarray] = None, threshold: float = 3.0,
+                     c: float = 1.345, max_iter: int = 50, tol: float = 1e-10) -> RobustLine:
+    """
+    Huber 損失の反復重み付き最小二乗（IRLS）。残差を補正済み 1.4826 * MAD で標準化した u に対し
+    重み min(1, c / |u|) で重み付き回帰を繰り返す（目的変数ごとに独立、反復はベクトル演算でまとめて行う）。
+    """
+    x, y, use = _prepare_robust(x, y, mask)
+    w = use.astype(float)
+    slope, intercept = _weighted_line(x, y, w)
+    for _ in range(max_iter):
+        resid = y - (slope[:, None] * x[None, :] + intercept[:, None])
+        u = np.abs(resid) / _robust_scale(resid, use, y)[:, None]
+        with np.errstate(divide="ignore"):
+            w = np.where(use, np.minimum(1.0, c / u), 0.0)
+        new_slope, new_intercept = _weighted_line(x, y, w)
+        converged = np.abs(new_slope - slope) <= tol * (1.0 + np.abs(slope))
+        slope, intercept = new_slope, new_intercept
+        if np.all(converged | ~np.isfinite(slope)):
+            break
+    return _line_result(x, y, use, slope, intercept, threshold)
+
+
+def ransac_regression(x: np.ndarray, y: np.ndarray, mask: Optional[np.ndarray] = None, threshold: float = 3.0,
+                      max_trials: int = 1000, seed: Optional[int] = 0) -> RobustLine:
+    """
+    RANSAC: 2 点で決まる直線を候補とし、全候補の残差 (k, 候補数, n) を一度に評価する。
+    点対が max_trials 以下なら全点対を、それを超える場合は seed から無作為に max_trials 組を使う。
+    閾値は「|残差| の中央値が最小の候補（LMedS）」の尺度 1.4826 * (1 + 5 / (n - 2)) * 中央値
+    （Rousseeuw の有限標本補正。候補直線を決めた 2 点の残差は 0 になるため補正が要る）× threshold とし、
+    閾値内の点が最も多い候補（同数なら閾値内の残差二乗和が小さい方）の閾値内の点で最小二乗をやり直し、
+    その閾値内の点を候補として _refine_inliers で inliers を決める。
+    """
+    x, y, use = _prepare_robust(x, y, mask)
+    i, j = np.triu_indices(x.size, 1)
+    if i.size > max_trials:
+        pick = np.random.default_rng(seed).choice(i.size, size=max_trials, replace=False)
+        i, j = i[pick], j[pick]
+    if i.size == 0:
+        slope, intercept = _weighted_line(x, y, use.astype(float))
+        return _line_result(x, y, use, slope, intercept, threshold)
+
+    dx = x[j] - x[i]
+    cand_ok = use[:, i] & use[:, j] & (dx != 0)[None, :]
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        slope = (y[:, j] - y[:, i]) / dx
+        intercept = y[:, i] - slope * x[i]
+        resid = np.abs(y[:, None, :] - (slope[:, :, None] * x[None, None, :] + intercept[:, :, None]))
+        resid = np.where(use[:, None, :], resid, np.nan)
+        lmeds = np.where(cand_ok, np.nanmedian(resid, axis=-1), np.inf).min(axis=-1)
+        lmeds_scale = _MAD_TO_SIGMA * _small_sample_factor(use) * lmeds
+        limit = threshold * np.fmax(lmeds_scale, _scale_floor(use, y))
+        inside = resid <= limit[:, None, None]
+        count = np.where(cand_ok, inside.sum(axis=-1), -1)
+        sse = np.where(inside, resid * resid, 0.0).sum(axis=-1)
+
+    # 閾値内の点数が最大、同数なら残差二乗和が最小の候補の閾値内の点で回帰し直す
+    best = np.array([np.lexsort((sse[t], -count[t]))[0] for t in range(y.shape[0])])
+    rows = np.arange(y.shape[0])
+    consensus = np.where((count[rows, best] >= 2)[:, None], inside[rows, best] & use, use)
+    slope, intercept = _weighted_line(x, y, consensus.astype(float))
+    resid = y - (slope[:, None] * x[None, :] + intercept[:, None])
+    with np.errstate(invalid="ignore"):
+        candidates = use & (np.abs(resid) <= limit[:, None])
+    inliers, scale = _refine_until_stable(x, y, use, candidates, threshold)
+    return RobustLine(slope=slope, intercept=intercept, scale=scale, inliers=inliers)
+
+
+ROBUST_REGRESSIONS = {
+    "huber": huber_regression,
+    "theilsen": theil_sen_regression,
+    "ransac": ransac_regression,
+}
+
+
+def robust_inlier_mask(x: np.ndarray, y: np.ndarray, method: str, mask: Optional[np.ndarray] = None,
+                       threshold: float = 3.0, min_points: int = 2, **options) -> np.ndarray:
+    """
+    method（"huber" / "theilsen" / "ransac"）のロバスト回帰で各目的変数の外れ値を判定し、
+    すべての目的変数で inlier の点の bool (n,) を返す（位相・振幅で共通の解析点にするため）。
+    threshold は正規分布の σ 単位で、正常な点を除外する確率が全目的変数を合わせて
+    約 2 * (1 - Φ(threshold)) になるよう、目的変数ごとの判定ではその確率を k 等分する。
+    残る点が min_points 未満になる場合は除外を行わず、有限値の点をそのまま返す。
+    """
+    if method not in ROBUST_REGRESSIONS:
+        raise ValueError(f"未知のロバスト回帰です: {method}（使用可能: {list(ROBUST_REGRESSIONS)}）")
+    x_arr, y_arr, use = _prepare_robust(x, y, mask)
+    usable = use.all(axis=0)
+    if usable.sum() <= min_points:
+        return usable
+    per_target = float(stats.norm.isf(stats.norm.sf(threshold) / y_arr.shape[0]))
+    line = ROBUST_REGRESSIONS[method](x_arr, y_arr, usable, threshold=per_target, **options)
+    inliers = line.inliers.all(axis=0)
+    return inliers if inliers.sum() >= min_points else usable
+
 
 def extract_subset(x: np.ndarray, y: np.ndarray, indices: List[int]) -> Tuple[np.ndarray, np.ndarray]:
     """インデックスに基づいて部分配列を抽出"""
@@ -16,27 +617,104 @@ def extract_subset(x: np.ndarray, y: np.ndarray, indices: List[int]) -> Tuple[np
         return np.array([]), np.array([])
     return x[indices], y[indices]
 
-def linear_regression_subset(x: np.ndarray, y: np.ndarray, indices: Optional[List[int]] = None) -> FitResult:
+def linear_regression_subset(x: np.ndarray, y: np.ndarray, indices: Optional[List[int]] = None,
+                             sigma: Optional[np.ndarray] = None) -> FitResult:
     """
     指定された範囲(indices)で線形回帰を行う。
     indicesがNoneの場合は全範囲を使用。
+    sigma（y の標準偏差）を指定した場合は重み付き最小二乗（batch_weighted_regression）で回帰する。
     """
     # 部分データの抽出
     if indices is not None:
         x_sub, y_sub = extract_subset(x, y, indices)
+        sigma_sub = np.asarray(sigma)[indices] if sigma is not None and len(indices) > 0 else sigma
     else:
-        x_sub, y_sub = x, y
+        x_sub, y_sub, sigma_sub = x, y, sigma
 
     # データ点数が少なすぎる場合のガード
     if len(x_sub) < 2:
         return FitResult(0.0, 0.0, 0.0, False)
 
-    # 線形回帰 (scipyを使用)
-    slope, intercept, r_value, _, _ = stats.linregress(x_sub, y_sub)
-    
-    return FitResult(
-        slope=slope,
-        intercept=intercept,
-        r2=r_value**2,
-        is_valid=True
-    )
\ No newline at end of file
+    # 線形回帰（十分統計量による閉形式）
+    if sigma_sub is not None:
+        return batch_weighted_regression(x_sub, y_sub, sigma_sub).fit()
+    return batch_linear_regression(x_sub, y_sub).fit()
+
+
+class RunningLinearStats:
+    """
+    有効点集合の十分統計量 (n, Σx, Σy, Σxy, Σx², Σy²) を保持し、
+    点の追加・削除を変更点数 k に比例する計算量で反映する（インタラクティブ再計算用）。
+    y は複数の目的変数 (k_targets, n) をまとめて扱う。
+    桁落ちを抑えるため、x・y は全データの平均で平行移動してから和を取る。
+    x または y が有限でない点（振幅 <= 0 の log 振幅など）はその目的変数の和にだけ入れない
+    （統計量は目的変数ごとに持つ）。NaN を和に入れると削除しても NaN が残るため。
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray):
+        x = np.asarray(x, dtype=float)
+        y = np.atleast_2d(np.asarray(y, dtype=float))
+        finite = np.isfinite(x)[None, :] & np.isfinite(y)
+        self.x_shift = float(np.nanmean(x)) if np.isfinite(x).any() else 0.0
+        self.y_shift = np.array([np.nanmean(row[f]) if f.any() else 0.0 for row, f in zip(y, finite)])
+        self.w = finite.astype(float)
+        self.x = np.where(finite, x[None, :] - self.x_shift, 0.0)
+        self.y = np.where(finite, y - self.y_shift[:, None], 0.0)
+        self.reset(np.zeros(x.shape[0], dtype=bool))
+
+    def reset(self, mask: np.ndarray) -> None:
+        """mask の点から統計量を作り直す。"""
+        k = self.y.shape[0]
+        self.n = np.zeros(k, dtype=int)
+        self.sx = np.zeros(k)
+        self.sxx = np.zeros(k)
+        self.sy = np.zeros(k)
+        self.syy = np.zeros(k)
+        self.sxy = np.zeros(k)
+        self.add(np.where(mask)[0])
+
+    def _accumulate(self, indices: np.ndarray, sign: float) -> None:
+        if len(indices) == 0:
+            return
+        xs = self.x[:, indices]
+        ys = self.y[:, indices]
+        self.n += int(sign) * self.w[:, indices].sum(axis=1).astype(int)
+        self.sx += sign * xs.sum(axis=1)
+        self.sxx += sign * (xs * xs).sum(axis=1)
+        self.sy += sign * ys.sum(axis=1)
+        self.syy += sign * (ys * ys).sum(axis=1)
+        self.sxy += sign * (ys * xs).sum(axis=1)
+
+    def add(self, indices: np.ndarray) -> None:
+        self._accumulate(np.asarray(indices, dtype=int), 1.0)
+
+    def remove(self, indices: np.ndarray) -> None:
+        self._accumulate(np.asarray(indices, dtype=int), -1.0)
+
+    def fit(self, target: int = 0) -> FitResult:
+        """現在の統計量から目的変数 target の回帰結果を返す（有限な点だけを使う）。"""
+        n = int(self.n[target])
+        nan = float("nan")
+        if n < 2:
+            return FitResult(nan, nan, nan, False, stderr=nan, intercept_stderr=nan, resid_var=nan, n=n, covariance=nan)
+        sx, sxx = self.sx[target], self.sxx[target]
+        sxx_c = n * sxx - sx * sx
+        sxy_c = n * self.sxy[target] - sx * self.sy[target]
+        syy_c = n * self.syy[target] - self.sy[target] * self.sy[target]
+        if sxx_c <= 0:
+            return FitResult(nan, nan, nan, False, stderr=nan, intercept_stderr=nan, resid_var=nan, n=n, covariance=nan)
+        slope = sxy_c / sxx_c
+        intercept_shifted = (self.sy[target] - slope * sx) / n
+        intercept = intercept_shifted + self.y_shift[target] - slope * self.x_shift
+        r2 = min(sxy_c * sxy_c / (sxx_c * syy_c), 1.0) if syy_c > 0 else 0.0
+        resid_var = max(syy_c - slope * sxy_c, 0.0) / n / (n - 2) if n > 2 else float("nan")
+        stderr = float(np.sqrt(resid_var * n / sxx_c)) if n > 2 else float("nan")
+        return FitResult(
+            slope=float(slope),
+            intercept=float(intercept),
+            r2=float(r2),
+            is_valid=True,
+            stderr=stderr,
+            resid_var=float(resid_var),
+            n=n,
+        )
@@ -3,12 +3,21 @@ from matplotlib.widgets import SpanSelector, Button
 import matplotlib.ticker as ticker
 import numpy as np
 from .datamodels import RawData, AnalysisResult
-from . import analyzer  # 新しいモジュールを使用
+from . import analyzer, fitting, physics, pipeline
+from .blit_renderer import BlitRenderer
 
 class TWAInteractivePlotter:
-    def __init__(self, raw_data: RawData, config):
+    def __init__(self, raw_data: RawData, config, show_frame_time: bool = False, fit_method=None,
+                 robust_method=None, excluded_indices=None, fit_range=None):
         self.raw = raw_data
         self.config = config
+        # 確定時（finalize_result）の回帰方法。操作中のプレビューは常に通常の最小二乗
+        self.fit_method = fit_method
+        # 除外済みにする点: excluded_indices（前回の AnalysisResult.excluded_indices など）を指定すればその点、
+        # 無ければ robust_method（None なら config.ROBUST_METHOD）のロバスト回帰で選択範囲内の外れ値を求める
+        # （バッチ処理の analyzer.exclude_outliers と同じ判定。範囲を選び直すたびに判定し直す）
+        self.robust_method = robust_method or getattr(config, "ROBUST_METHOD", "none")
+        self.auto_exclude = excluded_indices is None and self.robust_method != "none"
         
         # 最終的な解析結果を保持する変数
         self.result: AnalysisResult = None
@@ -16,17 +25,45 @@ class TWAInteractivePlotter:
         # --- データ準備 ---
         self.x_data = raw_data.df[config.COL_FREQ_SQRT].values
         self.phase_data = raw_data.df[config.COL_PHASE].values
+        amp_data = raw_data.df[config.COL_AMP].values
+        self.thickness = raw_data.metadata.get("試料厚", config.DEFAULT_THICKNESS_UM)
         
         # --- 状態管理 ---
         self.n_points = len(self.x_data)
-        self.manual_mask = np.ones(self.n_points, dtype=bool) 
-        self.range_mask = np.ones(self.n_points, dtype=bool) 
+        # 初期の選択範囲はバッチ処理と同じ窓（fit_range 指定時はその範囲、未指定時は auto_range の自動選択）。
+        # 選べなければ全点
+        initial_indices, _ = pipeline.select_fit_indices(raw_data, config, fit_range)
+        self.range_mask = np.ones(self.n_points, dtype=bool)
+        if initial_indices is not None:
+            self.range_mask[:] = False
+            self.range_mask[np.asarray(initial_indices, dtype=int)] = True
+        # クリックで状態を指定した点（user_set）はその状態（user_keep）を優先し、それ以外は自動判定（auto_outlier）に従う
+        self.user_set = np.zeros(self.n_points, dtype=bool)
+        self.user_keep = np.ones(self.n_points, dtype=bool)
+        self.auto_outlier = np.zeros(self.n_points, dtype=bool)
+        if excluded_indices is not None:
+            self.user_set[np.asarray(excluded_indices, dtype=int)] = True
+            self.user_keep[np.asarray(excluded_indices, dtype=int)] = False
+        self._auto_stale = True
+
+        # 有効点の十分統計量（位相, log(Amp*sqrt(f))）。点の出入りだけを差分更新する
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.y_amp_log = np.log(amp_data * self.x_data)
+        self.stats = fitting.RunningLinearStats(self.x_data, np.vstack([self.phase_data, self.y_amp_log]))
+        self.active_mask = np.zeros(self.n_points, dtype=bool)
         
         # --- プロット初期化 ---
         self.fig, self.ax = plt.subplots(figsize=(10, 7))
         plt.subplots_adjust(bottom=0.2) 
 
         self.setup_plot()
+
+        # 選択点・除外点・フィット線・タイトルだけを blit で更新する
+        self.renderer = BlitRenderer(
+            self.fig,
+            [self.scat_phase_valid, self.scat_phase_excl, self.line_fit_phase, self.ax.title],
+            show_frame_time=show_frame_time,
+        )
         
         # --- インタラクション ---
         self.span = SpanSelector(
@@ -34,6 +71,8 @@ class TWAInteractivePlotter:
             props=dict(alpha=0.1, facecolor='green'),
             interactive=True, drag_from_anywhere=True
         )
+        if initial_indices is not None:
+            self.span.extents = (float(np.min(self.x_data[self.range_mask])), float(np.max(self.x_data[self.range_mask])))
         self.fig.canvas.mpl_connect('pick_event', self.on_point_pick)
         
         # --- ボタン ---
@@ -48,6 +87,11 @@ class TWAInteractivePlotter:
         
         plt.show()
 
+        # 予約中の再計算を反映し、ウィンドウを閉じた時点の選択で AnalysisResult を確定する
+        self.renderer.flush(draw=False)
+        self.renderer.disconnect()
+        self.finalize_result()
+
     def setup_plot(self):
         self.ax.set_xlabel(r'$\sqrt{f}$ [Hz$^{0.5}$]')
         self.ax.set_ylabel(r'Phase [rad]', color='black')
@@ -77,49 +121,96 @@ class TWAInteractivePlotter:
 
     def on_range_select(self, xmin, xmax):
         self.range_mask = (self.x_data >= xmin) & (self.x_data <= xmax)
-        self.update_plot_and_calc()
+        # 自動除外は次の再計算で新しい範囲について判定し直す（ドラッグ中は debounce でまとめられる）
+        self._auto_stale = True
+        self.renderer.request(self.update_plot_and_calc)
 
     def on_point_pick(self, event):
         if event.artist != self.scat_phase_all:
             return
         ind = event.ind
-        self.manual_mask[ind] = ~self.manual_mask[ind]
-        self.update_plot_and_calc()
+        keep = self.keep_mask()
+        self.user_set[ind] = True
+        self.user_keep[ind] = ~keep[ind]
+        self.renderer.request(self.update_plot_and_calc)
+
+    def keep_mask(self) -> np.ndarray:
+        """除外状態でない点の mask（クリックで指定した点はその状態、それ以外は自動除外の判定）。"""
+        return np.where(self.user_set, self.user_keep, ~self.auto_outlier)
+
+    def _refresh_auto_outliers(self):
+        """選択範囲内の点を analyzer.exclude_outliers（バッチ処理と同じ判定）で判定し直す。"""
+        self._auto_stale = False
+        self.auto_outlier[:] = False
+        if not self.auto_exclude:
+            return
+        with np.errstate(invalid='ignore', divide='ignore'):
+            _, excluded = analyzer.exclude_outliers(
+                self.x_data, self.phase_data, self.y_amp_log, np.flatnonzero(self.range_mask).tolist(),
+                self.robust_method, getattr(self.config, "ROBUST_THRESHOLD", 3.0),
+            )
+        self.auto_outlier[np.asarray(excluded, dtype=int)] = True
 
     def on_complete(self, event):
         plt.close(self.fig)
 
+    def finalize_result(self):
+        """現在の選択範囲で AnalysisResult を生成する（操作中はプレビュー値のみ計算）。"""
+        active_indices = np.where(self.active_mask)[0]
+        if len(active_indices) < 2:
+            self.result = None
+            return self.result
+        # 選択は画面で確定済みなので、ここでは自動除外を行わない
+        self.result = analyzer.run_analysis(
+            self.raw, self.config, list(active_indices), method=self.fit_method, robust="none"
+        )
+        self.result.robust_method = self.robust_method
+        self.result.excluded_indices = np.flatnonzero(self.range_mask & ~self.keep_mask()).tolist()
+        return self.result
+
+    def _sync_stats(self, new_active: np.ndarray):
+        """有効点の変化分だけ十分統計量を更新する。"""
+        changed = np.flatnonzero(new_active != self.active_mask)
+        if len(changed) > int(new_active.sum()):
+            # 入れ替わりが多い場合は作り直した方が速く、誤差も蓄積しない
+            self.stats.reset(new_active)
+        else:
+            self.stats.add(changed[new_active[changed]])
+            self.stats.remove(changed[~new_active[changed]])
+        self.active_mask = new_active
+
     def update_plot_and_calc(self):
-        active_mask = self.range_mask & self.manual_mask
-        active_indices = np.where(active_mask)[0]
-        excluded_mask = self.range_mask & (~self.manual_mask)
+        if self._auto_stale:
+            self._refresh_auto_outliers()
+        keep = self.keep_mask()
+        active_mask = self.range_mask & keep
+        excluded_mask = self.range_mask & (~keep)
+        self._sync_stats(active_mask)
 
         # 表示更新
         self.scat_phase_valid.set_offsets(np.c_[self.x_data[active_mask], self.phase_data[active_mask]])
         self.scat_phase_excl.set_offsets(np.c_[self.x_data[excluded_mask], self.phase_data[excluded_mask]])
 
-        if len(active_indices) < 2:
+        fit_phase = self.stats.fit(0)
+        fit_amp = self.stats.fit(1)
+        if not fit_phase.is_valid:
             self.line_fit_phase.set_data([], [])
             self.ax.set_title("Select at least 2 points")
-            self.fig.canvas.draw_idle()
-            self.result = None
             return
 
-        # =========================================================
-        # ★Analyzerに委譲
-        # =========================================================
-        self.result = analyzer.run_analysis(self.raw, self.config, list(active_indices))
-        # =========================================================
+        # 十分統計量からのプレビュー（AnalysisResult は finalize_result で生成）
+        alpha_phase, alpha_amp, alpha_ratio = analyzer.alphas_from_fits(fit_phase, fit_amp, self.thickness)
+        x_active = self.x_data[active_mask]
+        x_lo, x_hi = np.min(x_active), np.max(x_active)
+        kd_lo, kd_hi = physics.calculate_kd(np.array([x_lo, x_hi]) ** 2, alpha_phase, self.thickness)
 
         # Fit線の描画
-        x_draw = np.linspace(np.min(self.x_data[active_mask]), np.max(self.x_data[active_mask]), 10)
-        self.line_fit_phase.set_data(x_draw, self.result.slope_phase * x_draw + self.result.intercept_phase)
+        x_draw = np.linspace(x_lo, x_hi, 10)
+        self.line_fit_phase.set_data(x_draw, fit_phase.slope * x_draw + fit_phase.intercept)
 
-        # タイトル更新 (Analyzerの結果を使用)
         title_text = (
-            f"Phase $\\alpha$: {self.result.alpha_phase:.2e} ($R^2$={self.result.r2_phase:.3f})\n"
-            f"Amp $\\alpha$: {self.result.alpha_amp:.2e} ($R^2$={self.result.r2_amp:.3f}) | Ratio: {self.result.alpha_ratio:.2f}\n"
-            f"kd: {self.result.kd_min:.2f} - {self.result.kd_max:.2f}"
+            f"Phase $\\alpha$: {alpha_phase:.2e} ($R^2$={fit_phase.r2:.3f})\n"
+            f"Amp $\\alpha$: {alpha_amp:.2e} ($R^2$={fit_amp.r2:.3f}) | Ratio: {alpha_ratio:.2f}\n"
+            f"kd: {kd_lo:.2f} - {kd_hi:.2f}"
         )
         self.ax.set_title(title_text)
-        self.fig.canvas.draw_idle()
\ No newline at end of file
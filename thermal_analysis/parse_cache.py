@@ -0,0 +1,108 @@
+"""
+RawData の永続パースキャッシュ（.npz 形式）
+
+生データファイルのパース結果（正規化済み DataFrame とメタデータ）を
+列ごとの numpy 配列として .npz に保存し、次回以降の読み込みで再利用する。
+キャッシュキーは (絶対パス, ファイルサイズ, 更新時刻, パーサーバージョン, 読み込みオプション)。
+キャッシュディレクトリの合計サイズが上限を超えた場合は、最終利用が古いものから削除する。
+"""
+import hashlib
+import json
+import os
+from typing import Optional
+
+try:
+    from .datamodels import RawData
+    from . import columnar
+except ImportError:
+    from datamodels import RawData
+    import columnar
+
+try:
+    import config
+    DEFAULT_CACHE_DIR = config.paths.CACHE_DIR
+    DEFAULT_CACHE_MAX_BYTES = config.paths.CACHE_MAX_BYTES
+except (ImportError, AttributeError):
+    DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), "data", "cache")
+    DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+CACHE_EXT = ".npz"
+
+
+def cache_key(filepath: str, parser_version: int, *options) -> Optional[str]:
+    """
+    ファイルの状態とパーサー設定からキャッシュキー（ハッシュ文字列）を生成する。
+    options には区切り文字や読み込みモードなど、パース結果に影響する引数を渡す。
+    """
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    ident = json.dumps(
+        [os.path.abspath(filepath), st.st_size, st.st_mtime_ns, int(parser_version), *options],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+
+def load(key: str, filepath: str, cache_dir: str = DEFAULT_CACHE_DIR) -> Optional[RawData]:
+    """キャッシュが存在すれば RawData を復元して返す。無い・壊れている場合は None。"""
+    path = os.path.join(cache_dir, key + CACHE_EXT)
+    if not os.path.exists(path):
+        return None
+    try:
+        df, header = columnar.read_npz(path)
+        os.utime(path)  # 最終利用時刻を更新（削除順序に使用）
+    except (OSError, ValueError, KeyError):
+        return None
+    return RawData(df=df, metadata=header["metadata"], filepath=filepath)
+
+
+def store(key: str, raw_data: RawData, cache_dir: str = DEFAULT_CACHE_DIR,
+          max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> Optional[str]:
+    """RawData をキャッシュに保存し、上限サイズを超えた分を削除する。書き込み失敗時は None。"""
+    path = os.path.join(cache_dir, key + CACHE_EXT)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            columnar.write_npz(f, raw_data.df, {"metadata": raw_data.metadata})
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    evict(cache_dir, max_bytes)
+    return path
+
+
+def evict(cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> int:
+    """合計サイズが max_bytes 以下になるまで、最終利用が古いキャッシュから削除する。削除数を返す。"""
+    try:
+        names = [n for n in os.listdir(cache_dir) if n.endswith(CACHE_EXT)]
+    except OSError:
+        return 0
+    entries = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def clear(cache_dir: str = DEFAULT_CACHE_DIR) -> int:
+    """キャッシュをすべて削除する。"""
+    return evict(cache_dir, max_bytes=0)
@@ -11,6 +11,15 @@ def calculate_alpha_from_slope(slope: float, thickness_um: float) -> float:
     alpha = (np.pi * (L_meter**2)) / (slope**2)
     return alpha
 
+def calculate_alpha_stderr_from_slope(slope: float, slope_stderr: float, thickness_um: float) -> float:
+    """
+    傾きの標準誤差から alpha の標準誤差を1次の誤差伝播で求める（厚みは誤差なしとして扱う）
+    alpha = pi * L^2 / slope^2
+           => sigma_alpha = |d alpha / d slope| * sigma_slope = 2 * alpha * sigma_slope / |slope|
+    """
+    L_meter = thickness_um * 1e-6
+    return 2.0 * np.pi * (L_meter**2) * slope_stderr / np.abs(slope) ** 3
+
 def calculate_kd(freq_array: np.ndarray, alpha: float, thickness_um: float) -> np.ndarray:
     """
     各周波数における kd を計算
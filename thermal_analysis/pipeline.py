@@ -0,0 +1,336 @@
+"""
+データロガー CSV から位置ごとの熱拡散率までを一括で処理するパイプライン
+
+従来は freq_sweep_summary が位置別 CSV を書き出し、run_twa_analyzer がそれを再パースして
+results.json を書き、サマリーがそれを再度 glob する 3 段階だった。
+ここでは位置別の集約表をメモリ上で RawData に変換して analyzer.run_analysis に直接渡し、
+解析範囲は fit_range 指定または auto_range で自動選択する。
+中間ファイル（位置別 CSV / 統合ストア / ケースディレクトリ）は出力先を指定した場合のみ書き出す。
+"""
+import argparse
+import os
+import shutil
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .datamodels import RawData, AnalysisResult
+from . import (
+    analyzer, auto_range, file_parser, position_store, sample_gating, spatial_index, sweep_summary, twa_model, visualizer,
+)
+
+try:
+    from config import AppConfig as DEFAULT_CONFIG
+except ImportError:
+    DEFAULT_CONFIG = None
+
+# 結果テーブルに展開する AnalysisResult の項目
+RESULT_COLUMNS = [
+    "alpha_phase", "r2_phase", "slope_phase", "intercept_phase",
+    "alpha_amp", "r2_amp", "slope_amp", "intercept_amp",
+    "alpha_ratio", "alpha_phase_err", "alpha_amp_err", "alpha_joint", "alpha_joint_err",
+    "freq_range_min", "freq_range_max", "kd_min", "kd_max",
+]
+# model_fit 時に結果テーブルに加える twa_model.ModelFitResult の項目（列名は model_ を前置）
+MODEL_COLUMNS = ["alpha", "alpha_stderr", "kd_min", "kd_max", "rms_log_amp", "rms_phase", "nfev", "success"]
+
+
+def select_fit_indices(
+    raw_data: RawData,
+    config=None,
+    fit_range: Optional[Tuple[float, float]] = None,
+    **auto_range_options,
+) -> Tuple[Optional[List[int]], Optional[auto_range.RangeSelection]]:
+    """
+    解析に使う点のインデックスを決める。戻り値は (インデックス, 自動選択結果)。
+    fit_range 指定時は sqrt_TW_freq がその範囲内の点（2点未満なら None）、
+    未指定時は auto_range.select_fit_window で窓を選ぶ（候補が無ければ None）。
+    auto_range_options は select_fit_window にそのまま渡す（min_points, criterion 等）。
+    """
+    config = config or DEFAULT_CONFIG
+    x = raw_data.df[config.COL_FREQ_SQRT].to_numpy(dtype=float)
+    if fit_range is None:
+        selection = auto_range.select_fit_window(
+            x,
+            raw_data.df[config.COL_PHASE].to_numpy(dtype=float),
+            raw_data.df[config.COL_AMP].to_numpy(dtype=float),
+            **auto_range_options,
+        )
+        if selection is None:
+            return None, None
+        return selection.indices, selection
+
+    lo, hi = fit_range
+    indices = np.where(np.isfinite(x) & (x >= lo) & (x <= hi))[0]
+    if len(indices) < 2:
+        return None, None
+    return indices.tolist(), None
+
+
+def save_case(raw_data: RawData, result: AnalysisResult, output_root_dir: str, config=None,
+              input_data_format: str = "npz") -> str:
+    """
+    1ケース分の出力（results.json, input_data, 元データのコピー, 位相・振幅のグラフ）を
+    output_root_dir/<元ファイル名> に保存し、ケースディレクトリを返す。
+    元データがファイルとして存在しない場合（メモリ上で生成した場合）はコピーを省略する。
+    保存後に output_root_dir の更新トークン（spatial_index.RESULTS_STAMP_FILENAME）を書き直し、
+    保存済みの位置インデックスが作り直されるようにする。
+    """
+    config = config or DEFAULT_CONFIG
+    case_name = os.path.splitext(os.path.basename(raw_data.filepath))[0]
+    case_dir = os.path.join(output_root_dir, case_name)
+    os.makedirs(case_dir, exist_ok=True)
+
+    result.save_to_json(case_dir)
+    raw_data.save_input_data(case_dir, fmt=input_data_format)
+    if os.path.isfile(raw_data.filepath):
+        shutil.copy(raw_data.filepath, os.path.join(case_dir, "raw_data.txt"))
+    visualizer.save_phase_plot(raw_data, result, config, case_dir)
+    visualizer.save_amplitude_plot(raw_data, result, config, case_dir)
+    spatial_index.touch_results_stamp(output_root_dir)
+    return case_dir
+
+
+def position_raw_data(summary: pd.DataFrame, x: float, y: float, z: float, filepath: str,
+                      thickness_um: Optional[float] = None) -> RawData:
+    """
+    1位置分の集約表から、位置別 CSV を file_parser.load_from_text で読んだ場合と同じ RawData を作る。
+    """
+    x_key, y_key, z_key = file_parser.canonical_twa_position_keys()
+    df = summary[sweep_summary.OUTPUT_COLUMNS].reset_index(drop=True)
+    # 位置別 CSV の #META 行と同じく小数点以下6桁に丸める
+    metadata = {x_key: round(x, 6), y_key: round(y, 6), z_key: round(z, 6)}
+    if thickness_um is not None:
+        metadata["試料厚"] = float(thickness_um)
+    if file_parser.PHASE_COL_NAME in df.columns:
+        df = file_parser.adjust_phase_continuity(df, file_parser.PHASE_COL_NAME)
+    return RawData(df=df, metadata=metadata, filepath=filepath)
+
+
+def results_table(coords: np.ndarray, results: Sequence[Optional[AnalysisResult]],
+                  model_fits: Optional[Sequence[twa_model.ModelFitResult]] = None) -> pd.DataFrame:
+    """
+    位置 → AnalysisResult の表を作る。index は position_id、列は x_pos, y_pos, z_pos,
+    n_points（解析に使った点数）, n_excluded（外れ値として除いた点数）, RESULT_COLUMNS と result（AnalysisResult。解析できなかった位置は None）。
+    model_fits を渡した場合は MODEL_COLUMNS を model_<項目> 列として加える（解析範囲が選べなかった位置も含む）。
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    table = pd.DataFrame(
+        {"x_pos": coords[:, 0], "y_pos": coords[:, 1], "z_pos": coords[:, 2]},
+        index=pd.RangeIndex(len(results), name="position_id"),
+    )
+    table["n_points"] = [len(r.used_indices) if r is not None else 0 for r in results]
+    table["n_excluded"] = [len(r.excluded_indices) if r is not None else 0 for r in results]
+    for name in RESULT_COLUMNS:
+        table[name] = [
+            float(getattr(r, name)) if r is not None and getattr(r, name) is not None else np.nan for r in results
+        ]
+    if model_fits is not None:
+        for name in MODEL_COLUMNS:
+            table[f"model_{name}"] = [getattr(m, name) for m in model_fits]
+    table["result"] = pd.Series(list(results), index=table.index, dtype=object)
+    return table
+
+
+def run_pipeline(
+    input_csv: str,
+    tolerance_hz: float = 3.0,
+    fit_range: Optional[Tuple[float, float]] = None,
+    thickness_um: Optional[float] = None,
+    config=None,
+    summary_dir: Optional[str] = None,
+    summary_format: str = "csv",
+    case_dir: Optional[str] = None,
+    input_data_format: str = "npz",
+    gate: Optional[sample_gating.SampleGate] = None,
+    fit_method: Optional[str] = None,
+    robust: Optional[str] = None,
+    model_fit: bool = False,
+    **auto_range_options,
+) -> pd.DataFrame:
+    """
+    データロガー CSV を読み、位置ごとに「周波数クラスタ集約 → 解析範囲選択 → run_analysis」を
+    メモリ上で行って、位置 → AnalysisResult の表（results_table）を返す。
+
+    Parameters:
+      tolerance_hz: 近接周波数を同一クラスタとする閾値 [Hz]（freq_sweep_summary と同じ）
+      fit_range: sqrt_TW_freq の解析範囲。None なら auto_range で位置ごとに自動選択
+      thickness_um: 試料厚 [um]。None なら config.DEFAULT_THICKNESS_UM
+      summary_dir: 指定時のみ freq_sweep_summary と同じ集約出力を書き出す（summary_format: csv/store/both）
+      case_dir: 指定時のみ run_twa_analyzer と同じケースディレクトリを位置ごとに書き出す
+      gate: sample_gating.SampleGate。指定時は除外したサンプルを集約・フィットに使わない
+            （summary_dir 指定時は gate_report.csv も書き出す）
+      fit_method: 回帰方法 "ols" / "wls"（None なら config.FIT_METHOD。analyzer.run_analysis を参照）
+      robust: 解析範囲内の外れ値の自動除外 "none" / "huber" / "theilsen" / "ransac"（None なら config.ROBUST_METHOD）
+      model_fit: True なら位置ごとにスイープ全体へ有限厚みモデル（twa_model）も当てはめ、model_* 列と
+                 AnalysisResult.alpha_model を加える（位置順に直前の位置の解から開始する）
+    """
+    config = config or DEFAULT_CONFIG
+    df = sweep_summary.load_logger_csv(input_csv, columns=sweep_summary.summary_input_columns(gate))
+    missing = sorted(set(sweep_summary.SUMMARY_INPUT_COLUMNS) - set(df.columns))
+    if missing:
+        raise ValueError(f"必要な列が不足しています: {missing}")
+
+    df, codes, n_positions, gate_counts = sweep_summary.gated_position_codes(df, gate)
+    coords = sweep_summary.position_coordinates(df, codes, n_positions)
+    table = sweep_summary.summarize_positions(df, codes, tolerance_hz)
+    bounds = np.searchsorted(table["position_id"].to_numpy(), np.arange(n_positions + 1))
+    summaries = [table.iloc[bounds[pid] : bounds[pid + 1]] for pid in range(n_positions)]
+
+    used_filenames: dict = {}
+    filenames = [
+        position_store.unique_position_filename(*map(float, coords[pid]), used_filenames)
+        for pid in range(n_positions)
+    ]
+    if summary_dir is not None:
+        os.makedirs(summary_dir, exist_ok=True)
+        base_metadata = sweep_summary.extract_metadata(input_csv)
+        if gate is not None:
+            base_metadata["sample_gate"] = gate.settings()
+        position_store.write_summary_outputs(
+            summary_dir,
+            summary_format,
+            coords,
+            filenames,
+            summaries,
+            base_metadata,
+            tolerance_hz,
+        )
+        if gate_counts is not None:
+            position_store.write_gate_report(summary_dir, coords, filenames, gate_counts)
+    # ケース名・filename は位置別 CSV と同じにする（CSV を書いた場合はそのパスになる）
+    source_dir = summary_dir if summary_dir is not None else os.path.dirname(os.path.abspath(input_csv))
+    model_fits = fit_summary_models(coords, summaries, thickness_um, config, fit_method) if model_fit else None
+    results = analyze_summaries(
+        coords, filenames, summaries, source_dir,
+        fit_range=fit_range, thickness_um=thickness_um, config=config,
+        case_dir=case_dir, input_data_format=input_data_format, fit_method=fit_method,
+        robust=robust, model_fits=model_fits, **auto_range_options,
+    )
+    return results_table(coords, results, model_fits)
+
+
+def fit_summary_models(
+    coords: np.ndarray,
+    summaries: Sequence[pd.DataFrame],
+    thickness_um: Optional[float] = None,
+    config=None,
+    fit_method: Optional[str] = None,
+    warm_start: bool = True,
+) -> List[twa_model.ModelFitResult]:
+    """位置ごとの集約表の全周波数に有限厚みモデルを当てはめる（位置順にウォームスタート）。"""
+    config = config or DEFAULT_CONFIG
+    cases = []
+    for pid, summary in enumerate(summaries):
+        raw_data = position_raw_data(summary, *(float(v) for v in coords[pid]), "", thickness_um)
+        cases.append(analyzer.model_inputs(raw_data, config, fit_method))
+    return twa_model.fit_twa_model_batch(cases, warm_start=warm_start)
+
+
+def analyze_summaries(
+    coords: np.ndarray,
+    filenames: Sequence[str],
+    summaries: Sequence[pd.DataFrame],
+    source_dir: str,
+    fit_range: Optional[Tuple[float, float]] = None,
+    thickness_um: Optional[float] = None,
+    config=None,
+    case_dir: Optional[str] = None,
+    input_data_format: str = "npz",
+    fit_method: Optional[str] = None,
+    robust: Optional[str] = None,
+    model_fits: Optional[Sequence[twa_model.ModelFitResult]] = None,
+    **auto_range_options,
+) -> List[Optional[AnalysisResult]]:
+    """
+    位置ごとの集約表をそれぞれ解析し、AnalysisResult（範囲が選べなかった位置は None）のリストを返す。
+    filenames は位置別 CSV の名前で、source_dir と合わせて AnalysisResult.filename・ケース名に使う。
+    model_fits（fit_summary_models の結果）を渡すと AnalysisResult.alpha_model・alpha_model_err に記録する。
+    """
+    config = config or DEFAULT_CONFIG
+    results: List[Optional[AnalysisResult]] = []
+    for pid, summary in enumerate(summaries):
+        x, y, z = (float(v) for v in coords[pid])
+        raw_data = position_raw_data(summary, x, y, z, os.path.join(source_dir, filenames[pid]), thickness_um)
+        indices, _ = select_fit_indices(raw_data, config, fit_range, **auto_range_options)
+        if indices is None:
+            results.append(None)
+            continue
+        result = analyzer.run_analysis(raw_data, config, indices, method=fit_method, robust=robust)
+        if model_fits is not None:
+            result.alpha_model = model_fits[pid].alpha
+            result.alpha_model_err = model_fits[pid].alpha_stderr
+        results.append(result)
+        if case_dir is not None:
+            save_case(raw_data, result, case_dir, config, input_data_format)
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="data_logger CSV から位置ごとの熱拡散率を一括で求めます（中間ファイルは指定時のみ出力）。"
+    )
+    parser.add_argument("input_csv", help="解析対象の data_logger CSV")
+    parser.add_argument("--freq-tolerance-hz", type=float, default=3.0, help="近接周波数を同一クラスタとして扱う閾値 [Hz]")
+    parser.add_argument(
+        "--fit-range", type=float, nargs=2, default=None, metavar=("LOW", "HIGH"),
+        help="解析範囲（sqrt_TW_freq）。省略時は位置ごとに自動選択",
+    )
+    parser.add_argument("--thickness-um", type=float, default=None, help="試料厚 [um]")
+    parser.add_argument("--results-csv", default=None, help="位置ごとの結果表の出力先 CSV")
+    parser.add_argument("--summary-dir", default=None, help="位置別の周波数集約を書き出すディレクトリ")
+    parser.add_argument(
+        "--summary-format", choices=position_store.OUTPUT_FORMATS, default="csv",
+        help="--summary-dir の出力形式",
+    )
+    parser.add_argument("--case-dir", default=None, help="位置ごとのケース（results.json 等）を書き出すディレクトリ")
+    parser.add_argument(
+        "--fit-method", choices=analyzer.FIT_METHODS, default=None,
+        help="回帰方法（ols: 通常の最小二乗, wls: theta_sigma・amp_sigma による重み付き）。省略時は config の FIT_METHOD",
+    )
+    parser.add_argument(
+        "--robust", choices=analyzer.ROBUST_METHODS, default=None,
+        help="解析範囲内の外れ値をロバスト回帰で自動除外する（省略時は config の ROBUST_METHOD）",
+    )
+    parser.add_argument(
+        "--model-fit", action="store_true",
+        help="位置ごとにスイープ全体へ有限厚みの温度波応答モデルも当てはめる（model_* 列）",
+    )
+    parser.add_argument("--gate", action="store_true", help="状態列と経過時間でサンプルを選別してから集約する")
+    parser.add_argument("--gate-rules", default=None, help="--gate 時に使う状態列の規則名（カンマ区切り、省略時は全規則）")
+    parser.add_argument("--ignore-initial-seconds", type=float, default=None, help="--gate 時、測定開始から除外する秒数")
+    parser.add_argument("--settle-seconds", type=float, default=None, help="--gate 時、周波数ステップごとに除外する整定時間 [s]")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    gate = None
+    if args.gate:
+        gate_options = {
+            "rules": sample_gating.select_rules(args.gate_rules.split(",") if args.gate_rules else None),
+            "step_tolerance_hz": args.freq_tolerance_hz,
+        }
+        if args.ignore_initial_seconds is not None:
+            gate_options["ignore_initial_s"] = args.ignore_initial_seconds
+        if args.settle_seconds is not None:
+            gate_options["settle_s"] = args.settle_seconds
+        gate = sample_gating.SampleGate(**gate_options)
+    out = run_pipeline(
+        os.path.abspath(args.input_csv),
+        tolerance_hz=args.freq_tolerance_hz,
+        fit_range=tuple(args.fit_range) if args.fit_range else None,
+        thickness_um=args.thickness_um,
+        summary_dir=args.summary_dir,
+        summary_format=args.summary_format,
+        case_dir=args.case_dir,
+        gate=gate,
+        fit_method=args.fit_method,
+        robust=args.robust,
+        model_fit=args.model_fit,
+    )
+    if args.results_csv:
+        out.drop(columns="result").to_csv(args.results_csv)
+        print(f"出力先: {args.results_csv}")
+    print(out.drop(columns="result").to_string())
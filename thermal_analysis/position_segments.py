@@ -0,0 +1,162 @@
+"""
+ステージ座標からの位置識別（数値キー）
+
+データロガー CSV の各行を、Stage_X/Y/Z_um を quantum_um 刻みの整数コードに量子化した値で位置に割り当てる。
+1. 時刻順の連長圧縮: 量子化コードが直前の行と変わる行でセグメントを区切る（再訪は別セグメント）。
+2. 位置の統合: 量子化コードが等しいセグメントを同じ位置とし、tolerance_um 指定時は
+   各軸の差がすべて tolerance_um 以内の位置をさらに連結してまとめる（ステージ読み戻しの揺れ対策）。
+位置番号は最初に現れた順に 0 から振る。文字列キーを行ごとに作らないため長時間ログでも高速に動作する。
+座標が欠損した軸は NAN_CODE に量子化し、従来の文字列キー（"xnan_y..._z..."）と同じく
+欠損の仕方ごとに 1 つの位置として残す（座標の平均はその軸が NaN になる）。
+"""
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+STAGE_COLUMNS = ["Stage_X_um", "Stage_Y_um", "Stage_Z_um"]
+# 量子化の刻み [um]（従来の小数点以下6桁の丸めに相当）
+DEFAULT_QUANTUM_UM = 1e-6
+POSITION_TABLE_COLUMNS = ["position_id", "x_pos", "y_pos", "z_pos", "n_rows", "n_segments", "first_row"]
+# 欠損した軸の量子化コード
+NAN_CODE = np.iinfo(np.int64).min
+
+
+@dataclass
+class PositionSegmentation:
+    """
+    位置識別の結果（行は入力の全行）。
+
+    codes: 行ごとの位置番号
+    segment_starts: 各セグメント（同じ量子化座標が続く区間）の先頭行
+    segment_position: セグメントごとの位置番号
+    table: 位置ごとの表（POSITION_TABLE_COLUMNS。座標は各位置の行の平均）
+    """
+    codes: np.ndarray
+    segment_starts: np.ndarray
+    segment_position: np.ndarray
+    table: pd.DataFrame
+
+    @property
+    def n_positions(self) -> int:
+        return len(self.table)
+
+    @property
+    def coords(self) -> np.ndarray:
+        """(位置数, 3) の座標 [um]。"""
+        return self.table[["x_pos", "y_pos", "z_pos"]].to_numpy(dtype=float)
+
+
+def quantize_positions(xyz: np.ndarray, quantum_um: float = DEFAULT_QUANTUM_UM) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (行数, 3) の座標を quantum_um 刻みの int64 コードにする（欠損した軸は NAN_CODE）。
+    戻り値は (コード, 3 軸とも座標が揃っている行の bool マスク)。
+    """
+    xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    finite = np.isfinite(xyz)
+    q = np.full(xyz.shape, NAN_CODE, dtype=np.int64)
+    q[finite] = np.rint(xyz[finite] / quantum_um).astype(np.int64)
+    return q, finite.all(axis=1)
+
+
+def run_length_segments(q: np.ndarray) -> np.ndarray:
+    """量子化コード (行数, 3) が直前の行と異なる行（と 0 行目）のインデックスを返す。"""
+    n = q.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    change = np.ones(n, dtype=bool)
+    change[1:] = (q[1:] != q[:-1]).any(axis=1)
+    return np.flatnonzero(change)
+
+
+def merge_within_tolerance(coords: np.ndarray, tolerance_um: float) -> np.ndarray:
+    """
+    各軸の差がすべて tolerance_um 以内の点どうしを連結し、連結成分ごとのラベルを返す。
+    ラベルは各成分で最も小さい点番号の順に 0 から振る（出現順を保つ）。
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+
+    n = len(coords)
+    if n <= 1 or tolerance_um <= 0:
+        return np.arange(n)
+    pairs = cKDTree(coords).query_pairs(r=tolerance_um, p=np.inf, output_type="ndarray")
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    # 成分番号を「成分内の最小点番号」の順に振り直す
+    first = np.full(labels.max() + 1, n)
+    np.minimum.at(first, labels, np.arange(n))
+    rank = np.empty_like(first)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+    return rank[labels]
+
+
+def segment_positions(
+    xyz: np.ndarray,
+    quantum_um: float = DEFAULT_QUANTUM_UM,
+    tolerance_um: Optional[float] = None,
+) -> PositionSegmentation:
+    """
+    時刻順の座標 (行数, 3) から位置番号を求める。座標に NaN を含む行も、欠損した軸の組み合わせごとに
+    1 つの位置として扱う（座標の平均は欠損した軸が NaN）。
+    tolerance_um=None なら量子化コードが完全に一致するものだけを同じ位置とする。
+    """
+    xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    q, _ = quantize_positions(xyz, quantum_um)
+
+    starts = run_length_segments(q)
+    # セグメント代表コードを一意化（出現順）して位置にする
+    _, first_seg, seg_unique = np.unique(q[starts], axis=0, return_index=True, return_inverse=True)
+    seg_unique = seg_unique.reshape(-1)
+    order = np.argsort(first_seg, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    segment_position = rank[seg_unique]
+
+    if tolerance_um is not None and len(order) > 1:
+        # 欠損した軸（NAN_CODE）は実在の座標から十分離れた同じ値になるため、欠損の仕方が同じ位置どうしだけが連結しうる
+        unique_xyz = q[starts[first_seg[order]]] * quantum_um
+        segment_position = merge_within_tolerance(unique_xyz, tolerance_um)[segment_position]
+
+    lengths = np.diff(np.append(starts, len(q)))
+    codes = np.repeat(segment_position, lengths)
+    n_positions = int(segment_position.max()) + 1 if len(segment_position) else 0
+
+    n_rows = np.bincount(codes, minlength=n_positions)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.column_stack(
+            [np.bincount(codes, weights=xyz[:, axis], minlength=n_positions) / n_rows for axis in range(3)]
+        ).reshape(-1, 3)
+    first_row = np.full(n_positions, len(codes), dtype=int)
+    np.minimum.at(first_row, segment_position, starts)
+    table = pd.DataFrame(
+        {
+            "position_id": np.arange(n_positions),
+            "x_pos": mean[:, 0],
+            "y_pos": mean[:, 1],
+            "z_pos": mean[:, 2],
+            "n_rows": n_rows,
+            "n_segments": np.bincount(segment_position, minlength=n_positions),
+            "first_row": first_row,
+        },
+        columns=POSITION_TABLE_COLUMNS,
+    )
+    return PositionSegmentation(
+        codes=codes,
+        segment_starts=starts,
+        segment_position=segment_position,
+        table=table,
+    )
+
+
+def segment_frame(
+    df: pd.DataFrame,
+    columns: Sequence[str] = STAGE_COLUMNS,
+    quantum_um: float = DEFAULT_QUANTUM_UM,
+    tolerance_um: Optional[float] = None,
+) -> PositionSegmentation:
+    """DataFrame のステージ座標列（数値化できない値は欠損扱い）から segment_positions を行う。"""
+    xyz = df[list(columns)].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    return segment_positions(xyz, quantum_um=quantum_um, tolerance_um=tolerance_um)
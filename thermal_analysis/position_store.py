@@ -0,0 +1,250 @@
+"""
+位置別周波数スイープ集約の統合ストア（.npz）
+
+freq_sweep_summary の出力を、位置ごとの小さな CSV の代わりに 1 つの列指向テーブルとして保存する。
+テーブルは位置順に並んだ縦長形式（position_id, x_pos, y_pos, z_pos, cluster, sqrt_TW_freq,
+theta, theta_sigma, amp, amp_sigma）で、ヘッダに meta_summary.json と同じ内容と
+位置インデックス（座標と行範囲 [start, stop)）を持つ。
+1 位置だけを読む場合はヘッダから行範囲を求め、その範囲だけをメモリマップで読み出す。
+集約結果一式（位置別 CSV・統合ストア・meta_summary.json・gate_report.csv）の書き出しもここに置き、
+freq_sweep_summary と pipeline の両方から使う。
+"""
+import json
+import os
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import columnar
+except ImportError:
+    import columnar
+
+POSITION_STORE_FILENAME = "position_summary.npz"
+META_SUMMARY_FILENAME = "meta_summary.json"
+# サンプル選別で位置ごとの規則別除外数を書き出すファイル名
+GATE_REPORT_FILENAME = "gate_report.csv"
+# 出力形式: 位置別 CSV / 統合ストア / 両方
+OUTPUT_FORMATS = ("csv", "store", "both")
+STORE_KIND = "position_frequency_summary"
+STORE_VERSION = 1
+
+SUMMARY_COLUMNS = ["sqrt_TW_freq", "theta", "theta_sigma", "amp", "amp_sigma"]
+POSITION_INDEX_COLUMNS = ["position_id", "x_pos", "y_pos", "z_pos", "start", "stop"]
+
+
+def write_position_csv(out_csv_path: str, x: float, y: float, z: float, summary: pd.DataFrame) -> None:
+    """1位置分の集約表を従来形式の CSV（#META,position 行 + SUMMARY_COLUMNS）で書き出す。"""
+    with open(out_csv_path, "w", encoding="utf-8", newline="") as f:
+        f.write(f"#META,position,x_pos,{x:.6f}\n")
+        f.write(f"#META,position,y_pos,{y:.6f}\n")
+        f.write(f"#META,position,z_pos,{z:.6f}\n")
+        summary.to_csv(f, index=False, columns=SUMMARY_COLUMNS)
+
+
+def write_position_store(
+    path: str,
+    coords: np.ndarray,
+    summaries: Sequence[pd.DataFrame],
+    meta_summary: dict,
+    csv_files: Optional[Sequence[str]] = None,
+) -> None:
+    """
+    位置ごとの集約結果を 1 つの .npz に書き出す。
+
+    Parameters:
+      coords: (位置数, 3) の座標 [um]
+      summaries: 位置ごとの集約表（SUMMARY_COLUMNS を持つ、周波数昇順）
+      meta_summary: meta_summary.json と同じ内容（ヘッダに埋め込む）
+      csv_files: 位置ごとの CSV 出力名（エクスポート時の対応付け用、任意）
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    counts = np.array([len(s) for s in summaries], dtype=int)
+    bounds = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+    position_id = np.repeat(np.arange(len(summaries)), counts)
+    cluster = np.arange(int(bounds[-1])) - np.repeat(bounds[:-1], counts)
+
+    if len(summaries) > 0:
+        body = pd.concat([s[SUMMARY_COLUMNS] for s in summaries], ignore_index=True)
+    else:
+        body = pd.DataFrame({c: np.empty(0) for c in SUMMARY_COLUMNS})
+    table = pd.DataFrame(
+        {
+            "position_id": position_id,
+            "x_pos": coords[position_id, 0],
+            "y_pos": coords[position_id, 1],
+            "z_pos": coords[position_id, 2],
+            "cluster": cluster,
+        }
+    )
+    table = pd.concat([table, body.astype(float)], axis=1)
+
+    positions = []
+    for pid in range(len(summaries)):
+        entry = {
+            "position_id": pid,
+            "x_pos": float(coords[pid, 0]),
+            "y_pos": float(coords[pid, 1]),
+            "z_pos": float(coords[pid, 2]),
+            "start": int(bounds[pid]),
+            "stop": int(bounds[pid + 1]),
+        }
+        if csv_files is not None:
+            entry["csv_file"] = csv_files[pid]
+        positions.append(entry)
+
+    header = {
+        "kind": STORE_KIND,
+        "version": STORE_VERSION,
+        "meta_summary": meta_summary,
+        "positions": positions,
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            columnar.write_npz(f, table, header)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_gate_report(output_dir: str, coords: np.ndarray, filenames: Sequence[str], counts: pd.DataFrame) -> str:
+    """位置ごとのサンプル数・採用数・規則別除外数を gate_report.csv に書き出す。"""
+    report = counts.copy()
+    report.insert(0, "file", filenames)
+    for axis, name in enumerate(["x_pos", "y_pos", "z_pos"]):
+        report.insert(axis, name, np.round(np.asarray(coords, dtype=float).reshape(-1, 3)[:, axis], 6))
+    path = os.path.join(output_dir, GATE_REPORT_FILENAME)
+    report.to_csv(path)
+    total, accepted = int(report["n_samples"].sum()), int(report["n_accepted"].sum())
+    print(f"サンプル選別: {total} 件中 {total - accepted} 件を除外しました（内訳: {GATE_REPORT_FILENAME}）。")
+    return path
+
+
+def _format_axis_value(value: float) -> str:
+    if not np.isfinite(value):
+        return "nan"
+    rounded = round(float(value), 6)
+    mag = abs(rounded)
+    text = f"{mag:.6f}".rstrip("0").rstrip(".")
+    if text == "":
+        text = "0"
+    text = text.replace(".", "p")
+    prefix = "m" if rounded < 0 else ""
+    return prefix + text
+
+
+def build_position_filename(x: float, y: float, z: float) -> str:
+    """位置別 CSV のファイル名（例: x0,y0,zm5p7.csv。小数点は p、負号は m）。"""
+    return f"x{_format_axis_value(x)},y{_format_axis_value(y)},z{_format_axis_value(z)}.csv"
+
+
+def unique_position_filename(x: float, y: float, z: float, used_filenames: dict) -> str:
+    """build_position_filename の名前が既出（used_filenames に記録）なら __2, __3, ... を付けて一意にする。"""
+    out_name = build_position_filename(x, y, z)
+    if out_name in used_filenames:
+        used_filenames[out_name] += 1
+        stem, ext = os.path.splitext(out_name)
+        return f"{stem}__{used_filenames[out_name]}{ext}"
+    used_filenames[out_name] = 1
+    return out_name
+
+
+def write_meta_summary(output_dir: str, base_metadata: dict, tolerance_hz: float, position_count: int) -> dict:
+    """ロガー CSV のメタデータに集約条件を加えて meta_summary.json に書き出し、その内容を返す。"""
+    meta_summary = dict(base_metadata)
+    meta_summary["freq_tolerance_hz"] = float(tolerance_hz)
+    meta_summary["position_count"] = int(position_count)
+    meta_summary["output_dir"] = os.path.abspath(output_dir)
+    meta_path = os.path.join(output_dir, META_SUMMARY_FILENAME)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta_summary, f, indent=2, ensure_ascii=False)
+    return meta_summary
+
+
+def write_summary_outputs(
+    output_dir: str,
+    output_format: str,
+    coords: np.ndarray,
+    filenames: Sequence[str],
+    summaries: Sequence[pd.DataFrame],
+    base_metadata: dict,
+    tolerance_hz: float,
+    csv_written: bool = False,
+) -> None:
+    """位置別 CSV・統合ストア・meta_summary.json を書き出す（csv_written=True なら CSV は書き出し済み）。"""
+    if output_format in ("csv", "both") and not csv_written:
+        for (x, y, z), name, summary in zip(coords, filenames, summaries):
+            write_position_csv(os.path.join(output_dir, name), float(x), float(y), float(z), summary)
+    meta_summary = write_meta_summary(output_dir, base_metadata, tolerance_hz, len(summaries))
+    if output_format in ("store", "both"):
+        write_position_store(
+            os.path.join(output_dir, POSITION_STORE_FILENAME), coords, summaries, meta_summary, csv_files=filenames
+        )
+
+
+def read_store_header(path: str) -> dict:
+    header = columnar.read_header(path)
+    if header.get("kind") != STORE_KIND:
+        raise ValueError(f"位置別集約ストアではありません: {path}")
+    return header
+
+
+def read_position_index(path: str) -> pd.DataFrame:
+    """位置インデックス（position_id, x_pos, y_pos, z_pos, start, stop[, csv_file]）を返す。"""
+    positions = read_store_header(path)["positions"]
+    index = pd.DataFrame(positions, columns=POSITION_INDEX_COLUMNS)
+    if positions and "csv_file" in positions[0]:
+        index["csv_file"] = [p.get("csv_file") for p in positions]
+    return index
+
+
+def find_position(index: pd.DataFrame, x: float, y: float, z: float, tolerance_um: float = 1e-3) -> int:
+    """
+    座標が最も近い位置の行（index の行番号）を返す。
+    各軸の差がすべて tolerance_um 以内の位置が無ければ KeyError。
+    """
+    xyz = index[["x_pos", "y_pos", "z_pos"]].to_numpy(dtype=float)
+    diff = np.abs(xyz - np.array([x, y, z], dtype=float))
+    with np.errstate(invalid="ignore"):
+        dist = np.where(np.isfinite(diff).all(axis=1), diff.max(axis=1), np.inf)
+    if dist.size == 0 or not (dist.min() <= tolerance_um):
+        raise KeyError(f"座標 ({x}, {y}, {z}) の位置がストアにありません（許容差 {tolerance_um} um）")
+    return int(np.argmin(dist))
+
+
+def read_position(path: str, x: float, y: float, z: float, tolerance_um: float = 1e-3,
+                  columns: Optional[List[str]] = None) -> tuple:
+    """
+    座標 (x, y, z) の位置の集約表だけを読み出し、(DataFrame, 位置インデックスの1行(dict), meta_summary) を返す。
+    他の位置の行はディスクから読まない。
+    """
+    header = read_store_header(path)
+    index = pd.DataFrame(header["positions"], columns=POSITION_INDEX_COLUMNS)
+    row = find_position(index, x, y, z, tolerance_um)
+    entry = header["positions"][row]
+    df, _ = columnar.read_npz(
+        path,
+        columns=columns if columns is not None else SUMMARY_COLUMNS,
+        mmap=True,
+        rows=slice(entry["start"], entry["stop"]),
+    )
+    return df, entry, header["meta_summary"]
+
+
+def export_position_csvs(path: str, output_dir: str) -> List[str]:
+    """ストアから従来形式の位置別 CSV（#META,position 行付き）を書き出す。書き出したパスを返す。"""
+    header = read_store_header(path)
+    table, _ = columnar.read_npz(path, mmap=True)
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for entry in header["positions"]:
+        name = entry.get("csv_file") or f"position_{entry['position_id']}.csv"
+        out_path = os.path.join(output_dir, name)
+        write_position_csv(
+            out_path, entry["x_pos"], entry["y_pos"], entry["z_pos"], table.iloc[entry["start"] : entry["stop"]]
+        )
+        written.append(out_path)
+    return written
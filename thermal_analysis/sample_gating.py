@@ -0,0 +1,244 @@
+"""
+データロガー CSV のサンプル選別（ゲート）
+
+ロックインの自動調整中・機器の切断中・出力停止中などのサンプルを、周波数クラスタ集約や
+フィッティングの前に除外するための 1 つの bool マスクを状態列からベクトル演算で求める。
+規則は列ごとの GateRule（除外する値 / 許可する値）で与え、加えて
+- 測定開始から ignore_initial_s 秒以内のサンプル（AnalysisConfig.IGNORE_INITIAL_SECONDS）
+- 周波数ステップ（位置または周波数が変わった時点）ごとの先頭 settle_s 秒のサンプル（AnalysisConfig.SETTLING_SECONDS）
+を除外する。値が欠損しているサンプルはその規則では除外しない（状態不明として扱う）。
+SampleGate はチャンク単位で呼べるよう、測定開始時刻と直前のステップを保持する。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .position_segments import STAGE_COLUMNS, quantize_positions
+except ImportError:
+    from position_segments import STAGE_COLUMNS, quantize_positions
+
+try:
+    import config
+    DEFAULT_IGNORE_INITIAL_SECONDS = config.analysis.IGNORE_INITIAL_SECONDS
+    DEFAULT_SETTLING_SECONDS = config.analysis.SETTLING_SECONDS
+except (ImportError, AttributeError):
+    DEFAULT_IGNORE_INITIAL_SECONDS = 0.0
+    DEFAULT_SETTLING_SECONDS = 0.0
+
+INITIAL_RULE = "initial"
+SETTLING_RULE = "settling"
+TIME_COLUMNS = ["Elapsed_s", "Sys_Timestamp"]
+# ステップ判定に使う周波数列（指令値の FG を優先し、無ければロックイン参照周波数）
+STEP_FREQ_COLUMNS = ["FG_Freq_Hz", "LI_RefFreq_Hz"]
+
+
+@dataclass(frozen=True)
+class GateRule:
+    """
+    列 column の値による除外規則。reject の値と一致するサンプル、
+    または accept を指定した場合はそのいずれとも一致しないサンプルを除外する。
+    """
+    name: str
+    column: str
+    reject: Tuple = ()
+    accept: Optional[Tuple] = None
+
+
+DEFAULT_GATE_RULES: Tuple[GateRule, ...] = (
+    GateRule("stage_disconnected", "Stage_Connected", reject=(False,)),
+    GateRule("stage_mock", "Stage_IsMock", reject=(True,)),
+    GateRule("lockin_disconnected", "LI_Connected", reject=(False,)),
+    GateRule("lockin_not_measuring", "LI_Status", accept=("measuring",)),
+    GateRule("lockin_auto_adjust", "LI_AutoAdjustActive", reject=(True,)),
+    GateRule("fg_output_off", "FG_Output", reject=(False,)),
+)
+
+
+def select_rules(names: Optional[Sequence[str]] = None,
+                 rules: Sequence[GateRule] = DEFAULT_GATE_RULES) -> Tuple[GateRule, ...]:
+    """rules から名前で規則を選ぶ（None なら全規則）。未知の名前は ValueError。"""
+    if names is None:
+        return tuple(rules)
+    by_name = {r.name: r for r in rules}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise ValueError(f"未知の選別規則です: {unknown}（使用可能: {list(by_name)}）")
+    return tuple(by_name[n] for n in names)
+
+
+def gate_input_columns(rules: Sequence[GateRule] = DEFAULT_GATE_RULES) -> List[str]:
+    """ゲートの判定に読み込む列（状態列・時間列・ステップ判定用の周波数列）。"""
+    columns = [r.column for r in rules] + TIME_COLUMNS + STEP_FREQ_COLUMNS
+    return list(dict.fromkeys(columns))
+
+
+def _as_bool(series: pd.Series) -> pd.Series:
+    """"True"/"False" 文字列なども含めて nullable boolean に揃える。"""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.astype("boolean")
+    text = series.astype("string").str.strip().str.lower()
+    return text.map({"true": True, "false": False, "1": True, "0": False}).astype("boolean")
+
+
+def rule_rejects(series: pd.Series, rule: GateRule) -> np.ndarray:
+    """規則 rule で除外するサンプルの bool 配列（欠損値は除外しない）。"""
+    values = tuple(rule.accept) if rule.accept is not None else tuple(rule.reject)
+    if values and all(isinstance(v, (bool, np.bool_)) for v in values):
+        series = _as_bool(series)
+    elif not pd.api.types.is_numeric_dtype(series.dtype):
+        series = series.astype("string").str.strip()
+    hit = series.isin(values).fillna(False).to_numpy(dtype=bool)
+    if rule.accept is None:
+        return hit
+    return series.notna().to_numpy(dtype=bool) & ~hit
+
+
+def _elapsed_seconds(df: pd.DataFrame) -> np.ndarray:
+    for name in TIME_COLUMNS:
+        if name in df.columns:
+            t = pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+            if np.isfinite(t).any():
+                return t
+    return np.full(len(df), np.nan)
+
+
+@dataclass
+class GateResult:
+    """
+    ゲートの結果。accepted は採用するサンプル、rejected は規則名ごとの除外サンプル
+    （規則は独立に判定するため、1 サンプルが複数の規則で除外されうる）。
+    """
+    accepted: np.ndarray
+    rejected: Dict[str, np.ndarray]
+
+    def counts(self, codes: np.ndarray, n_groups: int) -> pd.DataFrame:
+        """位置コードごとのサンプル数・採用数・規則ごとの除外数の表（index は位置コード）。"""
+        codes = np.asarray(codes, dtype=int)
+        table = pd.DataFrame(
+            {
+                "n_samples": np.bincount(codes, minlength=n_groups),
+                "n_accepted": np.bincount(codes, weights=self.accepted, minlength=n_groups).astype(int),
+            },
+            index=pd.RangeIndex(n_groups, name="position_id"),
+        )
+        for name, mask in self.rejected.items():
+            table[name] = np.bincount(codes, weights=mask, minlength=n_groups).astype(int)
+        return table
+
+
+class SampleGate:
+    """
+    状態列・経過時間からサンプルの採否を判定する。apply はファイル先頭から順にチャンクを渡して呼んでよく、
+    測定開始時刻・直前サンプルのステップ（量子化座標と周波数）・ステップ開始時刻を次の呼び出しへ持ち越す。
+    新しいファイルを処理する前には reset() を呼ぶこと。
+    step_tolerance_hz: 隣接サンプルの周波数差がこれを超えたら新しい周波数ステップとみなす
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[GateRule] = DEFAULT_GATE_RULES,
+        ignore_initial_s: float = DEFAULT_IGNORE_INITIAL_SECONDS,
+        settle_s: float = DEFAULT_SETTLING_SECONDS,
+        step_tolerance_hz: float = 3.0,
+    ):
+        self.rules = tuple(rules)
+        self.ignore_initial_s = float(ignore_initial_s)
+        self.settle_s = float(settle_s)
+        self.step_tolerance_hz = float(step_tolerance_hz)
+        self.reset()
+
+    def reset(self) -> None:
+        self._t0: Optional[float] = None
+        self._last_q: Optional[np.ndarray] = None
+        self._last_f = np.nan
+        self._step_t = np.nan
+
+    @property
+    def rule_names(self) -> List[str]:
+        names = [r.name for r in self.rules]
+        if self.ignore_initial_s > 0:
+            names.append(INITIAL_RULE)
+        if self.settle_s > 0:
+            names.append(SETTLING_RULE)
+        return names
+
+    def settings(self) -> dict:
+        """meta_summary 等に記録する設定内容。"""
+        return {
+            "rules": [
+                {"name": r.name, "column": r.column, "reject": list(r.reject),
+                 **({"accept": list(r.accept)} if r.accept is not None else {})}
+                for r in self.rules
+            ],
+            "ignore_initial_s": self.ignore_initial_s,
+            "settle_s": self.settle_s,
+            "step_tolerance_hz": self.step_tolerance_hz,
+        }
+
+    def _step_starts(self, df: pd.DataFrame) -> np.ndarray:
+        """各サンプルが新しい周波数ステップの先頭か（位置または周波数が直前のサンプルから変わったか）。"""
+        n = len(df)
+        if all(c in df.columns for c in STAGE_COLUMNS):
+            xyz = df[STAGE_COLUMNS].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+            q, _ = quantize_positions(xyz)
+        else:
+            q = np.zeros((n, 3), dtype=np.int64)
+        freq_col = next((c for c in STEP_FREQ_COLUMNS if c in df.columns), None)
+        f = pd.to_numeric(df[freq_col], errors="coerce").to_numpy(dtype=float) if freq_col else np.zeros(n)
+
+        prev_q = np.empty_like(q)
+        prev_f = np.empty_like(f)
+        prev_q[1:], prev_f[1:] = q[:-1], f[:-1]
+        first = np.zeros(n, dtype=bool)
+        if self._last_q is None:
+            first[0] = True
+            prev_q[0], prev_f[0] = q[0], f[0]
+        else:
+            prev_q[0], prev_f[0] = self._last_q, self._last_f
+        with np.errstate(invalid="ignore"):
+            f_change = np.abs(f - prev_f) > self.step_tolerance_hz
+        start = first | (q != prev_q).any(axis=1) | f_change
+        self._last_q, self._last_f = q[-1].copy(), f[-1]
+        return start
+
+    def apply(self, df: pd.DataFrame) -> GateResult:
+        """df（時刻順）の各サンプルの採否を判定する。規則の列が無い場合、その規則では除外しない。"""
+        n = len(df)
+        rejected: Dict[str, np.ndarray] = {}
+        for rule in self.rules:
+            if rule.column in df.columns:
+                rejected[rule.name] = rule_rejects(df[rule.column], rule)
+            else:
+                rejected[rule.name] = np.zeros(n, dtype=bool)
+        if n == 0:
+            for name in self.rule_names[len(self.rules):]:
+                rejected[name] = np.zeros(0, dtype=bool)
+            return GateResult(np.zeros(0, dtype=bool), rejected)
+
+        t = _elapsed_seconds(df)
+        if self._t0 is None:
+            finite = np.flatnonzero(np.isfinite(t))
+            if finite.size:
+                self._t0 = float(t[finite[0]])
+        if self.ignore_initial_s > 0:
+            t0 = self._t0 if self._t0 is not None else np.nan
+            with np.errstate(invalid="ignore"):
+                rejected[INITIAL_RULE] = (t - t0) < self.ignore_initial_s
+
+        if self.settle_s > 0:
+            start = self._step_starts(df)
+            # 各サンプルが属するステップの先頭サンプルの時刻（先頭を前方へ伝播。チャンク先頭は前回の値を引き継ぐ）
+            head = np.where(start, np.arange(n), 0)
+            head = np.maximum.accumulate(head)
+            step_t = np.where(start[head], t[head], self._step_t)
+            with np.errstate(invalid="ignore"):
+                rejected[SETTLING_RULE] = (t - step_t) < self.settle_s
+            self._step_t = float(step_t[-1])
+
+        accepted = np.ones(n, dtype=bool)
+        for mask in rejected.values():
+            accepted &= ~mask
+        return GateResult(accepted, rejected)
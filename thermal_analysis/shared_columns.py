@@ -0,0 +1,128 @@
+"""
+数値列の共有メモリ配置と行範囲単位の並列処理
+
+位置ごとの処理を ProcessPoolExecutor で並列化する際、DataFrame の部分集合を
+ワーカーごとに pickle すると大きなデータを何度も転送することになる。
+ここでは必要な数値列を multiprocessing.shared_memory に一度だけ配置し、
+ワーカーには (start, stop) の行範囲を含む小さなタスクだけを渡す。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (列名, 共有メモリ名, dtype 文字列, 形状)
+ColumnSpec = List[Tuple[str, str, str, Tuple[int, ...]]]
+
+# ワーカープロセス側で attach した列（initializer で設定）
+_WORKER_COLUMNS: Optional[Dict[str, np.ndarray]] = None
+_WORKER_SHMS: List[shared_memory.SharedMemory] = []
+
+
+class SharedColumns:
+    """
+    列（1次元 numpy 配列）の dict を共有メモリにコピーして保持する。
+    with 文で使い、終了時に共有メモリを解放する。spec を attach_columns に渡すと
+    別プロセスからコピーなしで同じ配列を参照できる。
+    """
+
+    def __init__(self, columns: Mapping[str, np.ndarray]):
+        self._shms: List[shared_memory.SharedMemory] = []
+        self.spec: ColumnSpec = []
+        try:
+            for name, values in columns.items():
+                arr = np.ascontiguousarray(values)
+                if arr.dtype.hasobject:
+                    raise TypeError(f"object 配列は共有メモリに配置できません: {name}")
+                shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+                self._shms.append(shm)
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+                self.spec.append((name, shm.name, arr.dtype.str, arr.shape))
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+    def __enter__(self) -> "SharedColumns":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # 解放は作成側（SharedColumns.close）が行うため、ワーカー側では追跡しない（Python 3.13+）
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # 3.12 以前はワーカーも親と同じ resource_tracker に登録されるため、そのまま開いてよい
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_columns(spec: ColumnSpec) -> Tuple[Dict[str, np.ndarray], List[shared_memory.SharedMemory]]:
+    """SharedColumns.spec から読み取り専用の配列 dict を復元する。shm は配列を使い終えるまで保持すること。"""
+    arrays: Dict[str, np.ndarray] = {}
+    shms: List[shared_memory.SharedMemory] = []
+    for name, shm_name, dtype, shape in spec:
+        shm = _attach(shm_name)
+        shms.append(shm)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        arrays[name] = arr
+    return arrays, shms
+
+
+def _init_worker(spec: ColumnSpec, initializer: Optional[Callable[[], None]]) -> None:
+    global _WORKER_COLUMNS, _WORKER_SHMS
+    _WORKER_COLUMNS, _WORKER_SHMS = attach_columns(spec)
+    if initializer is not None:
+        initializer()
+
+
+def _run_task(fn: Callable[[Mapping[str, np.ndarray], Any], Any], task: Any) -> Any:
+    return fn(_WORKER_COLUMNS, task)
+
+
+def map_row_ranges(
+    fn: Callable[[Mapping[str, np.ndarray], Any], Any],
+    columns: Mapping[str, np.ndarray],
+    tasks: Sequence[Any],
+    workers: int = 1,
+    initializer: Optional[Callable[[], None]] = None,
+) -> List[Any]:
+    """
+    tasks の各要素について fn(columns, task) を実行し、結果を tasks と同じ順序で返す。
+
+    fn はモジュールのトップレベル関数（pickle 可能）で、task には行範囲 (start, stop) などの
+    小さな値だけを含める。workers が 2 以上の場合は columns を共有メモリに配置して
+    ProcessPoolExecutor で並列実行する。initializer は各ワーカープロセスで一度だけ呼ばれ、
+    逐次実行（呼び出し元のプロセス）では呼ばない（matplotlib.use など、プロセス全体の設定を呼び出し元に残さないため）。
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return [fn(columns, task) for task in tasks]
+
+    with SharedColumns(columns) as shared:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            initializer=_init_worker,
+            initargs=(shared.spec, initializer),
+        ) as pool:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            return list(pool.map(_run_task, [fn] * len(tasks), tasks, chunksize=chunksize))
+
+
+def contiguous_ranges(codes: np.ndarray, n_groups: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    グループコード（0..n_groups-1）の行を安定ソートし、(並べ替え順, 各グループの境界) を返す。
+    グループ g の行は order[bounds[g]:bounds[g + 1]]。
+    """
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(n_groups + 1))
+    return order, bounds
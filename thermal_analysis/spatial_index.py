@@ -0,0 +1,231 @@
+"""
+解析結果の空間インデックス
+
+AnalysisResult（results.json）の x/y/z 位置から scipy.spatial.cKDTree を作り、
+最近傍・半径・矩形（ボックス）の範囲検索と、同じ位置の再訪のまとめ（許容差による統合）を行う。
+インデックスは位置と主要な結果値の表として .npz に保存でき、次回からは results.json を
+読み直さずに木を作り直すだけで検索できる（ヘッダの extra_header に作成元の情報を記録できる）。
+results.json を書く側（pipeline.save_case）は出力先の results_stamp.json を書き直し、
+インデックスはそのトークンを比べるだけで作り直しが必要かを判定する（results.json を glob しない）。
+"""
+import json
+import os
+import uuid
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+try:
+    from . import columnar
+    from .datamodels import AnalysisResult
+    from .position_segments import merge_within_tolerance
+except ImportError:
+    import columnar
+    from datamodels import AnalysisResult
+    from position_segments import merge_within_tolerance
+
+POSITION_INDEX_FILENAME = "position_index.npz"
+# results.json を書くたびに書き直す更新トークン（位置インデックスの鮮度判定用）
+RESULTS_STAMP_FILENAME = "results_stamp.json"
+INDEX_KIND = "analysis_position_index"
+INDEX_VERSION = 1
+
+POSITION_COLUMNS = ["x_position", "y_position", "z_position"]
+# インデックスに保持する AnalysisResult の値
+VALUE_COLUMNS = [
+    "alpha_phase", "r2_phase", "alpha_amp", "r2_amp", "alpha_ratio", "thickness_um",
+    "freq_range_min", "freq_range_max",
+]
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class PositionIndex:
+    """
+    位置付きの解析結果表（id, path, POSITION_COLUMNS, VALUE_COLUMNS）に対する空間検索。
+    座標が欠損した行は表には残すが検索の対象外とする。
+    検索点は (x, y) なら xy 平面上の距離、(x, y, z) なら 3 次元の距離で扱う。
+    """
+
+    def __init__(self, table: pd.DataFrame):
+        self.table = table.reset_index(drop=True)
+        xyz = self.table[POSITION_COLUMNS].to_numpy(dtype=float)
+        self._rows = np.flatnonzero(np.isfinite(xyz).all(axis=1))
+        self._xyz = xyz[self._rows]
+        self._trees: dict = {}
+
+    @classmethod
+    def from_results(cls, results: Sequence[AnalysisResult], ids: Optional[Sequence[str]] = None,
+                     paths: Optional[Sequence[str]] = None) -> "PositionIndex":
+        return cls.from_records([vars(r) for r in results], ids, paths)
+
+    @classmethod
+    def from_records(cls, records: Sequence[dict], ids: Optional[Sequence[str]] = None,
+                     paths: Optional[Sequence[str]] = None) -> "PositionIndex":
+        """results.json の内容（dict）のリストから作る。"""
+        n = len(records)
+        data = {
+            "id": list(ids) if ids is not None else [str(r.get("filename", i)) for i, r in enumerate(records)],
+            "path": list(paths) if paths is not None else [""] * n,
+        }
+        for name in POSITION_COLUMNS + VALUE_COLUMNS:
+            data[name] = np.array([_as_float(r.get(name)) for r in records], dtype=float)
+        return cls(pd.DataFrame(data, columns=["id", "path"] + POSITION_COLUMNS + VALUE_COLUMNS))
+
+    @property
+    def n_indexed(self) -> int:
+        """検索対象（座標が揃っている）の行数。"""
+        return len(self._rows)
+
+    def _tree(self, dims: int) -> cKDTree:
+        tree = self._trees.get(dims)
+        if tree is None:
+            tree = self._trees[dims] = cKDTree(self._xyz[:, :dims])
+        return tree
+
+    def _rows_to_table(self, local: np.ndarray, distance: Optional[np.ndarray] = None) -> pd.DataFrame:
+        out = self.table.iloc[self._rows[local]].copy()
+        if distance is not None:
+            out["distance_um"] = distance
+        return out
+
+    def nearest(self, point: Sequence[float], k: int = 1) -> pd.DataFrame:
+        """point に近い順に k 件を返す（distance_um 列付き）。"""
+        point = np.asarray(point, dtype=float)
+        k = min(int(k), self.n_indexed)
+        if k <= 0:
+            return self._rows_to_table(np.zeros(0, dtype=int), np.zeros(0))
+        dist, local = self._tree(point.size).query(point, k=k)
+        return self._rows_to_table(np.atleast_1d(local), np.atleast_1d(dist))
+
+    def within_radius(self, point: Sequence[float], radius_um: float) -> pd.DataFrame:
+        """point から radius_um 以内の行を距離の昇順で返す（distance_um 列付き）。"""
+        point = np.asarray(point, dtype=float)
+        if self.n_indexed == 0:
+            return self._rows_to_table(np.zeros(0, dtype=int), np.zeros(0))
+        local = np.asarray(self._tree(point.size).query_ball_point(point, radius_um), dtype=int)
+        dist = np.linalg.norm(self._xyz[local, : point.size] - point, axis=1)
+        order = np.argsort(dist, kind="stable")
+        return self._rows_to_table(local[order], dist[order])
+
+    def in_box(self, lower: Sequence[float], upper: Sequence[float]) -> pd.DataFrame:
+        """各軸で lower <= 座標 <= upper の行を返す（2 要素なら x, y のみで判定）。"""
+        lower = np.asarray(lower, dtype=float)
+        upper = np.asarray(upper, dtype=float)
+        dims = lower.size
+        if self.n_indexed == 0:
+            return self._rows_to_table(np.zeros(0, dtype=int))
+        # 箱の外接球で候補を絞ってから各軸の範囲で判定する
+        center = (lower + upper) / 2.0
+        radius = float(np.linalg.norm(upper - lower)) / 2.0
+        local = np.sort(np.asarray(self._tree(dims).query_ball_point(center, radius), dtype=int))
+        pts = self._xyz[local, :dims]
+        inside = ((pts >= lower) & (pts <= upper)).all(axis=1)
+        return self._rows_to_table(local[inside])
+
+    def merge_visits(self, tolerance_um: float) -> pd.DataFrame:
+        """
+        各軸の差がすべて tolerance_um 以内の結果を同じ位置の再訪としてまとめる。
+        位置ごとに座標の平均、件数（n_cases）、VALUE_COLUMNS の平均と標準偏差（*_std, ddof=0）、
+        対象ケースの id（";" 区切り）を返す。位置番号は最初に現れた順。
+        """
+        labels = merge_within_tolerance(self._xyz, tolerance_um)
+        n = int(labels.max()) + 1 if len(labels) else 0
+        table = self.table.iloc[self._rows]
+        count = np.bincount(labels, minlength=n)
+        out = pd.DataFrame({"position_id": np.arange(n)})
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for axis, name in enumerate(POSITION_COLUMNS):
+                out[name] = np.bincount(labels, weights=self._xyz[:, axis], minlength=n) / count
+            out["n_cases"] = count
+            for name in VALUE_COLUMNS:
+                v = table[name].to_numpy(dtype=float)
+                ok = np.isfinite(v)
+                cnt = np.bincount(labels, weights=ok, minlength=n)
+                s1 = np.bincount(labels, weights=np.where(ok, v, 0.0), minlength=n)
+                s2 = np.bincount(labels, weights=np.where(ok, v * v, 0.0), minlength=n)
+                mean = s1 / cnt
+                out[name] = mean
+                out[f"{name}_std"] = np.sqrt(np.maximum(s2 / cnt - mean * mean, 0.0))
+        ids = table["id"].to_numpy(dtype=object)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(n + 1))
+        out["ids"] = [";".join(map(str, ids[order[bounds[i] : bounds[i + 1]]])) for i in range(n)]
+        return out
+
+    def save(self, path: str, extra_header: Optional[dict] = None) -> None:
+        header = {"kind": INDEX_KIND, "version": INDEX_VERSION}
+        header.update(extra_header or {})
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                columnar.write_npz(f, self.table, header)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def read_header(path: str) -> dict:
+        """保存したインデックスのヘッダ（save の extra_header を含む）だけを読む。"""
+        header = columnar.read_header(path)
+        if header.get("kind") != INDEX_KIND:
+            raise ValueError(f"位置インデックスではありません: {path}")
+        return header
+
+    @classmethod
+    def load(cls, path: str) -> "PositionIndex":
+        table, header = columnar.read_npz(path)
+        if header.get("kind") != INDEX_KIND:
+            raise ValueError(f"位置インデックスではありません: {path}")
+        return cls(table)
+
+
+def touch_results_stamp(output_dir: str) -> str:
+    """
+    output_dir の results_stamp.json を新しいトークンで書き直し、そのトークンを返す。
+    results.json を書き終えた後に呼ぶ（並列に呼ばれても一時ファイルの置き換えで壊れない）。
+    """
+    token = uuid.uuid4().hex
+    path = os.path.join(output_dir, RESULTS_STAMP_FILENAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"token": token}, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return token
+
+
+def read_results_stamp(target_dir: str) -> Optional[str]:
+    """target_dir の results_stamp.json のトークン（無い・読めない場合は None）。"""
+    try:
+        with open(os.path.join(target_dir, RESULTS_STAMP_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f).get("token")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def select_rows(index: PositionIndex, point: Optional[Sequence[float]] = None, radius_um: Optional[float] = None,
+                box: Optional[Tuple[Iterable[float], Iterable[float]]] = None, k: int = 1) -> pd.DataFrame:
+    """
+    検索条件に応じて PositionIndex の検索を呼び分ける。
+    box 指定時は矩形検索、point と radius_um 指定時は半径検索、point のみなら最近傍 k 件。
+    """
+    if box is not None:
+        lower, upper = box
+        return index.in_box(list(lower), list(upper))
+    if point is None:
+        raise ValueError("検索点 point または box を指定してください。")
+    if radius_um is not None:
+        return index.within_radius(point, radius_um)
+    return index.nearest(point, k=k)
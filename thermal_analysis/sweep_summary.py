@@ -0,0 +1,341 @@
+"""
+データロガー CSV の位置別周波数スイープ集約（読み込み・位置の識別・周波数クラスタ統計）
+
+freq_sweep_summary（CLI・ストリーミング・追従モード）と pipeline の両方から使う集約の本体。
+位置はステージ座標で識別し（position_segments）、位置ごとに近接周波数をクラスタにまとめて
+振幅の平均・標準偏差と位相の円周平均・円周標準偏差を求める。
+"""
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .file_parser import logger_read_options
+    from .position_segments import segment_frame
+    from .sample_gating import GateResult, SampleGate, gate_input_columns
+except ImportError:
+    from file_parser import logger_read_options
+    from position_segments import segment_frame
+    from sample_gating import GateResult, SampleGate, gate_input_columns
+
+OUTPUT_COLUMNS = ["sqrt_TW_freq", "theta", "theta_sigma", "amp", "amp_sigma"]
+SUMMARY_INPUT_COLUMNS = ["Stage_X_um", "Stage_Y_um", "Stage_Z_um", "LI_Amp", "LI_Theta_deg", "LI_RefFreq_Hz"]
+
+
+def load_logger_csv(path: str, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    data_logger CSV を読み込む。columns を指定した場合はその列だけを
+    file_parser.LOGGER_COLUMN_DTYPES の型で読み込む（存在しない列は無視）。
+    """
+    read_kwargs = logger_read_options(columns) if columns is not None else {}
+    last_err = None
+    for enc in ("utf-8-sig", "utf-8", "cp932"):
+        try:
+            return pd.read_csv(path, comment="#", encoding=enc, **read_kwargs)
+        except UnicodeDecodeError as e:
+            last_err = e
+    if last_err:
+        raise last_err
+    return pd.read_csv(path, comment="#", **read_kwargs)
+
+
+def _read_header_lines(path: str, encoding: str) -> list[str]:
+    """先頭に連続する # 行だけを読み込む（本体は読まない）。"""
+    lines: list[str] = []
+    with open(path, "r", encoding=encoding) as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            lines.append(line.rstrip("\r\n"))
+    return lines
+
+
+def extract_metadata(path: str, header_only: bool = False) -> dict:
+    """
+    #META 行を集約する。header_only=True の場合はファイル先頭の # 行ブロックのみを読む
+    （巨大ファイルのストリーミング集約用）。
+    """
+    metadata: dict = {"meta_map": {}, "meta_items": [], "raw_meta_lines": [], "input_file": os.path.abspath(path)}
+    last_err = None
+    lines = None
+    for enc in ("utf-8-sig", "utf-8", "cp932"):
+        try:
+            if header_only:
+                lines = _read_header_lines(path, enc)
+            else:
+                with open(path, "r", encoding=enc) as f:
+                    lines = f.read().splitlines()
+            break
+        except UnicodeDecodeError as e:
+            last_err = e
+    if lines is None:
+        if last_err:
+            raise last_err
+        return metadata
+
+    for line in lines:
+        if not line.startswith("#META,"):
+            continue
+        metadata["raw_meta_lines"].append(line)
+        body = line[len("#META,") :]
+        parts = [p.strip() for p in body.split(",")]
+        if len(parts) == 2:
+            section, value = parts
+            metadata["meta_map"][section] = value
+            metadata["meta_items"].append({"section": section, "value": value})
+        elif len(parts) >= 3:
+            section, key = parts[0], parts[1]
+            value = ",".join(parts[2:])
+            metadata["meta_map"].setdefault(section, {})[key] = value
+            metadata["meta_items"].append({"section": section, "key": key, "value": value})
+    return metadata
+
+
+def _circular_from_mean_vector(mean_vec: complex) -> tuple[float, float]:
+    """単位ベクトルの平均から円周平均角と円周標準偏差 sqrt(-2 ln R) を求める。"""
+    mean_angle = float(np.angle(mean_vec))
+    r = float(np.abs(mean_vec))
+    r = min(max(r, 1e-12), 1.0)
+    sigma = float(np.sqrt(-2.0 * np.log(r)))
+    if abs(sigma) < 1e-15:
+        sigma = 0.0
+    elif sigma < 0.0:
+        sigma = 0.0
+    return mean_angle, sigma
+
+
+def _segment_starts(keys: np.ndarray) -> np.ndarray:
+    """ソート済みのキー配列で、値が切り替わる（区間の先頭となる）位置を True にする。"""
+    starts = np.ones(keys.shape, dtype=bool)
+    if keys.size > 1:
+        starts[1:] = keys[1:] != keys[:-1]
+    return starts
+
+
+def _next_beyond(group: np.ndarray, values: np.ndarray, tolerance_hz: float) -> np.ndarray:
+    """
+    (group, values) で昇順に並んだ配列について、各要素 i から見て同じ group 内で
+    values > values[i] + tolerance_hz となる最初の位置を返す（無ければ group の末尾の次）。
+    データ点と問い合わせ点をまとめて lexsort し、問い合わせより前にあるデータ点数を数える。
+    """
+    n = values.size
+    keys_group = np.concatenate([group, group])
+    keys_value = np.concatenate([values, values + tolerance_hz])
+    is_query = np.concatenate([np.zeros(n, dtype=bool), np.ones(n, dtype=bool)])
+    # 同値ではデータ点を先に置く（差がちょうど tolerance_hz の点は同じクラスタ）
+    merged = np.lexsort((is_query, keys_value, keys_group))
+    data_before = np.cumsum(~is_query[merged])
+    nxt = np.empty(n, dtype=int)
+    q = is_query[merged]
+    nxt[merged[q] - n] = data_before[q]
+    return nxt
+
+
+def _exact_next(f: np.ndarray, cur: np.ndarray, cand: np.ndarray, end: np.ndarray, tolerance_hz: float) -> np.ndarray:
+    """
+    _next_beyond の候補を f[j] - f[cur] > tolerance_hz の判定（逐次版と同じ丸め）で補正する。
+    f[cur] + tolerance_hz との比較とは丸め誤差の分だけずれることがあるため、前後に数点だけ動かす。
+    """
+    cand = cand.copy()
+    while True:
+        prev = np.maximum(cand - 1, 0)
+        back = (cand - 1 > cur) & (f[prev] - f[cur] > tolerance_hz)
+        if not back.any():
+            break
+        cand[back] -= 1
+    while True:
+        here = np.minimum(cand, f.size - 1)
+        fwd = (cand < end) & ~(f[here] - f[cur] > tolerance_hz)
+        if not fwd.any():
+            break
+        cand[fwd] += 1
+    return cand
+
+
+def cluster_frequencies(segment: np.ndarray, values_hz: np.ndarray, tolerance_hz: float) -> np.ndarray:
+    """
+    区間（位置）ごとに周波数をクラスタリングし、全区間で通し番号のクラスタ ID を返す。
+
+    区間内で周波数を昇順に並べ、クラスタ先頭の値（アンカー）との差が tolerance_hz を超えた点から
+    新しいクラスタとする。ID は (区間, 周波数) の昇順に振られ、非有限値は -1。
+    まず隣接差が tolerance_hz を超える箇所で区切り（sort + diff + cumsum）、
+    幅が tolerance_hz を超えるグループだけをアンカー単位で細分する。
+    """
+    values_hz = np.asarray(values_hz, dtype=float)
+    segment = np.asarray(segment)
+    out = np.full(values_hz.shape, -1, dtype=int)
+    valid_idx = np.where(np.isfinite(values_hz))[0]
+    if valid_idx.size == 0:
+        return out
+
+    order = valid_idx[np.lexsort((values_hz[valid_idx], segment[valid_idx]))]
+    seg = segment[order]
+    f = values_hz[order]
+
+    new_group = _segment_starts(seg)
+    new_group[1:] |= np.diff(f) > tolerance_hz
+    group = np.cumsum(new_group) - 1
+    group_start = np.flatnonzero(new_group)
+    group_end = np.append(group_start[1:], f.size)
+    anchor = new_group.copy()
+
+    wide = f[group_end - 1] - f[group_start] > tolerance_hz
+    if wide.any():
+        nxt = _next_beyond(group, f, tolerance_hz)
+        cur = group_start[wide]
+        end = group_end[wide]
+        while True:
+            cur = _exact_next(f, cur, nxt[cur], end, tolerance_hz)
+            keep = cur < end
+            if not keep.any():
+                break
+            cur, end = cur[keep], end[keep]
+            anchor[cur] = True
+
+    out[order] = np.cumsum(anchor) - 1
+    return out
+
+
+def cluster_frequency(values_hz: Iterable[float], tolerance_hz: float) -> np.ndarray:
+    arr = np.asarray(list(values_hz), dtype=float)
+    return cluster_frequencies(np.zeros(arr.shape, dtype=int), arr, tolerance_hz)
+
+
+def position_coordinates(df: pd.DataFrame, codes: np.ndarray, n_positions: int) -> np.ndarray:
+    """位置コードごとのステージ座標の平均（欠損は除外）を (位置数, 3) で返す。"""
+    xyz = df[["Stage_X_um", "Stage_Y_um", "Stage_Z_um"]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    finite = np.isfinite(xyz)
+    out = np.empty((n_positions, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for axis in range(3):
+            total = np.bincount(codes, weights=np.where(finite[:, axis], xyz[:, axis], 0.0), minlength=n_positions)
+            count = np.bincount(codes, weights=finite[:, axis], minlength=n_positions)
+            out[:, axis] = total / count
+    return out
+
+
+def summarize_positions(df: pd.DataFrame, codes: np.ndarray, tolerance_hz: float) -> pd.DataFrame:
+    """
+    全位置の周波数クラスタ統計を一括計算し、1つの縦長テーブルで返す。
+
+    codes は行ごとの位置コード（0 始まりの整数）。戻り値は position_id と OUTPUT_COLUMNS を持ち、
+    (position_id, sqrt_TW_freq) の昇順に並ぶ。平均・標準偏差（ddof=0）・円周統計は
+    (位置, クラスタ) ごとに np.bincount で集計する（非有限値は除外）。
+    """
+    freq, amp, theta = summary_arrays(df)
+    return summarize_arrays(codes, freq, amp, theta, tolerance_hz)
+
+
+def summary_arrays(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """集約に使う (周波数 [Hz], 振幅, 位相 [rad]) の float 配列。"""
+    freq = pd.to_numeric(df["LI_RefFreq_Hz"], errors="coerce").to_numpy(dtype=float)
+    amp = pd.to_numeric(df["LI_Amp"], errors="coerce").to_numpy(dtype=float)
+    theta = np.deg2rad(pd.to_numeric(df["LI_Theta_deg"], errors="coerce").to_numpy(dtype=float))
+    return freq, amp, theta
+
+
+def summarize_arrays(
+    codes: np.ndarray, freq: np.ndarray, amp: np.ndarray, theta: np.ndarray, tolerance_hz: float
+) -> pd.DataFrame:
+    """summarize_positions の本体（列を配列で受け取る）。"""
+    codes = np.asarray(codes, dtype=int)
+    cid_all = cluster_frequencies(codes, freq, tolerance_hz)
+    rows = cid_all >= 0
+    cid = cid_all[rows]
+    k = int(cid.max()) + 1 if cid.size else 0
+    position_id = np.zeros(k, dtype=int)
+    position_id[cid] = codes[rows]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        freq_mean = np.bincount(cid, weights=freq[rows], minlength=k) / np.bincount(cid, minlength=k)
+
+        a_ok = np.isfinite(amp[rows])
+        a_cid, a_val = cid[a_ok], amp[rows][a_ok]
+        a_n = np.bincount(a_cid, minlength=k)
+        amp_mean = np.bincount(a_cid, weights=a_val, minlength=k) / a_n
+        d = a_val - amp_mean[a_cid]
+        amp_sigma = np.sqrt(np.bincount(a_cid, weights=d * d, minlength=k) / a_n)
+
+        t_ok = np.isfinite(theta[rows])
+        t_cid, t_val = cid[t_ok], theta[rows][t_ok]
+        t_n = np.bincount(t_cid, minlength=k)
+        mean_vec = (
+            np.bincount(t_cid, weights=np.cos(t_val), minlength=k)
+            + 1j * np.bincount(t_cid, weights=np.sin(t_val), minlength=k)
+        ) / t_n
+    theta_mean, theta_sigma = circular_from_mean_vectors(mean_vec)
+    no_theta = t_n == 0
+    theta_mean[no_theta] = np.nan
+    theta_sigma[no_theta] = np.nan
+
+    return pd.DataFrame(
+        {
+            "position_id": position_id,
+            "sqrt_TW_freq": np.sqrt(np.maximum(freq_mean, 0.0)),
+            "theta": theta_mean,
+            "theta_sigma": theta_sigma,
+            "amp": amp_mean,
+            "amp_sigma": amp_sigma,
+        }
+    )
+
+
+def circular_from_mean_vectors(mean_vec: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """_circular_from_mean_vector の配列版。"""
+    mean_angle = np.angle(mean_vec)
+    r = np.clip(np.abs(mean_vec), 1e-12, 1.0)
+    sigma = np.sqrt(-2.0 * np.log(r))
+    sigma[~(sigma >= 1e-15)] = 0.0
+    return mean_angle, sigma
+
+
+def summarize_position(df_pos: pd.DataFrame, tolerance_hz: float) -> pd.DataFrame:
+    codes = np.zeros(len(df_pos), dtype=int)
+    table = summarize_positions(df_pos, codes, tolerance_hz)
+    return table[OUTPUT_COLUMNS].reset_index(drop=True)
+
+
+def position_codes(df: pd.DataFrame, tolerance_um: Optional[float] = None) -> tuple[pd.DataFrame, np.ndarray, int]:
+    """
+    行ごとの位置コード（出現順に 0 から）を求め、(df, codes, 位置数) を返す。
+    位置はステージ座標を 1e-6 um 刻みの整数に量子化して識別し（thermal_analysis/position_segments.py）、
+    tolerance_um を指定すると各軸の差がその範囲内の位置を 1 つにまとめる。
+    座標が欠損した行も除かず、従来の文字列キーと同じく欠損した軸ごとに 1 つの位置（xnan,ynan,znan.csv 等）にする。
+    """
+    seg = segment_frame(df, tolerance_um=tolerance_um)
+    return df, seg.codes, seg.n_positions
+
+
+def summary_input_columns(gate: Optional[SampleGate] = None) -> list[str]:
+    """集約に読み込む列（gate 指定時は判定に使う状態列・時間列も含める）。"""
+    if gate is None:
+        return list(SUMMARY_INPUT_COLUMNS)
+    return list(dict.fromkeys(SUMMARY_INPUT_COLUMNS + gate_input_columns(gate.rules)))
+
+
+def _gate_frequencies(df: pd.DataFrame, result: GateResult) -> pd.DataFrame:
+    """除外サンプルの周波数を NaN にした df を返す（集約では周波数が非有限の行を使わない。座標には使う）。"""
+    df = df.copy()
+    freq = pd.to_numeric(df["LI_RefFreq_Hz"], errors="coerce").to_numpy(dtype=float)
+    df["LI_RefFreq_Hz"] = np.where(result.accepted, freq, np.nan)
+    return df
+
+
+def gated_position_codes(
+    df: pd.DataFrame, gate: Optional[SampleGate] = None, tolerance_um: Optional[float] = None
+) -> tuple[pd.DataFrame, np.ndarray, int, Optional[pd.DataFrame]]:
+    """
+    position_codes の前に gate（時刻順の全行に対して判定）で除外したサンプルを集約対象から外す。
+    戻り値は (df, codes, 位置数, 位置ごとの規則別除外数の表（gate=None なら None）)。
+    """
+    if gate is None:
+        return (*position_codes(df, tolerance_um=tolerance_um), None)
+    df = df.reset_index(drop=True)
+    gate.reset()
+    result = gate.apply(df)
+    df, codes, n_positions = position_codes(_gate_frequencies(df, result), tolerance_um=tolerance_um)
+    rows = df.index.to_numpy()
+    kept = GateResult(result.accepted[rows], {name: mask[rows] for name, mask in result.rejected.items()})
+    return df, codes, n_positions, kept.counts(codes, n_positions)
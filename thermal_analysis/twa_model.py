@@ -0,0 +1,204 @@
+"""
+有限厚みの 1 次元温度波応答モデルによる非線形フィット
+
+厚さ L の試料の表面を周波数 f で周期加熱し、裏面で温度を測る 1 次元・両面断熱のモデルでは、
+裏面温度の複素応答は kd = L * sqrt(pi * f / alpha), z = (1 + i) * kd として
+    H(f) = C * exp(i * phi0) / (z * sinh z)
+となる。kd >> 1 では log|H| ≈ -kd - log(kd) + const, arg H ≈ -kd + const となり、
+physics.calculate_alpha_from_slope の直線（傾き -L * sqrt(pi / alpha)）はこの漸近形にあたる。
+ここでは log 振幅と位相の両方をスイープ全体で同時に当てはめ、alpha・振幅の係数 C・位相オフセット phi0 を求める。
+
+log(z sinh z) は sinh z = e^z (1 - e^{-2z}) / 2 と書き直して、大きな kd でも桁あふれせず
+位相が連続（アンラップ済み）になるよう評価する。パラメータは (log alpha, log C, phi0) で、
+ヤコビアンは d/dkd log(z sinh z) = 1/kd + (1 + i) coth z から解析的に求める。
+複数位置の一括フィットでは、直前の位置の解を次の位置の初期値にする（ウォームスタート）。
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import least_squares
+
+try:
+    from . import fitting
+except ImportError:
+    import fitting
+
+DEFAULT_MAX_NFEV = 200
+
+
+@dataclass
+class ModelFitResult:
+    """
+    1 ケース分のモデルフィットの結果。
+    alpha_stderr は (log alpha) の標準誤差から伝播した値（残差の分散でスケール）。
+    rms_log_amp, rms_phase は重みを掛ける前の残差の二乗平均平方根。
+    """
+    alpha: float
+    alpha_stderr: float
+    log_scale: float
+    phase_offset: float
+    cost: float
+    rms_log_amp: float
+    rms_phase: float
+    kd_min: float
+    kd_max: float
+    n_points: int
+    nfev: int
+    njev: int
+    success: bool
+    message: str = ""
+
+    @property
+    def params(self) -> np.ndarray:
+        """least_squares のパラメータ (log alpha, log C, phi0)。ウォームスタートの初期値に使う。"""
+        return np.array([np.log(self.alpha), self.log_scale, self.phase_offset])
+
+
+def kd_values(sqrt_f: np.ndarray, alpha: float, thickness_um: float) -> np.ndarray:
+    """kd = L * sqrt(pi * f / alpha)（sqrt_f = sqrt(f) [Hz^0.5]）。"""
+    return thickness_um * 1e-6 * np.sqrt(np.pi / alpha) * np.asarray(sqrt_f, dtype=float)
+
+
+def log_response(kd: np.ndarray) -> np.ndarray:
+    """
+    g(kd) = log(z * sinh z), z = (1 + i) * kd を返す（複素数。虚部は kd について連続）。
+    モデルの log 振幅は log C - Re g、位相は phi0 - Im g。
+    """
+    kd = np.asarray(kd, dtype=float)
+    z = (1.0 + 1.0j) * kd
+    w = np.exp(-2.0 * z)  # |w| < 1（kd > 0）なので log(1 - w) は主値で連続
+    return np.log(z) + z - np.log(2.0) + np.log1p(-w)
+
+
+def log_response_derivative(kd: np.ndarray) -> np.ndarray:
+    """dg/dkd = 1/kd + (1 + i) * coth z（coth z = (1 + e^{-2z}) / (1 - e^{-2z})）。"""
+    kd = np.asarray(kd, dtype=float)
+    w = np.exp(-2.0 * (1.0 + 1.0j) * kd)
+    return 1.0 / kd + (1.0 + 1.0j) * (1.0 + w) / (1.0 - w)
+
+
+def model(sqrt_f: np.ndarray, alpha: float, log_scale: float, phase_offset: float,
+          thickness_um: float) -> Tuple[np.ndarray, np.ndarray]:
+    """モデルの (log 振幅, 位相 [rad]) を全周波数について返す。"""
+    g = log_response(kd_values(sqrt_f, alpha, thickness_um))
+    return log_scale - g.real, phase_offset - g.imag
+
+
+def _residuals(params, sqrt_f, log_amp, phase, thickness_um, sigma):
+    alpha = np.exp(params[0])
+    model_amp, model_phase = model(sqrt_f, alpha, params[1], params[2], thickness_um)
+    return np.concatenate([(model_amp - log_amp) / sigma[1], (model_phase - phase) / sigma[0]])
+
+
+def _jacobian(params, sqrt_f, log_amp, phase, thickness_um, sigma):
+    alpha = np.exp(params[0])
+    kd = kd_values(sqrt_f, alpha, thickness_um)
+    # d kd / d(log alpha) = -kd / 2 なので d(-g)/d(log alpha) = g'(kd) * kd / 2
+    dg = log_response_derivative(kd) * kd / 2.0
+    n = kd.size
+    jac = np.zeros((2 * n, 3))
+    jac[:n, 0] = dg.real / sigma[1]
+    jac[:n, 1] = 1.0 / sigma[1]
+    jac[n:, 0] = dg.imag / sigma[0]
+    jac[n:, 2] = 1.0 / sigma[0]
+    return jac
+
+
+def initial_guess(sqrt_f: np.ndarray, log_amp: np.ndarray, phase: np.ndarray, thickness_um: float) -> np.ndarray:
+    """
+    位相の sqrt(f) に対する直線の傾きから alpha を見積もり（kd >> 1 の漸近形）、
+    その alpha で log C・phi0 を残差の平均から決めた初期値 (log alpha, log C, phi0)。
+    """
+    fit = fitting.batch_linear_regression(sqrt_f, phase).fit()
+    slope = fit.slope if fit.is_valid and fit.slope != 0 else -1.0
+    alpha = np.pi * (thickness_um * 1e-6) ** 2 / slope ** 2
+    g = log_response(kd_values(sqrt_f, alpha, thickness_um))
+    return np.array([np.log(alpha), np.mean(log_amp + g.real), np.mean(phase + g.imag)])
+
+
+def fit_twa_model(
+    sqrt_f: np.ndarray,
+    amp: np.ndarray,
+    phase: np.ndarray,
+    thickness_um: float,
+    sigma: Optional[np.ndarray] = None,
+    x0: Optional[np.ndarray] = None,
+    max_nfev: int = DEFAULT_MAX_NFEV,
+) -> ModelFitResult:
+    """
+    sqrt_f = sqrt(f), 振幅, 位相 [rad]（アンラップ済み）の全点にモデルを当てはめる。
+    sigma を指定する場合は (2, n) の (位相の sigma, log 振幅の sigma) で残差を割る（相対的な重みとして扱う）。
+    x0 は (log alpha, log C, phi0) の初期値（None なら initial_guess）。
+    sigma が NaN・0 以下の点は、その目的変数の有効な sigma の最大値で置き換える（有効な sigma が無ければ等重み）。
+    有限でない点・振幅が正でない点・f <= 0 の点は使わない。
+    """
+    sqrt_f = np.asarray(sqrt_f, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_amp = np.log(np.asarray(amp, dtype=float))
+    phase = np.asarray(phase, dtype=float)
+    sig = np.ones((2, sqrt_f.size)) if sigma is None else np.asarray(sigma, dtype=float).reshape(2, -1)
+    ok = (sqrt_f > 0) & np.isfinite(sqrt_f) & np.isfinite(log_amp) & np.isfinite(phase)
+    sqrt_f, log_amp, phase = sqrt_f[ok], log_amp[ok], phase[ok]
+    n = sqrt_f.size
+    if n < 3:
+        return ModelFitResult(np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan,
+                              n, 0, 0, False, "有効な点が 3 点未満です。")
+    # 無効な sigma（NaN・0 以下）は点を捨てず、fitting の重み付き回帰と同じく有効な最大の sigma で埋める
+    sig = 1.0 / np.sqrt(fitting.sigma_weights(sig[:, ok], np.ones((2, n), dtype=bool)))
+
+    start = initial_guess(sqrt_f, log_amp, phase, thickness_um) if x0 is None else np.asarray(x0, dtype=float)
+    args = (sqrt_f, log_amp, phase, thickness_um, sig)
+    sol = least_squares(_residuals, start, jac=_jacobian, args=args, x_scale="jac", max_nfev=max_nfev)
+
+    dof = 2 * n - 3
+    resid_var = 2.0 * sol.cost / dof if dof > 0 else np.nan
+    try:
+        cov = np.linalg.pinv(sol.jac.T @ sol.jac) * resid_var
+        log_alpha_err = float(np.sqrt(cov[0, 0]))
+    except np.linalg.LinAlgError:
+        log_alpha_err = np.nan
+    alpha = float(np.exp(sol.x[0]))
+    model_amp, model_phase = model(sqrt_f, alpha, sol.x[1], sol.x[2], thickness_um)
+    kd = kd_values(sqrt_f, alpha, thickness_um)
+    return ModelFitResult(
+        alpha=alpha,
+        alpha_stderr=alpha * log_alpha_err,
+        log_scale=float(sol.x[1]),
+        phase_offset=float(sol.x[2]),
+        cost=float(sol.cost),
+        rms_log_amp=float(np.sqrt(np.mean((model_amp - log_amp) ** 2))),
+        rms_phase=float(np.sqrt(np.mean((model_phase - phase) ** 2))),
+        kd_min=float(kd.min()),
+        kd_max=float(kd.max()),
+        n_points=n,
+        nfev=int(sol.nfev),
+        njev=int(sol.njev or 0),
+        success=bool(sol.success),
+        message=str(sol.message),
+    )
+
+
+def fit_twa_model_batch(
+    cases: Sequence[Tuple[np.ndarray, np.ndarray, np.ndarray, float, Optional[np.ndarray]]],
+    warm_start: bool = True,
+    max_nfev: int = DEFAULT_MAX_NFEV,
+) -> List[ModelFitResult]:
+    """
+    ケース (sqrt_f, 振幅, 位相, 厚み [um], sigma または None) を並び順に fit_twa_model する。
+    warm_start=True なら直前に収束したケースの解を初期値にする（z スキャンなど隣の位置で alpha・オフセットが
+    近い場合に反復回数が減る）。ウォームスタートで収束しなかったケースは initial_guess からやり直す。
+    """
+    results: List[ModelFitResult] = []
+    previous: Optional[np.ndarray] = None
+    for sqrt_f, amp, phase, thickness_um, sigma in cases:
+        result = fit_twa_model(sqrt_f, amp, phase, thickness_um, sigma, x0=previous, max_nfev=max_nfev)
+        if previous is not None and not result.success:
+            cold = fit_twa_model(sqrt_f, amp, phase, thickness_um, sigma, max_nfev=max_nfev)
+            cold.nfev += result.nfev
+            cold.njev += result.njev
+            result = cold
+        results.append(result)
+        if warm_start and result.success and np.isfinite(result.params).all():
+            previous = result.params
+    return results
@@ -0,0 +1,178 @@
+"""
+データロガー CSV の RAW_Unmapped 列（JSON 文字列）の遅延デコード
+
+RAW_Unmapped はロガーが列に割り当てなかった値を行ごとに JSON で持つ列で、通常の解析では使わない。
+file_parser はこの列を読み込まず、必要になったときだけ UnmappedFields で取り出す。
+初回アクセス時にデータ行の行頭バイトオフセットだけを求めておき、要求された行範囲を含む
+ブロック（BLOCK_ROWS 行）のバイト列だけを CSV として読み、JSON をデコードする。
+ロガーの JSON は行ごとにほぼ同じ文字列が続くため、ブロック内で一意な文字列だけをデコードし、
+結果はブロック単位で LRU キャッシュする。
+前提: データ行は 1 行 = 1 レコード（引用符内に改行を含まない）。
+"""
+import csv
+import io
+import json
+import mmap
+import os
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+UNMAPPED_COLUMN = "RAW_Unmapped"
+BLOCK_ROWS = 4096
+CACHE_BLOCKS = 32
+
+_ENCODINGS = ("utf-8-sig", "utf-8", "cp932")
+
+
+def _decode_json(text) -> dict:
+    if not isinstance(text, str) or not text:
+        return {}
+    try:
+        value = _json_loads(text)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _block_range(start: int, stop: int) -> range:
+    """行範囲 [start, stop) を含むブロック番号。"""
+    if stop <= start:
+        return range(0)
+    return range(start // BLOCK_ROWS, (stop - 1) // BLOCK_ROWS + 1)
+
+
+class UnmappedFields:
+    """
+    1 つのロガー CSV の RAW_Unmapped 列へのアクセサ。行番号は file_parser が読み込む DataFrame の行と一致する。
+    ファイルが変更された場合（サイズ・更新時刻）は行オフセットとキャッシュを作り直す。
+    """
+
+    def __init__(self, filepath: str, column: str = UNMAPPED_COLUMN, cache_blocks: int = CACHE_BLOCKS):
+        self.filepath = filepath
+        self.column = column
+        self.cache_blocks = cache_blocks
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._names: List[str] = []
+        self._encoding = "utf-8"
+        self._blocks: "OrderedDict[int, Tuple[np.ndarray, List[dict]]]" = OrderedDict()
+
+    def _build_index(self) -> None:
+        st = os.stat(self.filepath)
+        stamp = (st.st_size, st.st_mtime_ns)
+        if self._stamp == stamp and self._offsets is not None:
+            return
+        with open(self.filepath, "rb") as f:
+            data = f.read()
+        buf = np.frombuffer(data, dtype=np.uint8)
+        starts = np.concatenate([[0], np.flatnonzero(buf == ord("\n")) + 1])
+        starts = starts[starts < len(data)]
+        # 先頭の # 行（#META ブロック）の次の行が列名、以降の # 行・空行はデータ行ではない
+        first = buf[starts]
+        skip = (first == ord("#")) | (first == ord("\n")) | (first == ord("\r"))
+        if len(data) >= 3 and data[:3] == b"\xef\xbb\xbf":
+            skip[0] = data[3:4] == b"#"
+        lines = np.flatnonzero(~skip)
+        if len(lines) == 0:
+            raise ValueError(f"列名の行が見つかりません: {self.filepath}")
+        header_start = int(starts[lines[0]])
+        header_end = data.find(b"\n", header_start)
+        header = data[header_start : header_end if header_end >= 0 else len(data)]
+        for enc in _ENCODINGS:
+            try:
+                header_text = header.decode(enc)
+            except UnicodeDecodeError:
+                continue
+            self._encoding = "utf-8" if enc == "utf-8-sig" else enc
+            break
+        else:
+            raise UnicodeDecodeError("unknown", header, 0, len(header), "列名の行をデコードできません")
+        self._names = [c.strip() for c in next(csv.reader([header_text.lstrip("\ufeff")]))]
+        if self.column not in self._names:
+            raise KeyError(f"列が見つかりません: {self.column}")
+        # 行オフセット（データ行の開始位置と、末尾の番兵としてファイルサイズ）
+        row_starts = starts[lines[1:]].astype(np.int64)
+        self._offsets = np.append(row_starts, len(data))
+        self._stamp = stamp
+        self._blocks.clear()
+
+    @property
+    def n_rows(self) -> int:
+        self._build_index()
+        return len(self._offsets) - 1
+
+    def _read_strings(self, start: int, stop: int) -> np.ndarray:
+        """データ行 [start, stop) の RAW_Unmapped 文字列を読む（該当バイト範囲だけを読む）。"""
+        lo, hi = int(self._offsets[start]), int(self._offsets[stop])
+        with open(self.filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            chunk = mm[lo:hi]
+        df = pd.read_csv(
+            io.BytesIO(chunk),
+            header=None,
+            names=self._names,
+            usecols=[self.column],
+            dtype={self.column: "object"},
+            comment="#",
+            encoding=self._encoding,
+        )
+        return df[self.column].to_numpy(dtype=object)
+
+    def _block(self, block: int) -> Tuple[np.ndarray, List[dict]]:
+        """ブロックの (行ごとの一意文字列コード, 一意文字列ごとのデコード結果)。LRU キャッシュ。"""
+        cached = self._blocks.get(block)
+        if cached is not None:
+            self._blocks.move_to_end(block)
+            return cached
+        start = block * BLOCK_ROWS
+        stop = min(start + BLOCK_ROWS, self.n_rows)
+        codes, uniques = pd.factorize(self._read_strings(start, stop), use_na_sentinel=False)
+        decoded = (codes, [_decode_json(text) for text in uniques])
+        self._blocks[block] = decoded
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return decoded
+
+    def get(self, keys: Sequence[str], rows: Optional[slice] = None) -> pd.DataFrame:
+        """
+        行範囲 rows（既定: 全行）について、JSON のキー keys の値を列とする DataFrame を返す。
+        index は行番号。キーが無い行は欠損値。
+        """
+        self._build_index()
+        start, stop, step = (rows or slice(None)).indices(self.n_rows)
+        if step != 1:
+            raise ValueError("rows には step 1 の slice を指定してください。")
+        keys = list(keys)
+        values = {key: [] for key in keys}
+        for block in _block_range(start, stop):
+            codes, dicts = self._block(block)
+            base = block * BLOCK_ROWS
+            local = codes[max(start - base, 0) : stop - base]
+            for key in keys:
+                per_unique = np.empty(len(dicts), dtype=object)
+                per_unique[:] = [d.get(key) for d in dicts]
+                values[key].append(per_unique[local])
+        out = pd.DataFrame(
+            {key: np.concatenate(parts) if parts else np.empty(0, dtype=object) for key, parts in values.items()},
+            index=pd.RangeIndex(start, stop),
+        )
+        return out.infer_objects()
+
+    def keys(self, rows: Optional[slice] = None) -> List[str]:
+        """行範囲に現れる JSON のキー（出現順）。"""
+        self._build_index()
+        start, stop, _ = (rows or slice(None)).indices(self.n_rows)
+        seen: dict = {}
+        for block in _block_range(start, stop):
+            for d in self._block(block)[1]:
+                seen.update(dict.fromkeys(d))
+        return list(seen)
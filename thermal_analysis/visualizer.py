@@ -1,7 +1,8 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 import matplotlib.ticker as ticker
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from typing import Optional, List
 from .datamodels import RawData, AnalysisResult
 
@@ -66,8 +67,11 @@ def _generic_plot_and_save(
     【汎用プロッター】
     プロットデータ、使用した点の情報、ラベル等を受け取り、グラフを描画・保存する。
     Used Dataや近似直線の情報が無い場合は、自動的にそれらを省略して描画する。
+    pyplot を介さず Agg のキャンバスに直接描画するため、呼び出し元のバックエンドや GUI には影響しない。
     """
-    fig, ax = plt.subplots(figsize=(10, 7))
+    fig = Figure(figsize=(10, 7))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     
     # 1. 全データプロット (背景として薄く表示)
     # マーカー形状は共通で統一 (例えば丸など)
@@ -110,8 +114,7 @@ def _generic_plot_and_save(
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
         
-    plt.savefig(output_path, dpi=100, bbox_inches='tight')
-    plt.close(fig)
+    fig.savefig(output_path, dpi=100, bbox_inches='tight')
     print(f"Saved Plot: {output_path}")
 
 